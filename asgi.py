@@ -0,0 +1,27 @@
+import os
+from modules.Asgi import AsgiApp
+from flask_app import app, process_input_async
+
+# --------------------------------
+# ASGI app
+# --------------------------------
+# Serves the Flask app with an ASGI server, e.g.
+#   uvicorn asgi:application --workers 2
+# The final /conversation turn awaits the Google requests on the event
+# loop, all other endpoints run in ASGI_THREADS worker threads.
+# --------------------------------
+
+
+async def close_transport():
+    """Close the Google Places connections of the async requests"""
+    conversation = app.extensions.get('conversation')
+    if conversation is not None and conversation._recommend is not None:  # Not loaded just to close it
+        await conversation.recommend.rating_api.transport.aclose()
+
+
+application = AsgiApp(
+    app,
+    async_views={'api.process_input': process_input_async},
+    threads=int(os.getenv('ASGI_THREADS', 32)),
+    on_shutdown=[close_transport]
+)
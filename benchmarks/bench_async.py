@@ -0,0 +1,158 @@
+import os
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from werkzeug.serving import BaseWSGIServer
+from models.db import db
+from modules.Asgi import AsgiApp
+from flask_app import create_app, get_conversation, process_input_async
+from benchmarks.bench_load import SCRIPTS, summarise
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Async Benchmark
+# ------------------------------------------
+# Brings many users to the last question of a conversation, then sends
+# all their final turns at once, against a stub Google Places with a
+# high latency. Compares a WSGI server with a fixed number of worker
+# threads (like gunicorn --threads) with uvicorn serving the ASGI app
+# with the same number of threads, where the final turns wait for
+# Google on the event loop. Checks that both serve the same
+# recommendations.
+#
+#   python -m benchmarks.bench_async --users 200 --threads 8 --latency 0.25
+# ------------------------------------------
+SCRIPT = [text.format(cuisine='italian', location='in the city') for text in SCRIPTS['relaxed']]
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """A werkzeug server handling requests in a fixed pool of threads"""
+
+    def __init__(self, app, threads: int):
+        super().__init__('127.0.0.1', 0, app)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_wsgi(app, threads: int):
+    server = PooledWSGIServer(app, threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    return f'http://127.0.0.1:{server.server_port}', stop
+
+
+def serve_asgi(app, threads: int):
+    import uvicorn
+    async def close_transport():
+        await app.extensions['conversation'].recommend.rating_api.transport.aclose()
+
+    application = AsgiApp(app, async_views={'api.process_input': process_input_async}, threads=threads,
+                          on_shutdown=[close_transport])
+    server = uvicorn.Server(uvicorn.Config(application, host='127.0.0.1', port=0, log_level='warning', backlog=4096,
+                                         timeout_keep_alive=600))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return f'http://127.0.0.1:{port}', stop
+
+
+def prepare(base_url: str, user_id: str):
+    """Answer every question but the last one"""
+    session = requests.Session()
+    session.post(f'{base_url}/', json={'user_id': user_id, 'user_name': 'Bench'}).raise_for_status()
+    for text in SCRIPT[:-1]:
+        body = session.post(f'{base_url}/conversation', json={'user_id': user_id, 'text': text}).json()
+        assert 'recommendation' not in body, "the recommendation came before the last question"
+    return session
+
+
+def final_turn(session, base_url: str, user_id: str, barrier: threading.Barrier):
+    barrier.wait()
+    start = time.perf_counter()
+    response = session.post(f'{base_url}/conversation', json={'user_id': user_id, 'text': SCRIPT[-1]})
+    elapsed = time.perf_counter() - start
+    body = response.json() if response.status_code == 200 else {}
+    return elapsed, body.get('recommendation', {}).get('restaurant_name')
+
+
+def benchmark(mode: str, args, stub: StubPlaces, path: str):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    with app.app_context():
+        db.create_all()
+        get_conversation().recommend.rating_api.config['google'].update(stub.google_config())
+
+    base_url, stop = (serve_asgi if mode == 'asgi' else serve_wsgi)(app, args.threads)
+    try:
+        users = [f'{mode}-{index}' for index in range(args.users)]
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            sessions = list(pool.map(lambda user_id: prepare(base_url, user_id), users))
+
+        calls = stub.count('/textsearch/json') + stub.count('/details/json')
+        barrier = threading.Barrier(args.users)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            results = list(pool.map(lambda item: final_turn(item[1], base_url, item[0], barrier), zip(users, sessions)))
+        elapsed = time.perf_counter() - start
+        calls = stub.count('/textsearch/json') + stub.count('/details/json') - calls
+    finally:
+        stop()
+        app.extensions['recommendation_writer'].close()
+
+    latencies = [latency for latency, _ in results]
+    names = [name for _, name in results]
+    stats = summarise(latencies)
+    print(f"{mode:<6}{elapsed:>9.2f}s{len(results) / elapsed:>10.1f}/s{stats['p50_ms']:>10.0f}ms"
+          f"{stats['p95_ms']:>10.0f}ms{max(latencies) * 1000:>10.0f}ms{names.count(None):>8}{calls:>8}")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Async final turn benchmark')
+    parser.add_argument('--users', type=int, default=200, help='final turns sent at once')
+    parser.add_argument('--threads', type=int, default=8, help='worker threads of both servers')
+    parser.add_argument('--latency', type=float, default=0.25, help='stub latency per Google request in seconds')
+    parser.add_argument('--enrich', type=int, default=3, help='candidates enriched with place details')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    # Every final turn searches and looks up details at Google
+    os.environ.update(SEARCH_CACHE_TTL='0', SEARCH_CACHE_GRACE='0', PLACE_DETAILS_REFRESH_DAYS='0',
+                      RECOMMEND_ENRICH_TOP_K=str(args.enrich))
+
+    print(f"{'server':<6}{'wall':>10}{'final turns':>12}{'p50':>12}{'p95':>12}{'max':>12}{'failed':>8}{'google':>8}")
+    with StubPlaces(latency=args.latency) as stub:
+        recommendations = {}
+        for mode in ('wsgi', 'asgi'):
+            with tempfile.TemporaryDirectory() as directory:
+                recommendations[mode] = benchmark(mode, args, stub, os.path.join(directory, 'bench.db'))
+
+    assert None not in recommendations['asgi'], "some async final turns failed"
+    assert recommendations['wsgi'] == recommendations['asgi'], "the servers recommended different restaurants"
+    print("Both servers served the same recommendations")
+
+
+if __name__ == '__main__':
+    main()
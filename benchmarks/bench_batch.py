@@ -0,0 +1,125 @@
+import os
+import time
+import argparse
+import tempfile
+from models.db import db
+from modules.Metrics import metrics
+from flask_app import create_app, get_conversation
+from benchmarks.bench_load import SCRIPTS, CUISINES, LOCATIONS, WsgiTransport
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Batch Benchmark
+# ------------------------------------------
+# Replays the queued turns of many users, as sent by a client that was
+# offline, against the app on a local HTTP server: one request per turn
+# to /conversation, one /conversation/batch request per user and one
+# batch with the turns of all users interleaved. Reports the time,
+# requests and conversation state reads and writes of each, and checks
+# that all of them return the same replies.
+#
+#   python -m benchmarks.bench_batch --users 50
+# ------------------------------------------
+# Values that differ between runs
+VOLATILE = ('id', 'created_at', 'booking_time')
+
+
+def queued_turns(users: int):
+    """The turns of every user in the order they were queued, users interleaved"""
+    scripts = {
+        f'user-{index}': [
+            text.format(cuisine=CUISINES[index % len(CUISINES)], location=LOCATIONS[index % len(LOCATIONS)])
+            for text in SCRIPTS['relaxed']
+        ]
+        for index in range(users)
+    }
+    longest = max(len(script) for script in scripts.values())
+    return [
+        {'user_id': user_id, 'text': script[step]}
+        for step in range(longest)
+        for user_id, script in scripts.items()
+        if step < len(script)
+    ]
+
+
+def send_single(post, turns: list):
+    return [post('/conversation', turn) for turn in turns]
+
+
+def send_per_user(post, turns: list):
+    users = {}
+    for turn in turns:
+        users.setdefault(turn['user_id'], []).append(turn)
+    results = {user_id: post('/conversation/batch', {'turns': user_turns})['results'] for user_id, user_turns in users.items()}
+
+    # Back in the order of the turns
+    positions = {user_id: iter(user_results) for user_id, user_results in results.items()}
+    return [next(positions[turn['user_id']]) for turn in turns]
+
+
+def send_all(post, turns: list):
+    return post('/conversation/batch', {'turns': turns})['results']
+
+
+MODES = {
+    'one request per turn': (send_single, lambda turns, users: len(turns)),
+    'one batch per user': (send_per_user, lambda turns, users: users),
+    'one batch': (send_all, lambda turns, users: 1),
+}
+
+
+def stable(result: dict) -> dict:
+    recommendation = result.get('recommendation')
+    if recommendation:
+        result = {**result, 'recommendation': {key: value for key, value in recommendation.items() if key not in VOLATILE}}
+    return result
+
+
+def benchmark(send, turns: list, users: int, stub: StubPlaces, path: str):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'CONVERSATION_BATCH_MAX_TURNS': len(turns)})
+    with app.app_context():
+        db.create_all()
+        get_conversation().recommend.rating_api.config['google'].update(stub.google_config())
+
+    transport = WsgiTransport(app)
+    try:
+        post = transport.client()
+        for index in range(users):
+            post('/', {'user_id': f'user-{index}', 'user_name': 'Bench'})
+
+        metrics.phases.series.clear()
+        start = time.perf_counter()
+        results = send(post, turns)
+        elapsed = time.perf_counter() - start
+        phases = {labels[0][1]: sum(series[:-1]) for labels, series in metrics.phases.series.items()}
+    finally:
+        transport.close()
+        app.extensions['recommendation_writer'].close()
+    return elapsed, phases, [stable(result) for result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch conversation endpoint benchmark')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help='stub latency per Google request in seconds')
+    args = parser.parse_args()
+
+    turns = queued_turns(args.users)
+    print(f"{len(turns)} queued turns of {args.users} users")
+    print(f"{'':<22}{'time':>10}{'turns/s':>10}{'requests':>10}{'reads':>8}{'writes':>8}")
+
+    replies = {}
+    with StubPlaces(latency=args.latency) as stub:
+        for name, (send, requests) in MODES.items():
+            with tempfile.TemporaryDirectory() as directory:
+                elapsed, phases, replies[name] = benchmark(send, turns, args.users, stub, os.path.join(directory, 'bench.db'))
+            print(f"{name:<22}{elapsed:>9.2f}s{len(turns) / elapsed:>10.0f}{requests(turns, args.users):>10}"
+                  f"{phases.get('state_read', 0):>8}{phases.get('state_write', 0):>8}")
+
+    expected = replies['one request per turn']
+    assert all(result == expected for result in replies.values()), "the batches returned different replies"
+    print("All modes returned the same replies")
+
+
+if __name__ == '__main__':
+    main()
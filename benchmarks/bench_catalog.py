@@ -0,0 +1,141 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+from models.db import db
+from modules.Catalog import Catalog
+from flask_app import create_app, get_conversation
+from benchmarks.bench_load import SCRIPTS, CUISINES, LOCATIONS
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Catalog Benchmark
+# ------------------------------------------
+# Fills the local catalog with many search results of several cuisines
+# and locations and measures the ingestion and the searches. Then runs
+# conversations and counts the Google Places searches with and without
+# answering from the catalog first. The budget and time answers differ
+# between the scripts, so a search cache keyed on the whole query misses
+# where the catalog can still answer. The scripts of bench_load ask for a
+# diet or an atmosphere, which the stub's search results never match, so
+# these conversations search Google either way.
+#
+#   python -m benchmarks.bench_catalog --places 100000
+# ------------------------------------------
+EXTRA_TYPES = ('restaurant', 'food', 'bar', 'cafe', 'meal_takeaway', 'point_of_interest')
+REVIEWS = ('Lovely quiet place', 'Great for a romantic dinner', 'Loud but fun', 'Good vegan options', 'Friendly staff')
+
+# Conversations without a diet or atmosphere, the catalog can answer them
+CATALOG_SCRIPTS = {
+    'plain': [
+        "Hi, dinner please", "No", "no restrictions", "{cuisine}",
+        "Tomorrow at 7pm", "A couple", "Somewhere {location}", "Moderate",
+    ],
+    'plain, cheap': [
+        "Hi, lunch please", "Yes", "no restrictions", "{cuisine}",
+        "today at 1pm", "table for 4 people", "Somewhere {location}", "cheap",
+    ],
+}
+
+
+def search_results(count: int, rng: random.Random):
+    """Fake search results of 20 places of a cuisine, with the location searched for"""
+    batch = []
+    for index in range(count):
+        if not batch:
+            cuisine, location = rng.choice(CUISINES), rng.choice(LOCATIONS)
+        batch.append({
+            'place_id': f'place-{index}',
+            'name': f'{rng.choice(("Casa", "Chez", "The", "Little"))} {cuisine.title()} {index}',
+            'types': [cuisine, *rng.sample(EXTRA_TYPES, 2)],
+            'formatted_address': f'{index} High Street',
+            'rating': round(rng.uniform(3, 5), 1),
+            'user_ratings_total': rng.randrange(2000),
+            'price_level': rng.randrange(1, 5),
+            'geometry': {'location': {'lat': 51.5, 'lng': -0.1}},
+            'reviews': [{'text': text, 'rating': 4} for text in rng.sample(REVIEWS, 2)],
+        })
+        if len(batch) == 20:
+            yield batch, location
+            batch = []
+    if batch:
+        yield batch, location
+
+
+def time_catalog(args, path: str):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    catalog = Catalog(min_results=1, max_results=60)
+    rng = random.Random(args.seed)
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        batches = sum(catalog.ingest(batch, location) > 0 for batch, location in search_results(args.places, rng))
+        elapsed = time.perf_counter() - start
+        print(f"{'ingest':<32}{elapsed / batches * 1000:>9.2f}ms per search result of 20 ({args.places} places)")
+
+        for name, query in (
+            ('cuisine and location', lambda: (rng.choice(CUISINES), rng.choice(LOCATIONS))),
+            ('location only', lambda: (None, rng.choice(LOCATIONS))),
+            ('unknown cuisine', lambda: ('ethiopian', rng.choice(LOCATIONS))),
+        ):
+            queries = [query() for _ in range(args.queries)]
+            start = time.perf_counter()
+            found = sum(len(catalog.search(cuisine, location) or []) for cuisine, location in queries)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<32}{elapsed / len(queries) * 1000:>9.2f}ms per search ({found / len(queries):.0f} places)")
+    app.extensions['recommendation_writer'].close()
+
+
+def run_conversations(catalog_min_results: int, args, stub: StubPlaces, path: str):
+    os.environ['CATALOG_MIN_RESULTS'] = str(catalog_min_results)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    with app.app_context():
+        db.create_all()
+        get_conversation().recommend.rating_api.config['google'].update(stub.google_config())
+
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    scripts = {**SCRIPTS, **CATALOG_SCRIPTS}
+    searches, served, start = stub.count('/textsearch/json'), 0, time.perf_counter()
+    for user in range(args.conversations):
+        user_id = f'user-{user}'
+        script = scripts[rng.choice(list(scripts))]
+        values = {'cuisine': rng.choice(CUISINES[:args.cuisines]), 'location': rng.choice(LOCATIONS)}
+
+        client.post('/', json={'user_id': user_id, 'user_name': 'Bench'})
+        for text in script:
+            body = client.post('/conversation', json={'user_id': user_id, 'text': text.format(**values)}).get_json()
+            if 'recommendation' in body:
+                served += 1
+                break
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        stats = get_conversation().recommend.catalog.stats()
+    app.extensions['recommendation_writer'].close()
+    return stub.count('/textsearch/json') - searches, served, stats['hits'], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local catalog benchmark')
+    parser.add_argument('--places', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--cuisines', type=int, default=3, help='cuisines asked for in the conversations')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        time_catalog(args, os.path.join(directory, 'catalog.db'))
+
+    # Conversations with a stub latency like Google's
+    print(f"\n{'':<22}{'searches':>10}{'recommendations':>17}{'catalog hits':>14}{'time':>9}")
+    with StubPlaces(latency=0.1) as stub:
+        for name, catalog_min_results in (('google only', 0), ('catalog first', 10)):
+            with tempfile.TemporaryDirectory() as directory:
+                searches, served, hits, elapsed = run_conversations(catalog_min_results, args, stub, os.path.join(directory, 'bench.db'))
+            print(f"{name:<22}{searches:>10}{served:>17}{hits:>14}{elapsed:>8.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import os
+import time
+import argparse
+import requests
+from benchmarks.stub_places import StubPlaces
+from modules.RatingApi import RatingApi
+
+# ------------------------------------------
+# Place Details Fan-out Benchmark
+# ------------------------------------------
+# Compares the old sequential details lookups against the concurrent
+# fan-out in RatingApi.enrich_places, using a local stub server.
+#
+#   python -m benchmarks.bench_details_fanout --latency 0.05 --results 20
+# ------------------------------------------
+def fetch_sequential(api: RatingApi, location: str, cuisine: str):
+    """The previous implementation: one plain requests.get after another"""
+    google = api.config["google"]
+    url = f'{google["base_url"]}?query={cuisine}+restaurants+in+{location}&key={google["api_key"]}'
+    results = requests.get(url).json().get('results', [])
+    for result in results:
+        details_url = f"{google['details_url']}?place_id={result['place_id']}&fields=website,url&key={google['api_key']}"
+        details = requests.get(details_url).json().get('result', {})
+        result.update({'website_url': details.get('website', ''), 'maps_url': details.get('url', '')})
+    return results
+
+
+def timed(fn, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Place details fan-out benchmark')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub latency per request in seconds')
+    parser.add_argument('--results', type=int, default=20, help='text search results per query')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with StubPlaces(latency=args.latency, results=args.results) as stub:
+        print(f"{'mode':<24}{'wall clock':>12}{'speedup':>10}")
+
+        api = RatingApi()
+        api.config["google"].update(stub.google_config())
+        baseline = timed(lambda: fetch_sequential(api, 'the city', 'italian'), args.repeat)
+        print(f"{'sequential':<24}{baseline * 1000:>10.1f}ms{1:>9.1f}x")
+
+        for concurrency in (1, 4, 8, 16):
+            os.environ['GOOGLE_DETAILS_CONCURRENCY'] = str(concurrency)
+            api = RatingApi()
+            api.config["google"].update(stub.google_config())
+            elapsed = timed(lambda: api.enrich_places(api.search_places_uncached('the city', 'italian')), args.repeat)
+            print(f"{f'concurrent ({concurrency})':<24}{elapsed * 1000:>10.1f}ms{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from flask import Flask
+from models.db import db
+from modules.Export import Export
+from models.recommendation import Recommendation
+from benchmarks.bench_history import fill
+
+# ------------------------------------------
+# Export Benchmark
+# ------------------------------------------
+# Fills a temporary SQLite database with recommendations and compares
+# the peak Python memory of building the whole history with to_dict
+# and json.dumps against the streaming NDJSON and CSV export, for a
+# growing number of rows. The streaming peak should stay flat.
+#
+#   python -m benchmarks.bench_export
+# ------------------------------------------
+def to_dict_export():
+    recommendations = Recommendation.query.order_by(Recommendation.created_at).all()
+    return len(json.dumps([r.to_dict() for r in recommendations]))
+
+
+def streaming_export(exporter: Export, format: str):
+    return sum(len(chunk) for chunk in exporter.stream(format))
+
+
+def measure(fn):
+    """Return (seconds, peak MB) of fn"""
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export benchmark')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 50_000, 200_000])
+    args = parser.parse_args()
+
+    exporter = Export()
+    print(f"{'rows':>8}{'to_dict + json':>22}{'ndjson stream':>22}{'csv stream':>22}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.db')
+            app = Flask(__name__)
+            app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+            db.init_app(app)
+
+            with app.app_context():
+                db.create_all()
+                fill(path, rows, 100)
+
+                results = [
+                    measure(to_dict_export),
+                    measure(lambda: streaming_export(exporter, 'ndjson')),
+                    measure(lambda: streaming_export(exporter, 'csv')),
+                ]
+                print(f"{rows:>8}" + "".join(f"{elapsed:>9.2f}s {peak:>8.1f}MB  " for elapsed, peak in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import os
+import math
+import time
+import random
+import argparse
+import tempfile
+from models.db import db
+from modules.GeoIndex import GeoIndex, METRES_PER_DEGREE
+from flask_app import create_app, get_conversation
+from benchmarks.bench_load import SCRIPTS, LOCATIONS
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Geo Index Benchmark
+# ------------------------------------------
+# Fills the geo index with many restaurants around a city and checks the
+# radius and k-nearest queries against a scan of all places, and that a
+# capped index keeps the latest places, then measures them. Finally
+# runs conversations whose users share their coordinates and counts the
+# Google Places searches with and without serving nearby known restaurants.
+#
+#   python -m benchmarks.bench_geo --places 1000000
+# ------------------------------------------
+CENTER = (51.51, -0.11)  # Where the stub places are
+CUISINES = ('italian', 'chinese', 'indian')
+
+
+def random_places(count: int, rng: random.Random, spread: float = 0.3):
+    return [
+        {
+            'place_id': f'place-{index}',
+            'name': f'Restaurant {index}',
+            'geometry': {'location': {
+                'lat': CENTER[0] + rng.uniform(-spread, spread),
+                'lng': CENTER[1] + rng.uniform(-spread, spread) * 1.6,
+            }},
+        }
+        for index in range(count)
+    ]
+
+
+def scan(index: GeoIndex, lat: float, lng: float):
+    """(distance, place_id) of all places, nearest first"""
+    return sorted(
+        (index.distance(lat, lng, place_lat, place_lng), place_id)
+        for place_id, (place_lat, place_lng, _, _) in index.places.items()
+    )
+
+
+def check_and_time_queries(args, rng: random.Random):
+    places = random_places(args.places, rng)
+    index = GeoIndex()
+    start = time.perf_counter()
+    for place, cuisine in zip(places, rng.choices(CUISINES, k=len(places))):
+        index.add(place, cuisine)
+    print(f"{'build':<28}{(time.perf_counter() - start) * 1000:>10.0f}ms for {args.places} places")
+
+    queries = [(CENTER[0] + rng.uniform(-0.25, 0.25), CENTER[1] + rng.uniform(-0.4, 0.4)) for _ in range(args.queries)]
+
+    # Same places and distances as a scan of all places
+    for lat, lng in queries[:args.checks]:
+        expected = scan(index, lat, lng)
+        within = index.within(lat, lng, args.radius)
+        assert [place['place_id'] for _, place in within] == [place_id for distance, place_id in expected if distance <= args.radius]
+        nearest = index.nearest(lat, lng, args.k)
+        assert [place['place_id'] for _, place in nearest] == [place_id for _, place_id in expected[:args.k]]
+    print(f"{args.checks} queries match a scan of all places")
+
+    # A capped index keeps the places added last
+    capped = GeoIndex(max_places=len(places) // 10)
+    capped.add_all(places)
+    assert list(capped.places) == [place['place_id'] for place in places[-capped.max_places:]], "the capped index kept other places"
+    assert capped.stats()['evictions'] == len(places) - capped.max_places
+    print(f"capped at {capped.max_places} places: the latest ones are kept")
+
+    for name, query in (
+        (f'within {args.radius:.0f}m', lambda lat, lng: index.within(lat, lng, args.radius)),
+        (f'within {args.radius:.0f}m, one cuisine', lambda lat, lng: index.within(lat, lng, args.radius, cuisine='italian')),
+        (f'{args.k} nearest', lambda lat, lng: index.nearest(lat, lng, args.k)),
+        (f'{args.k} nearest, one cuisine', lambda lat, lng: index.nearest(lat, lng, args.k, cuisine='italian')),
+    ):
+        start = time.perf_counter()
+        results = sum(len(query(lat, lng)) for lat, lng in queries)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28}{elapsed / len(queries) * 1e6:>10.1f}us/query ({results / len(queries):.0f} results)")
+
+
+def run_conversations(local_min_results: int, args, stub: StubPlaces, path: str):
+    os.environ['RECOMMEND_LOCAL_MIN_RESULTS'] = str(local_min_results)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    with app.app_context():
+        db.create_all()
+        get_conversation().recommend.rating_api.config['google'].update(stub.google_config())
+
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    searches = stub.count('/textsearch/json')
+    distances, start = [], time.perf_counter()
+    for user in range(args.conversations):
+        user_id = f'user-{user}'
+        script = SCRIPTS[rng.choice(list(SCRIPTS))]
+        values = {'cuisine': rng.choice(CUISINES), 'location': rng.choice(LOCATIONS)}
+        lat, lng = CENTER[0] + rng.uniform(-0.005, 0.005), CENTER[1] + rng.uniform(-0.008, 0.008)
+
+        client.post('/', json={'user_id': user_id, 'user_name': 'Bench'})
+        for text in script:
+            body = client.post('/conversation', json={
+                'user_id': user_id, 'text': text.format(**values), 'latitude': lat, 'longitude': lng
+            }).get_json()
+            if 'recommendation' in body:
+                recommendation = body['recommendation']
+                x = (recommendation['longitude'] - lng) * math.cos(math.radians(lat))
+                distances.append(math.hypot(x, recommendation['latitude'] - lat) * METRES_PER_DEGREE)
+                break
+    elapsed = time.perf_counter() - start
+    app.extensions['recommendation_writer'].close()
+    return stub.count('/textsearch/json') - searches, len(distances), max(distances, default=0), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Geo index benchmark')
+    parser.add_argument('--places', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=20_000)
+    parser.add_argument('--checks', type=int, default=20, help='queries checked against a scan')
+    parser.add_argument('--radius', type=float, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    check_and_time_queries(args, random.Random(args.seed))
+
+    # Conversations of users near the stub places, with a stub latency like Google's
+    print(f"\n{'':<22}{'searches':>10}{'recommendations':>17}{'max distance':>14}{'time':>9}")
+    with StubPlaces(latency=0.1) as stub:
+        for name, local_min_results in (('google only', 0), ('nearby first', 10)):
+            with tempfile.TemporaryDirectory() as directory:
+                searches, served, distance, elapsed = run_conversations(local_min_results, args, stub, os.path.join(directory, 'bench.db'))
+            print(f"{name:<22}{searches:>10}{served:>17}{distance:>13.0f}m{elapsed:>8.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from flask import Flask
+from models.db import db
+from datetime import datetime, timedelta
+from models.recommendation import Recommendation
+
+# ------------------------------------------
+# Recommendation History Benchmark
+# ------------------------------------------
+# Fills a temporary SQLite database with recommendations (1M rows by
+# default) and compares loading a user's whole history without the
+# (user_id, created_at) index against the keyset paginated history
+# query with the index.
+#
+#   python -m benchmarks.bench_history --rows 1000000
+# ------------------------------------------
+def fill(path: str, rows: int, users: int):
+    """Insert rows spread over users, in batches with plain sqlite3"""
+    rng = random.Random(1)
+    start = datetime(2025, 1, 1)
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=OFF')
+    connection.execute('PRAGMA synchronous=OFF')
+
+    batch = []
+    for index in range(rows):
+        created_at = start + timedelta(seconds=index * 30)
+        batch.append((
+            f"user-{rng.randrange(users)}", "Bench", created_at.strftime('%Y-%m-%d %H:%M:%S.%f'),  # SQLAlchemy's format
+            f"Restaurant {index}", "italian", "in the city", 2, 4.5, 1200, 2, f"place-{index}",
+        ))
+        if len(batch) == 50000:
+            insert(connection, batch)
+            batch = []
+    insert(connection, batch)
+    connection.commit()
+    connection.close()
+
+
+def insert(connection, batch):
+    connection.executemany(
+        "INSERT INTO recommendation (user_id, user_name, created_at, restaurant_name, cuisine, location, "
+        "guests, rating, total_ratings, price_level, place_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        batch
+    )
+
+
+def timed(fn, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recommendation history benchmark')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            db.session.execute(db.text('DROP INDEX ix_recommendation_user_id_created_at'))
+            db.session.commit()
+
+            start = time.perf_counter()
+            fill(path, args.rows, args.users)
+            print(f"inserted {args.rows} rows for {args.users} users in {time.perf_counter() - start:.1f}s")
+
+            user_id = 'user-7'
+
+            def full_history():
+                return Recommendation.query.filter_by(user_id=user_id).order_by(Recommendation.created_at.desc()).all()
+
+            def first_page():
+                return Recommendation.history(user_id, limit=args.limit)
+
+            def third_page():
+                _, cursor = Recommendation.history(user_id, limit=args.limit)
+                _, cursor = Recommendation.history(user_id, limit=args.limit, before=cursor)
+                return Recommendation.history(user_id, limit=args.limit, before=cursor)
+
+            results = {'full history, no index': timed(full_history, args.repeat)}
+
+            db.session.execute(db.text('CREATE INDEX ix_recommendation_user_id_created_at ON recommendation (user_id, created_at)'))
+            db.session.commit()
+
+            results['full history, index'] = timed(full_history, args.repeat)
+            results[f'first page ({args.limit}), index'] = timed(first_page, args.repeat)
+            results['three pages, index'] = timed(third_page, args.repeat)
+
+            # Walking the pages must give exactly the full history
+            history = [r.id for r in full_history()]
+            paged, cursor = [], None
+            while True:
+                page, cursor = Recommendation.history(user_id, limit=args.limit, before=cursor)
+                paged.extend(r.id for r in page)
+                if not cursor:
+                    break
+            assert paged == history
+
+            print(f"history of {user_id}: {len(history)} rows, pages match the full history")
+            for name, elapsed in results.items():
+                print(f"{name:<30}{elapsed * 1000:>10.2f}ms")
+
+            plan = db.session.execute(db.text(
+                "EXPLAIN QUERY PLAN SELECT * FROM recommendation WHERE user_id = 'user-7' "
+                "AND (created_at, id) < ('2025-06-01 00:00:00', 1) ORDER BY created_at DESC, id DESC LIMIT 51"
+            )).all()
+            print("keyset plan:", "; ".join(row[-1] for row in plan))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+import requests
+from werkzeug.serving import make_server
+from models.db import db
+from flask_app import create_app, get_conversation
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Load Benchmark
+# ------------------------------------------
+# Drives scripted multi-turn conversations through / and /conversation
+# until a recommendation is served, with concurrent virtual users, once
+# through the Flask test client and once through a real WSGI server
+# (werkzeug, threaded) over HTTP. Google Places is replaced by the local
+# stub server. Reports throughput, p50/p95/p99 latency per turn and per
+# completed recommendation (the recommendation turn and the whole
+# conversation) and the time spent in each phase of the engine. The
+# report is written as JSON, --compare prints the change against an
+# earlier report.
+#
+#   python -m benchmarks.bench_load --users 8 --conversations 25 --output load.json
+#   python -m benchmarks.bench_load --compare load.json
+# ------------------------------------------
+CUISINES = ('italian', 'chinese', 'indian', 'mexican', 'japanese', 'thai', 'french')
+LOCATIONS = ('near me', 'nearby', 'in the city', 'close by')
+
+# Each script is answered turn by turn until the recommendation comes
+SCRIPTS = {
+    'relaxed': [
+        "Hi, I'm looking for a nice place to eat",
+        "A romantic dinner",
+        "Somewhere quiet and cozy",
+        "No, it's the first time",
+        "Vegetarian please",
+        "{cuisine}",
+        "Tomorrow at 7pm",
+        "A couple",
+        "Somewhere {location}",
+        "Moderate",
+    ],
+    'urgent': [
+        "I need food asap!!",
+        "no",
+        "vegan",
+        "{cuisine} food",
+        "now",
+        "two people",
+        "{location}",
+        "cheap",
+    ],
+    'chatty': [
+        "Hello! We are celebrating tonight and I'm so happy",
+        "A party with drinks",
+        "Outdoor would be lovely",
+        "Yes, I'm a regular",
+        "halal, {cuisine} and 8pm, table for four people {location}, expensive",
+        "That's all",
+    ],
+}
+
+# Engine methods timed as phases: (attribute path, method, phase)
+PHASES = (
+    ('store', 'read', 'state read'),
+    ('store', 'flush', 'state write'),
+    ('', 'analyze_urgency', 'urgency'),
+    ('', 'analyze_sentiment', 'sentiment'),
+    ('', 'check_response', 'slot extraction'),
+    ('recommend.rating_api', 'search_places', 'places search'),
+    ('recommend', 'score_restaurants', 'scoring'),
+    ('recommend', 'enrich_candidates', 'place details'),
+    ('recommend.writer', 'add', 'store recommendation'),
+)
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))]
+
+
+def summarise(values: list) -> dict:
+    """Count, mean and p50/p95/p99 of latencies in milliseconds"""
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        **{f'p{q}_ms': round(percentile(values, q) * 1000, 3) for q in (50, 95, 99)},
+    }
+
+
+class Recorder:
+    """Collects latencies and phase timings from all virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latencies = {}
+        self.phases = {}
+        self.failures = 0
+
+    def add(self, kind: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+
+    def add_phase(self, phase: str, seconds: float):
+        with self.lock:
+            self.phases.setdefault(phase, []).append(seconds)
+
+    def fail(self):
+        with self.lock:
+            self.failures += 1
+
+
+def instrument(conversation, recorder: Recorder):
+    """Time the engine phases by wrapping the methods on the instances"""
+    conversation.recommend  # Build the recommendation engine first
+
+    def timed(method, phase):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                recorder.add_phase(phase, time.perf_counter() - start)
+        return wrapper
+
+    for path, name, phase in PHASES:
+        target = conversation
+        for attribute in filter(None, path.split('.')):
+            target = getattr(target, attribute)
+        setattr(target, name, timed(getattr(target, name), phase))
+
+
+class TestClientTransport:
+    """Requests through the Flask test client, in process"""
+    name = 'test_client'
+
+    def __init__(self, app):
+        self.app = app
+
+    def client(self):
+        client = self.app.test_client()
+        return lambda path, payload: client.post(path, json=payload).get_json()
+
+    def close(self):
+        pass
+
+
+class WsgiTransport:
+    """Requests over HTTP to the app served by a threaded werkzeug server"""
+    name = 'wsgi'
+
+    def __init__(self, app):
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)  # No access log
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def client(self):
+        session = requests.Session()
+
+        def post(path, payload):
+            response = session.post(self.base_url + path, json=payload)
+            response.raise_for_status()
+            return response.json()
+        return post
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def converse(post, recorder: Recorder, user_id: str, script: list, rng: random.Random):
+    """Run one conversation, returns True if a recommendation was served"""
+    values = {'cuisine': rng.choice(CUISINES), 'location': rng.choice(LOCATIONS)}
+    begin = start = time.perf_counter()
+    post('/', {'user_id': user_id, 'user_name': 'Bench'})
+    recorder.add('start', time.perf_counter() - start)
+
+    for text in script:
+        start = time.perf_counter()
+        body = post('/conversation', {'user_id': user_id, 'text': text.format(**values)})
+        elapsed = time.perf_counter() - start
+        if 'recommendation' in body:
+            recorder.add('recommendation turn', elapsed)
+            recorder.add('conversation', time.perf_counter() - begin)
+            return True
+        recorder.add('turn', elapsed)
+    return False
+
+
+def run(transport, recorder: Recorder, users: int, conversations: int, seed: int):
+    """Every virtual user runs its conversations one after another"""
+    names = sorted(SCRIPTS)
+
+    def user(index):
+        post = transport.client()
+        rng = random.Random(seed + index)
+        for number in range(conversations):
+            script = SCRIPTS[names[(index + number) % len(names)]]
+            try:
+                if not converse(post, recorder, f'{transport.name}-{index}-{number}', script, rng):
+                    recorder.fail()
+            except Exception:
+                recorder.fail()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(index,)) for index in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def report_phases(recorder: Recorder, request_seconds: float) -> dict:
+    phases = {phase: summarise(values) for phase, values in recorder.phases.items()}
+    for phase, values in recorder.phases.items():
+        phases[phase]['total_ms'] = round(sum(values) * 1000, 3)
+        phases[phase]['share'] = round(sum(values) / request_seconds, 4) if request_seconds else 0.0
+
+    # Routing, JSON, HTTP and everything else not timed as a phase
+    other = request_seconds - sum(sum(values) for values in recorder.phases.values())
+    phases['other'] = {
+        'total_ms': round(other * 1000, 3),
+        'share': round(other / request_seconds, 4) if request_seconds else 0.0,
+    }
+    return phases
+
+
+def benchmark(transport_name: str, args, stub: StubPlaces, path: str) -> dict:
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    recorder = Recorder()
+    with app.app_context():
+        db.create_all()
+        conversation = get_conversation()
+        conversation.recommend.rating_api.config['google'].update(stub.google_config())
+        instrument(conversation, recorder)
+
+    transport = (TestClientTransport if transport_name == 'test_client' else WsgiTransport)(app)
+    calls = {path: stub.count(path) for path in ('/textsearch/json', '/details/json')}
+    try:
+        run(transport, Recorder(), 1, 1, args.seed)  # Warm up outside of the measurement
+        recorder.reset()
+        elapsed = run(transport, recorder, args.users, args.conversations, args.seed)
+    finally:
+        transport.close()
+        app.extensions['recommendation_writer'].close()
+
+    turns = [value for kind in ('start', 'turn', 'recommendation turn') for value in recorder.latencies.get(kind, [])]
+    completed = len(recorder.latencies.get('conversation', []))
+    return {
+        'seconds': round(elapsed, 3),
+        'conversations': completed,
+        'failures': recorder.failures,
+        'throughput': {
+            'requests_per_second': round(len(turns) / elapsed, 2),
+            'recommendations_per_second': round(completed / elapsed, 2),
+        },
+        'latency': {
+            'request': summarise(turns),
+            **{kind: summarise(values) for kind, values in sorted(recorder.latencies.items())},
+        },
+        'phases': report_phases(recorder, sum(turns)),
+        'google_requests': {path: stub.count(path) - count for path, count in calls.items()},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict, baseline: dict = None):
+    for name, result in report['transports'].items():
+        before = (baseline or {}).get('transports', {}).get(name)
+        print(f"\n{name}: {result['conversations']} recommendations in {result['seconds']}s, "
+              f"{result['throughput']['requests_per_second']} requests/s, {result['failures']} failures")
+        print(f"{'latency':<22}{'count':>8}{'p50':>11}{'p95':>11}{'p99':>11}")
+        for kind, stats in result['latency'].items():
+            line = f"{kind:<22}{stats['count']:>8}"
+            for q in ('p50_ms', 'p95_ms', 'p99_ms'):
+                line += f"{stats[q]:>9.1f}ms"
+                if before and kind in before['latency'] and before['latency'][kind][q]:
+                    line += f" ({stats[q] / before['latency'][kind][q] - 1:+.0%})"
+            print(line)
+        print(f"{'phase':<22}{'calls':>8}{'total':>11}{'share':>8}")
+        for phase, stats in sorted(result['phases'].items(), key=lambda item: -item[1]['total_ms']):
+            print(f"{phase:<22}{stats.get('count', ''):>8}{stats['total_ms']:>9.0f}ms{stats['share']:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load benchmark of the conversation API')
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--conversations', type=int, default=25, help='conversations per user')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub latency per Google request in seconds')
+    parser.add_argument('--results', type=int, default=20, help='text search results per query')
+    parser.add_argument('--transport', choices=('test_client', 'wsgi', 'both'), default='both')
+    parser.add_argument('--no-search-cache', action='store_true', help='send every search to the stub')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--compare', help='JSON report of an earlier run to compare with')
+    args = parser.parse_args()
+
+    if args.no_search_cache:
+        os.environ['SEARCH_CACHE_TTL'] = os.environ['SEARCH_CACHE_GRACE'] = '0'
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': sys.platform,
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'transports': {},
+    }
+    transports = ('test_client', 'wsgi') if args.transport == 'both' else (args.transport,)
+    with StubPlaces(latency=args.latency, results=args.results) as stub:
+        for name in transports:
+            with tempfile.TemporaryDirectory() as directory:
+                report['transports'][name] = benchmark(name, args, stub, os.path.join(directory, 'bench.db'))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import time
+import argparse
+from modules.Metrics import Metrics
+
+# ------------------------------------------
+# Metrics Benchmark
+# ------------------------------------------
+# Measures the cost of a span around an empty block with metrics
+# enabled and disabled, of counting an outbound request, and of
+# rendering the /metrics page. For the cost on a whole conversation,
+# run bench_load with METRICS_ENABLED=false and compare.
+#
+#   python -m benchmarks.bench_metrics
+# ------------------------------------------
+PHASES = ('slot_extraction', 'sentiment', 'places_search', 'place_details', 'scoring', 'state_write')
+
+
+def per_call(fn, calls: int) -> float:
+    """Nanoseconds per call of fn"""
+    start = time.perf_counter()
+    fn(calls)
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def spans(metrics: Metrics):
+    def run(calls):
+        for index in range(calls):
+            with metrics.span(PHASES[index % len(PHASES)]):
+                pass
+    return run
+
+
+def bare(calls):
+    for index in range(calls):
+        PHASES[index % len(PHASES)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metrics benchmark')
+    parser.add_argument('--calls', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    enabled, disabled = Metrics(enabled=True), Metrics(enabled=False)
+    baseline = per_call(bare, args.calls)
+    print(f"{'span, enabled':<24}{per_call(spans(enabled), args.calls) - baseline:>8.0f}ns")
+    print(f"{'span, disabled':<24}{per_call(spans(disabled), args.calls) - baseline:>8.0f}ns")
+    print(f"{'count outbound':<24}{per_call(lambda calls: [enabled.count_outbound('details') for _ in range(calls)], args.calls):>8.0f}ns")
+
+    start = time.perf_counter()
+    page = enabled.render()
+    print(f"{'render /metrics':<24}{(time.perf_counter() - start) * 1e6:>8.0f}us ({len(page.splitlines())} lines)")
+
+
+if __name__ == '__main__':
+    main()
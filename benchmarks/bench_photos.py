@@ -0,0 +1,183 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from models.db import db
+from flask_app import create_app, get_conversation
+from benchmarks.bench_load import SCRIPTS, CUISINES, LOCATIONS, WsgiTransport
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Photo Proxy Benchmark
+# ------------------------------------------
+# The app shows a photo on every recommendation card. Loads the photos of
+# a few restaurants many times, straight from the (stub) Google photo
+# endpoint as before and through the /photos proxy of an app served by a
+# werkzeug server, and reports the Google requests and the time. Checks
+# that the proxy serves the same bytes, fetches a photo once when many
+# cards ask for it at the same moment, answers revalidations with 304,
+# stores a few widths only, answers Google errors with 502, copes with a
+# photo deleted while it is sent, keeps the cache directory under its
+# size bound, does not fetch photos the app has not linked, and that the
+# photo URL of a recommendation points to the proxy.
+#
+#   python -m benchmarks.bench_photos --loads 500
+# ------------------------------------------
+def load_photos(urls: list, workers: int):
+    """GET every URL with a pool of clients, returns the bodies"""
+    local = threading.local()
+
+    def get(url):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        response = local.session.get(url)
+        response.raise_for_status()
+        return response.content
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(get, urls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Photo proxy benchmark')
+    parser.add_argument('--loads', type=int, default=500, help='photo loads by the app')
+    parser.add_argument('--photos', type=int, default=20, help='different photos among them')
+    parser.add_argument('--callers', type=int, default=50, help='cards asking for a cold photo at once')
+    parser.add_argument('--latency', type=float, default=0.1, help='stub latency per Google request in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    references = [f'photo-{rng.randrange(args.photos)}' for _ in range(args.loads)]
+
+    with tempfile.TemporaryDirectory() as directory, StubPlaces(latency=args.latency) as stub:
+        os.environ['PHOTO_CACHE_DIR'] = os.path.join(directory, 'photos')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}"})
+        with app.app_context():
+            rating_api = get_conversation().recommend.rating_api
+            rating_api.config['google'].update(stub.google_config())
+            db.create_all()
+        # The proxy only fetches the photos of search results the app has served
+        rating_api.add_photo_urls([
+            {'photos': [{'photo_reference': reference}]}
+            for reference in sorted(set(references)) + ['photo-cold', 'photo-widths', 'photo-denied']
+        ])
+        photo_cache = app.extensions['photo_cache']
+        server = WsgiTransport(app)
+
+        print(f"{args.loads} photo loads of {args.photos} photos")
+        print(f"{'':<22}{'google':>8}{'time':>9}")
+        bodies = {}
+        for name, url in (
+            ('google directly', rating_api.photo_upstream_url),
+            ('proxy', lambda reference: server.base_url + rating_api.get_photo_url(reference)),
+            ('proxy, all cached', lambda reference: server.base_url + rating_api.get_photo_url(reference)),
+        ):
+            before = stub.count('/photo')
+            start = time.perf_counter()
+            bodies[name] = load_photos([url(reference) for reference in references], workers=8)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<22}{stub.count('/photo') - before:>8}{elapsed:>8.2f}s")
+        assert bodies['proxy'] == bodies['proxy, all cached'] == bodies['google directly'], "the proxy served different photos"
+        assert photo_cache.stats()['fetches'] == len(set(references)), "a photo was fetched more than once"
+
+        # Many cards showing the same new photo at once
+        before = stub.count('/photo')
+        url = server.base_url + rating_api.get_photo_url('photo-cold', maxwidth=800)
+        start = time.perf_counter()
+        cold = load_photos([url] * args.callers, workers=args.callers)
+        elapsed = time.perf_counter() - start
+        fetched = stub.count('/photo') - before
+        print(f"\n{args.callers} cards asking for a cold photo at once: {fetched} Google request, {elapsed:.2f}s")
+        assert fetched == 1 and len(set(cold)) == 1, "the cold photo was fetched more than once"
+
+        # Revalidation of a cached photo
+        first = requests.get(url)
+        again = requests.get(url, headers={'If-None-Match': first.headers['ETag']})
+        print(f"Revalidation: {again.status_code}, Cache-Control: {first.headers['Cache-Control']}, ETag: {first.headers['ETag'][:14]}...")
+        assert again.status_code == 304 and not again.content and 'immutable' in first.headers['Cache-Control']
+        assert requests.get(server.base_url + rating_api.get_photo_url('unknown')).status_code == 404
+
+        # A photo the app has not linked is not fetched with its API key
+        before = stub.count('/photo')
+        status = requests.get(server.base_url + rating_api.get_photo_url('photo-unlinked')).status_code
+        print(f"Photo not linked by the app: {status}, {stub.count('/photo') - before} Google requests")
+        assert status == 404 and stub.count('/photo') == before, "a photo that was not linked was fetched"
+
+        # Widths are rounded up to the stored ones, a reference is fetched once per width
+        before = stub.count('/photo')
+        widths = [1, 100, 150, 200, 650, 800, 1600]
+        for width in widths:
+            assert requests.get(f"{server.base_url}/photos/photo-widths?maxwidth={width}").status_code == 200
+        fetched = stub.count('/photo') - before
+        print(f"Widths {widths}: {fetched} Google requests")
+        assert fetched == 4, "the widths were not rounded to the stored ones"
+
+        # Google errors other than an unknown photo are not a 404
+        stub.status = 403
+        status = requests.get(server.base_url + rating_api.get_photo_url('photo-denied')).status_code
+        stub.status = 200
+        print(f"Google answers 403: {status}")
+        assert status == 502, "a Google error was answered with a 404"
+
+        # The sweeper deletes the photo between the lookup and sending it
+        lookup = photo_cache.lookup
+        deleted = []
+
+        def lookup_then_sweep(key):
+            photo = lookup(key)
+            if photo is not None and not deleted:
+                os.unlink(photo.path)
+                deleted.append(photo.path)
+            return photo
+
+        photo_cache.lookup = lookup_then_sweep
+        response = requests.get(url)
+        photo_cache.lookup = lookup
+        print(f"Photo deleted while sent: {response.status_code}")
+        assert deleted and response.status_code == 200 and response.content == cold[0], "a deleted photo was not fetched again"
+
+        # Keep the cache directory under half its size
+        photo_cache.sweep()
+        size = photo_cache.stats()['bytes']
+        photo_cache.max_bytes = size // 2
+        deleted = photo_cache.sweep()
+        stats = photo_cache.stats()
+        print(f"Sweep to {photo_cache.max_bytes} bytes: {deleted} photos deleted, {size} -> {stats['bytes']} bytes")
+        assert stats['bytes'] <= photo_cache.max_bytes and deleted > 0, "the sweeper did not keep the size bound"
+        # Deleted photos are fetched again, with room for them
+        photo_cache.max_bytes = size
+        loaded = sorted(set(references))
+        missing = sum(photo_cache.lookup(photo_cache.ref_key(reference, 400)) is None for reference in loaded)
+        before = stub.count('/photo')
+        reloaded = load_photos([server.base_url + rating_api.get_photo_url(reference) for reference in loaded], workers=8)
+        fetched = stub.count('/photo') - before
+        print(f"Loading all photos again: {fetched} Google requests for the {missing} deleted ones")
+        assert fetched == missing, "deleted photos were not fetched again"
+        assert reloaded == load_photos(map(rating_api.photo_upstream_url, loaded), workers=8), "the proxy served different photos"
+
+        # The recommendation card links the proxy
+        client, values = app.test_client(), {'cuisine': rng.choice(CUISINES), 'location': rng.choice(LOCATIONS)}
+        client.post('/', json={'user_id': 'photo-user', 'user_name': 'Bench'})
+        for text in SCRIPTS['relaxed']:
+            body = client.post('/conversation', json={'user_id': 'photo-user', 'text': text.format(**values)}).get_json()
+            if 'recommendation' in body:
+                break
+        photo_url = body['recommendation']['photo_url']
+        response = client.get(photo_url)
+        print(f"Recommendation photo_url: {photo_url} -> {response.status_code} {response.mimetype}")
+        assert photo_url.startswith('/photos/') and 'key=' not in photo_url and response.status_code == 200
+        response.close()
+
+        server.close()
+        photo_cache.close()
+        app.extensions['recommendation_writer'].close()
+    print("\nAll checks passed")
+
+
+if __name__ == '__main__':
+    main()
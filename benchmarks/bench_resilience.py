@@ -0,0 +1,199 @@
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from models.db import db
+from modules.RatingApi import RatingApi
+from modules.Resilience import ResilientTransport
+from modules.Transport import create_transport
+from flask_app import create_app, get_conversation
+from benchmarks.bench_load import SCRIPTS, CUISINES, LOCATIONS
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Resilience Benchmark
+# ------------------------------------------
+# Points the RatingApi at a stub Google Places server that misbehaves and
+# checks how it copes:
+# - hung upstream: the stub never answers in time, the read timeout cuts
+#   the requests off (sync and async)
+# - tail latency: every slow_every-th response is slow, the latency
+#   percentiles of sequential requests with and without hedging
+# - outage: the stub answers with 500s, the circuit breaker opens after a
+#   few failures, searches are served from the expired search cache and
+#   fail fast, then the breaker closes again after one trial request
+# - conversations during the outage still get a recommendation, from
+#   the local catalog of earlier search results
+#
+#   python -m benchmarks.bench_resilience --requests 300
+# ------------------------------------------
+QUERY = ('in the city', 'italian')
+
+
+def make_api(stub: StubPlaces, timeout=(1.0, 0.5), **resilience):
+    api = RatingApi()
+    api.config['google'].update(stub.google_config())
+    api.transport = ResilientTransport(create_transport(api.session, timeout=timeout), **resilience)
+    return api
+
+
+def percentile(samples: list, fraction: float):
+    samples = sorted(samples)
+    return samples[int(fraction * (len(samples) - 1))]
+
+
+def hung_upstream():
+    print("Hung upstream (read timeout 0.5s)")
+    with StubPlaces(latency=30) as stub:
+        api = make_api(stub, breaker_failures=0)
+
+        start = time.perf_counter()
+        results = api.search_places(*QUERY)
+        details = api.fetch_place_details_uncached('place-1')
+        elapsed = time.perf_counter() - start
+        print(f"  {'sync search + details':<26}{elapsed:>8.2f}s")
+        assert results == [] and details is None and elapsed < 3, "a hung request was not cut off"
+
+        async def main():
+            try:
+                return await asyncio.gather(api.search_places_async('nearby', 'thai'), api.fetch_place_details_uncached_async('place-2'))
+            finally:
+                await api.transport.aclose()
+
+        start = time.perf_counter()
+        results, details = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+        print(f"  {'async search + details':<26}{elapsed:>8.2f}s")
+        assert results == [] and details is None and elapsed < 3, "a hung async request was not cut off"
+
+
+def tail_latency(args):
+    print(f"\nTail latency ({args.requests} requests, 1 in {args.slow_every} takes {args.slow_latency}s)")
+    print(f"  {'':<24}{'p50':>9}{'p99':>9}{'max':>9}{'hedged':>8}{'won':>6}")
+    p99 = {}
+    with StubPlaces(latency=args.latency, slow_every=args.slow_every, slow_latency=args.slow_latency) as stub:
+        for mode in ('sync', 'async'):
+            for hedge in (False, True):
+                api = make_api(stub, timeout=(1.0, 5.0), hedge=hedge)
+                place_ids = [f'{mode}-{hedge}-{index}' for index in range(args.requests)]
+                if mode == 'sync':
+                    latencies = []
+                    for place_id in place_ids:
+                        start = time.perf_counter()
+                        assert api.fetch_place_details_uncached(place_id) is not None
+                        latencies.append(time.perf_counter() - start)
+                else:
+                    async def main():
+                        latencies = []
+                        for place_id in place_ids:
+                            start = time.perf_counter()
+                            assert await api.fetch_place_details_uncached_async(place_id) is not None
+                            latencies.append(time.perf_counter() - start)
+                        await api.transport.aclose()
+                        return latencies
+
+                    latencies = asyncio.run(main())
+
+                stats = api.transport.stats()
+                p99[mode, hedge] = percentile(latencies, 0.99)
+                name = f"{mode}, {'hedged' if hedge else 'single request'}"
+                print(f"  {name:<24}{percentile(latencies, 0.5) * 1000:>7.0f}ms{p99[mode, hedge] * 1000:>7.0f}ms"
+                      f"{max(latencies) * 1000:>7.0f}ms{stats['hedged']:>8}{stats['hedge_wins']:>6}")
+
+    for mode in ('sync', 'async'):
+        assert p99[mode, True] < p99[mode, False], f"hedging did not cut the {mode} tail latency"
+
+
+def outage(args):
+    print(f"\nOutage (breaker opens after {args.breaker_failures} failures, retried after {args.breaker_reset}s)")
+    with StubPlaces(latency=args.latency) as stub:
+        api = make_api(stub, breaker_failures=args.breaker_failures, breaker_reset=args.breaker_reset)
+        api.search_cache.ttl, api.search_cache.grace = 0.01, 0
+        healthy = api.search_places(*QUERY)
+        assert healthy, "the healthy stub returned no results"
+        time.sleep(0.05)  # Let the cache entry expire
+
+        stub.status = 500
+        sent = stub.count('/textsearch/json')
+        start = time.perf_counter()
+        results = [api.search_places(*QUERY) for _ in range(args.searches)]
+        elapsed = time.perf_counter() - start
+        sent = stub.count('/textsearch/json') - sent
+        breaker = api.transport.stats()['endpoints']['textsearch']
+        print(f"  {args.searches} searches: {sent} sent, {breaker['rejected']} failed fast, {elapsed:.2f}s, breaker {breaker['state']}")
+        print(f"  served from the expired cache: {api.search_cache.stats()['fallbacks']}")
+        assert all(result == healthy for result in results), "searches were not served from the expired cache"
+        assert sent == args.breaker_failures and breaker['state'] == 'open', "the breaker did not open"
+        assert api.search_places('nearby', 'thai') == [], "an uncached search did not fail"
+
+        stub.status = 200
+        time.sleep(args.breaker_reset)
+        sent = stub.count('/textsearch/json')
+        recovered = api.search_places('nearby', 'thai')
+        breaker = api.transport.stats()['endpoints']['textsearch']
+        print(f"  after {args.breaker_reset}s: {stub.count('/textsearch/json') - sent} trial request, breaker {breaker['state']}")
+        assert recovered and breaker['state'] == 'closed', "the breaker did not close again"
+
+
+def conversation(client, user_id: str, rng: random.Random):
+    script = SCRIPTS[rng.choice(list(SCRIPTS))]
+    values = {'cuisine': rng.choice(CUISINES[:2]), 'location': rng.choice(LOCATIONS)}
+    client.post('/', json={'user_id': user_id, 'user_name': 'Bench'})
+    for text in script:
+        body = client.post('/conversation', json={'user_id': user_id, 'text': text.format(**values)}).get_json()
+        if 'recommendation' in body:
+            return body['recommendation']
+    return None
+
+
+def outage_conversations(args, path: str):
+    print(f"\nConversations during an outage ({args.conversations} before, {args.conversations} during)")
+    # Always ask Google, so the catalog is only used as the fallback
+    os.environ['CATALOG_MIN_RESULTS'] = '0'
+    os.environ['SEARCH_CACHE_TTL'] = '0'
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    with StubPlaces(latency=args.latency) as stub:
+        with app.app_context():
+            # The conversation modules are imported lazily, with the catalog models
+            get_conversation().recommend.rating_api.config['google'].update(stub.google_config())
+            db.create_all()
+
+        client = app.test_client()
+        served = {}
+        for phase in ('healthy', 'outage'):
+            rng = random.Random(args.seed)  # The same questions in both phases
+            stub.status = 200 if phase == 'healthy' else 500
+            served[phase] = sum(conversation(client, f'{phase}-{user}', rng) is not None for user in range(args.conversations))
+
+        with app.app_context():
+            fallbacks = get_conversation().recommend.catalog.stats()['fallbacks']
+    app.extensions['recommendation_writer'].close()
+    print(f"  recommendations: {served['healthy']} healthy, {served['outage']} during the outage ({fallbacks} from the catalog)")
+    assert served['outage'] == served['healthy'] and fallbacks > 0, "conversations failed during the outage"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resilience benchmark')
+    parser.add_argument('--requests', type=int, default=300, help='sequential requests per tail latency run')
+    parser.add_argument('--latency', type=float, default=0.02, help='usual stub latency in seconds')
+    parser.add_argument('--slow-every', type=int, default=40, help='every n-th stub response is slow')
+    parser.add_argument('--slow-latency', type=float, default=0.5, help='latency of the slow responses in seconds')
+    parser.add_argument('--searches', type=int, default=50, help='searches during the outage')
+    parser.add_argument('--breaker-failures', type=int, default=5)
+    parser.add_argument('--breaker-reset', type=float, default=1.0)
+    parser.add_argument('--conversations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    hung_upstream()
+    tail_latency(args)
+    outage(args)
+    with tempfile.TemporaryDirectory() as directory:
+        outage_conversations(args, os.path.join(directory, 'bench.db'))
+    print("\nAll scenarios passed")
+
+
+if __name__ == '__main__':
+    main()
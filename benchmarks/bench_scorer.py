@@ -0,0 +1,137 @@
+import time
+import random
+import argparse
+from datetime import datetime
+from modules.Scorer import Scorer, CandidatePool
+
+# ------------------------------------------
+# Scorer Benchmark
+# ------------------------------------------
+# Checks that the vectorised Scorer produces the same scores and ranking
+# as the previous per-restaurant scoring loop, then compares both on
+# growing candidate pools.
+#
+#   python -m benchmarks.bench_scorer
+# ------------------------------------------
+CUISINES = ['italian', 'chinese', 'indian', 'mexican', 'japanese', 'thai', 'french']
+TAGS = ['restaurant', 'food', 'bar', 'cafe', 'meal_takeaway', 'vegetarian_restaurant', 'Vegan', 'halal_food', 'kosher']
+WORDS = ['great', 'quiet', 'cozy', 'loud', 'warm', 'friendly', 'Bright', 'dim', 'outdoor', 'slow', 'tasty']
+
+
+def legacy_score(restaurants: list, preferences: dict):
+    """The previous scoring loop of Recommend.get_recommendation"""
+    cuisine, dietary, atmosphere = preferences['cuisine'], preferences['dietary'], preferences['atmosphere']
+    budget, time_ = preferences['budget'], preferences['time']
+
+    scored_restaurants = []
+    for restaurant in restaurants:
+        score = 0
+        if cuisine and cuisine.lower() in restaurant.get('types', []):
+            score += 2
+        if dietary:
+            if any(dietary.lower() in tag.lower() for tag in restaurant.get('types', [])):
+                score += 3
+            elif dietary.lower() in restaurant.get('name', '').lower():
+                score += 2
+        if atmosphere:
+            if any(atmosphere.lower() in review.get('text', '').lower()
+                   for review in restaurant.get('reviews', [])):
+                score += 1
+        price_level = restaurant.get('price_level', 2)
+        if budget:
+            budget_map = {'cheap': 1, 'moderate': 2, 'expensive': 3}
+            if price_level == budget_map.get(budget.lower(), 2):
+                score += 2
+        rating = restaurant.get('rating', 0)
+        score += rating / 2
+        user_ratings_total = restaurant.get('user_ratings_total', 0)
+        score += min(user_ratings_total / 1000, 1)
+        if time_ and restaurant.get('opening_hours', {}).get('open_now'):
+            score += 1
+        scored_restaurants.append((restaurant, score))
+
+    scored_restaurants.sort(key=lambda x: x[1], reverse=True)
+    return scored_restaurants
+
+
+def candidates(count: int, rng: random.Random):
+    """Random restaurants shaped like Google Places text search results"""
+    restaurants = []
+    for index in range(count):
+        restaurant = {
+            'place_id': f'place-{index}',
+            'name': f"{rng.choice(['Vegan ', 'Halal ', 'The ', ''])}{rng.choice(CUISINES).title()} {index}",
+            'types': rng.sample(CUISINES + TAGS, rng.randint(0, 4)),
+        }
+        if rng.random() < 0.9:
+            restaurant['rating'] = rng.choice([3, 3.5, 4, 4.2, 4.5, 4.7, 5])
+        if rng.random() < 0.9:
+            restaurant['user_ratings_total'] = rng.choice([0, 12, 250, 999, 1000, 4000])
+        if rng.random() < 0.8:
+            restaurant['price_level'] = rng.randint(1, 4)
+        if rng.random() < 0.8:
+            restaurant['opening_hours'] = {'open_now': rng.random() < 0.5}
+        if rng.random() < 0.5:
+            restaurant['reviews'] = [{'text': ' '.join(rng.sample(WORDS, 3))} for _ in range(rng.randint(0, 3))]
+        restaurants.append(restaurant)
+    return restaurants
+
+
+def preferences(rng: random.Random):
+    return {
+        'cuisine': rng.choice(CUISINES + [None]),
+        'dietary': rng.choice(['vegan', 'vegetarian', 'halal', 'kosher', None]),
+        'atmosphere': rng.choice(['quiet', 'cozy', 'bright', None]),
+        'budget': rng.choice(['cheap', 'moderate', 'expensive', None]),
+        'time': rng.choice([datetime.now(), None]),
+    }
+
+
+def check_equivalence(scorer: Scorer, runs: int = 2000):
+    rng = random.Random(3)
+    for _ in range(runs):
+        restaurants = candidates(rng.randint(0, 40), rng)
+        prefs = preferences(rng)
+        expected = legacy_score(restaurants, prefs)
+
+        order, scores = scorer.rank(CandidatePool(restaurants), prefs)
+        actual = [(restaurants[index], float(score)) for index, score in zip(order, scores)]
+        assert [(r['place_id'], s) for r, s in actual] == [(r['place_id'], s) for r, s in expected]
+
+        top_k = rng.randint(1, 5)
+        order, _ = scorer.rank(CandidatePool(restaurants), prefs, top_k)
+        assert [restaurants[index]['place_id'] for index in order] == [r['place_id'] for r, _ in expected[:top_k]]
+    return runs
+
+
+def timed(fn, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scorer benchmark')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    scorer = Scorer()
+    print(f"equivalence: {check_equivalence(scorer)} random candidate sets rank identically")
+
+    rng = random.Random(5)
+    prefs = {'cuisine': 'italian', 'dietary': 'vegan', 'atmosphere': 'cozy', 'budget': 'cheap', 'time': datetime.now()}
+    print(f"{'candidates':>10}{'legacy':>12}{'pool + rank':>14}{'rank (pool reused)':>20}")
+    for count in (20, 1000, 10000, 100000):
+        restaurants = candidates(count, rng)
+        pool = CandidatePool(restaurants)
+        legacy = timed(lambda: legacy_score(restaurants, prefs), args.repeat)
+        fresh = timed(lambda: scorer.rank(CandidatePool(restaurants), prefs, 3), args.repeat)
+        reused = timed(lambda: scorer.rank(pool, prefs, 3), args.repeat)
+        print(f"{count:>10}{legacy * 1000:>10.2f}ms{fresh * 1000:>12.2f}ms{reused * 1000:>18.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import sys
+import time
+import argparse
+import subprocess
+from modules.SentimentAnalyzer import SentimentAnalyzer, classify
+from benchmarks.corpus import messages
+
+# ------------------------------------------
+# Sentiment Benchmark
+# ------------------------------------------
+# Checks that the SentimentAnalyzer classifies the corpus of generated
+# messages of benchmarks/corpus.py exactly like TextBlob with the
+# happy/neutral/sad thresholds, and that messages scored by the lexicon
+# get TextBlob's polarity. Then compares the per-call latency and the
+# cold start (import and first message) of both.
+#
+#   python -m benchmarks.bench_sentiment
+# ------------------------------------------
+def check_agreement(analyzer: SentimentAnalyzer, texts: list):
+    from textblob import TextBlob
+
+    lexicon = 0
+    for text in texts:
+        expected = TextBlob(text).sentiment.polarity
+        polarity = analyzer.lexicon_polarity(text)
+        if polarity is not None:
+            assert polarity == expected, (text, polarity, expected)
+            lexicon += 1
+        assert analyzer.analyze_uncached(text) == classify(expected), text
+    return lexicon
+
+
+def cold_start(code: str, repeat: int = 3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sentiment benchmark')
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    texts = messages(args.messages)
+    lexicon = check_agreement(SentimentAnalyzer(), texts)
+    print(f"agreement: {len(texts)} messages classified like TextBlob, "
+          f"{lexicon} ({lexicon / len(texts):.0%}) scored by the lexicon with the same polarity")
+
+    from textblob import TextBlob
+    distinct = list(dict.fromkeys(texts))
+
+    start = time.perf_counter()
+    for text in distinct:
+        classify(TextBlob(text).sentiment.polarity)
+    textblob = (time.perf_counter() - start) / len(distinct)
+
+    analyzer = SentimentAnalyzer(cache_size=len(distinct))
+    start = time.perf_counter()
+    for text in distinct:
+        analyzer.analyze(text)
+    uncached = (time.perf_counter() - start) / len(distinct)
+
+    start = time.perf_counter()
+    for text in distinct:
+        analyzer.analyze(text)
+    cached = (time.perf_counter() - start) / len(distinct)
+
+    simple = [text for text in distinct if analyzer.lexicon_polarity(text) is not None]
+    start = time.perf_counter()
+    for text in simple:
+        analyzer.lexicon_polarity(text)
+    lexicon_path = (time.perf_counter() - start) / len(simple)
+
+    start = time.perf_counter()
+    SentimentAnalyzer().analyze_many(texts)
+    batch = (time.perf_counter() - start) / len(texts)
+
+    print(f"{'per call':<28}{'latency':>10}")
+    print(f"{'TextBlob':<28}{textblob * 1e6:>8.1f}us")
+    print(f"{'analyzer, first time':<28}{uncached * 1e6:>8.1f}us")
+    print(f"{'analyzer, lexicon only':<28}{lexicon_path * 1e6:>8.1f}us")
+    print(f"{'analyzer, cached':<28}{cached * 1e6:>8.1f}us")
+    print(f"{'analyzer, batch':<28}{batch * 1e6:>8.1f}us")
+    print(f"analyzer: {analyzer.stats()}")
+
+    text = 'Hi, great evening with friends'
+    print(f"{'cold start':<28}{'':>10}")
+    print(f"{'TextBlob':<28}{cold_start(f'from textblob import TextBlob; TextBlob({text!r}).sentiment') * 1000:>8.0f}ms")
+    print(f"{'analyzer':<28}{cold_start(f'from modules.SentimentAnalyzer import SentimentAnalyzer; SentimentAnalyzer().analyze({text!r})') * 1000:>8.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from modules.RatingApi import RatingApi
+from modules.SingleFlight import SingleFlight
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Single Flight Benchmark
+# ------------------------------------------
+# Many conversations finish at the same moment and ask for the same cold
+# query: each one searches Google Places and looks up the details of all
+# results. Runs them from threads and from asyncio tasks, with and
+# without coalescing identical requests in flight, and reports the
+# requests that reached the stub, the wall time and the calls saved.
+# Checks that every caller got the same restaurants in all runs.
+#
+#   python -m benchmarks.bench_single_flight --callers 50
+# ------------------------------------------
+QUERY = ('in the city', 'italian')
+
+
+class NoCoalescing(SingleFlight):
+    """Every caller sends its own request, as before"""
+
+    def do(self, key, fn):
+        return fn(), False
+
+    def submit(self, executor, key, fn):
+        return executor.submit(fn), False
+
+    async def do_async(self, key, fn):
+        return await fn(), False
+
+
+def make_api(stub: StubPlaces, coalesce: bool):
+    api = RatingApi()
+    api.config['google'].update(stub.google_config())
+    if not coalesce:
+        api.search_flights, api.details_flights = NoCoalescing(), NoCoalescing()
+    return api
+
+
+def run_threads(api: RatingApi, callers: int):
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        return list(pool.map(lambda _: api.fetch_google_ratings(*QUERY), range(callers)))
+
+
+def run_tasks(api: RatingApi, callers: int):
+    async def main():
+        try:
+            return await asyncio.gather(*(api.fetch_google_ratings_async(*QUERY) for _ in range(callers)))
+        finally:
+            await api.transport.aclose()
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Single flight benchmark')
+    parser.add_argument('--callers', type=int, default=50, help='conversations asking at the same moment')
+    parser.add_argument('--latency', type=float, default=0.25, help='stub latency per Google request in seconds')
+    args = parser.parse_args()
+
+    print(f"{args.callers} callers of the same cold query")
+    print(f"{'':<26}{'searches':>10}{'details':>10}{'saved':>8}{'time':>9}")
+    results = []
+    with StubPlaces(latency=args.latency) as stub:
+        for mode, run in (('threads', run_threads), ('asyncio tasks', run_tasks)):
+            for coalesce in (False, True):
+                api = make_api(stub, coalesce)
+                before = stub.count('/textsearch/json'), stub.count('/details/json')
+                start = time.perf_counter()
+                results.append(run(api, args.callers))
+                elapsed = time.perf_counter() - start
+
+                searches = stub.count('/textsearch/json') - before[0]
+                details = stub.count('/details/json') - before[1]
+                saved = api.search_flights.stats()['shared'] + api.details_flights.stats()['shared']
+                name = f"{mode}, {'coalesced' if coalesce else 'each own'}"
+                print(f"{name:<26}{searches:>10}{details:>10}{saved:>8}{elapsed:>8.2f}s")
+
+    expected = results[0][0]
+    assert all(result == expected for run in results for result in run), "callers got different restaurants"
+    print("All callers got the same restaurants")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import time
+import argparse
+from modules.Response import Response
+from benchmarks.corpus import CORPUS, legacy_check_responses, legacy_conversation, conversation, transcripts
+
+# ------------------------------------------
+# Slot Extractor Benchmark
+# ------------------------------------------
+# Checks that Response.check_response, on top of the compiled
+# SlotExtractor, fills exactly the same user info as the previous
+# per-pattern check_responses loop on the sample utterances and
+# transcripts of benchmarks/corpus.py, then compares their speed.
+#
+#   python -m benchmarks.bench_slot_extractor
+# ------------------------------------------
+def check_equivalence(patterns: dict, response: Response):
+    checked = 0
+    for text in CORPUS:
+        expected = legacy_check_responses(patterns, {"greet": text}, {})
+        actual = conversation(response, [("greet", text)])
+        assert list(actual.items()) == list(expected.items()), (text, expected, actual)
+        checked += 1
+
+    for turns in transcripts(2000):
+        expected = legacy_conversation(patterns, turns)
+        actual = conversation(response, turns)
+        assert list(actual.items()) == list(expected.items()), (turns, expected, actual)
+        checked += 1
+    return checked
+
+
+def timed(fn, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Slot extractor benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    response = Response()
+    patterns = response.user_info_patterns
+
+    checked = check_equivalence(patterns, response)
+    print(f"equivalence: {checked} utterances and transcripts match")
+
+    data = list(transcripts(500, seed=11))
+    legacy = timed(lambda: [legacy_conversation(patterns, turns) for turns in data], args.repeat)
+    compiled = timed(lambda: [conversation(response, turns) for turns in data], args.repeat)
+    utterances = sum(len(turns) for turns in data)
+
+    print(f"{'implementation':<16}{'per utterance':>16}{'speedup':>10}")
+    print(f"{'legacy':<16}{legacy / utterances * 1e6:>14.2f}us{1:>9.1f}x")
+    print(f"{'compiled':<16}{compiled / utterances * 1e6:>14.2f}us{legacy / compiled:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
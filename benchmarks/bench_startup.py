@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+# ------------------------------------------
+# Startup Benchmark
+# ------------------------------------------
+# Starts fresh Python processes against a temporary database and
+# measures the import time of flask_app and the time to the first
+# responses: starting a conversation and the first conversation turn.
+# Compared with eager loading (all heavy modules imported up front, as
+# before the app factory) and with the warm-up modes.
+#
+#   python -m benchmarks.bench_startup
+# ------------------------------------------
+CHILD = r"""
+import json
+import time
+start = time.perf_counter()
+{preload}
+import flask_app
+imported = time.perf_counter()
+client = flask_app.app.test_client()
+assert client.post('/', json={{'user_id': 'bench', 'user_name': 'Bench'}}).status_code == 200
+started = time.perf_counter()
+assert client.post('/conversation', json={{'user_id': 'bench', 'text': 'Hi, what a lovely evening!'}}).status_code == 200
+answered = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'first response': started - start, 'first turn': answered - start}}))
+"""
+EAGER = "import git, flask_migrate, requests, numpy, textblob; from modules.Conversation import Conversation"
+
+
+def prepare(path: str):
+    """Create the tables of a temporary database"""
+    subprocess.run([sys.executable, '-c', (
+        "import flask_app; from models.db import db\n"
+        "with flask_app.app.app_context(): db.create_all()"
+    )], env={**os.environ, 'DATABASE_URL': f'sqlite:///{path}'}, check=True)
+
+
+def run(path: str, preload: str = '', warm_up: str = ''):
+    env = {**os.environ, 'DATABASE_URL': f'sqlite:///{path}', 'APP_WARM_UP': warm_up}
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD.format(preload=preload)],
+        env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        prepare(path)
+
+        print(f"{'startup':<22}{'import':>10}{'first response':>16}{'first turn':>12}")
+        for label, preload, warm_up in [
+            ('eager imports', EAGER, ''),
+            ('lazy (default)', '', ''),
+            ('warm-up background', '', 'background'),
+            ('warm-up sync', '', 'sync'),
+        ]:
+            runs = [run(path, preload, warm_up) for _ in range(args.repeat)]
+            result = {key: median(r[key] for r in runs) for key in runs[0]}
+            print(f"{label:<22}" + "".join(
+                f"{result[key] * 1000:>{width - 2}.0f}ms"
+                for key, width in (('import', 10), ('first response', 16), ('first turn', 12))
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+from benchmarks.stub_places import StubPlaces
+from modules.RatingApi import RatingApi
+from modules.Transport import PlacesArchive
+
+# ------------------------------------------
+# Transport Benchmark
+# ------------------------------------------
+# Records text searches and place details from the local stub server,
+# then stops the stub and replays them: checks that every replayed
+# response equals the recorded one and compares the time per request
+# of the live stub and the replay. Finally fills a large archive and
+# measures opening it and looking up random requests in the
+# memory-mapped index.
+#
+#   python -m benchmarks.bench_transport --entries 1000000
+# ------------------------------------------
+CUISINES = ('italian', 'chinese', 'indian', 'mexican', 'japanese', 'thai', 'french')
+LOCATIONS = ('near me', 'nearby', 'in the city', 'close by')
+
+
+def rating_api(mode: str, archive: str, stub: StubPlaces = None):
+    os.environ.update(PLACES_TRANSPORT=mode, PLACES_ARCHIVE=archive)
+    api = RatingApi()
+    if stub:
+        api.config["google"].update(stub.google_config())
+    else:
+        api.config["google"].update(api_key='replay')  # Requests are found without the key
+    return api
+
+
+def fetch_all(api: RatingApi):
+    """Search every query and look up the details of every result"""
+    responses = {}
+    for cuisine in CUISINES:
+        for location in LOCATIONS:
+            results = api.search_places_uncached(location, cuisine)
+            details = {result['place_id']: api.fetch_place_details_uncached(result['place_id']) for result in results}
+            responses[(cuisine, location)] = (results, details)
+    return responses
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record/replay transport benchmark')
+    parser.add_argument('--entries', type=int, default=1_000_000, help='entries of the large archive')
+    parser.add_argument('--lookups', type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = os.path.join(directory, 'archive')
+
+        with StubPlaces(latency=0) as stub:
+            recorder = rating_api('record', archive, stub)
+            live_time, recorded = timed(lambda: fetch_all(recorder))
+            recorder.transport.close()
+        requests = recorder.transport.stats()["requests"]
+
+        # The stub is stopped, every response must come from the archive
+        replayer = rating_api('replay', archive)
+        replay_time, replayed = timed(lambda: fetch_all(replayer))
+        stats = replayer.transport.stats()
+        assert replayed == recorded, "replayed responses differ from the recorded ones"
+        assert stats["misses"] == 0 and stats["hits"] == requests
+        print(f"{requests} requests recorded and replayed identically")
+        print(f"{'live stub (no latency)':<26}{live_time / requests * 1e6:>10.1f}us/request")
+        print(f"{'replay':<26}{replay_time / requests * 1e6:>10.1f}us/request")
+
+        # A large archive: open time and lookups in the memory-mapped index
+        large = PlacesArchive(os.path.join(directory, 'large')).open_for_record()
+        body = b'{"status": "OK", "result": {"website": "https://example.com", "url": "https://maps.google.com"}}'
+        keys = [PlacesArchive.request_key('details', f'https://stub/details/json?place_id=place-{i}') for i in range(args.entries)]
+        for key in keys:
+            large.append(key, 200, body)
+        large.close()
+        os.remove(large.index_path)
+
+        open_time, large = timed(lambda: PlacesArchive(os.path.join(directory, 'large')).open_for_replay())
+        print(f"{'open (index rebuilt)':<26}{open_time * 1000:>10.1f}ms for {args.entries} entries")
+        open_time, large = timed(lambda: PlacesArchive(os.path.join(directory, 'large')).open_for_replay())
+        print(f"{'open (index current)':<26}{open_time * 1000:>10.1f}ms")
+
+        sample = random.Random(1).choices(keys, k=args.lookups)
+        lookup_time, found = timed(lambda: sum(large.lookup(key) is not None for key in sample))
+        assert found == args.lookups
+        missing = PlacesArchive.request_key('details', 'https://stub/details/json?place_id=unknown')
+        assert large.lookup(missing) is None
+        print(f"{'lookup':<26}{lookup_time / args.lookups * 1e6:>10.2f}us ({args.lookups / lookup_time:,.0f}/s)")
+        large.close()
+
+
+if __name__ == '__main__':
+    main()
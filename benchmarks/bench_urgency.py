@@ -0,0 +1,112 @@
+import time
+import random
+import argparse
+from modules.Sentiment import Sentiment
+
+# ------------------------------------------
+# Urgency Matcher Benchmark
+# ------------------------------------------
+# Checks that the compiled UrgencyMatcher decides urgency exactly like
+# the previous analyze_urgency and reports the signals the substring
+# checks find, in order of first appearance, then compares both on
+# chat-sized and long pasted messages.
+#
+#   python -m benchmarks.bench_urgency
+# ------------------------------------------
+URGENCY_KEYWORDS = [
+    'quick', 'hurry', 'fast', 'asap', 'urgent', 'soon',
+    'running late', 'immediately', 'right now', 'emergency',
+    'quickly', 'rush', 'short time', 'busy', 'no time'
+]
+TIME_PATTERNS = [
+    'next hour', 'within hour', '30 minutes', '15 minutes',
+    'half hour', 'quarter hour'
+]
+WORDS = (
+    "we would like a table for dinner with friends tonight in the city center please somewhere "
+    "nice and quiet with vegan options near the station"
+).split()
+# Words with signals in them or close to them, for the equivalence check
+TRICKY_WORDS = "breakfast steakhouse brushed soonish Busy NEXT Hour within the hour 30 minute 15 minutes. half-hour QUICKLY".split()
+PUNCTUATION = ['', '', '', '.', ',', '!', '?', '!!', '??', '...', '?!', '!?!']
+
+
+def legacy_analyze_urgency(user_text: str) -> bool:
+    """The previous Sentiment.analyze_urgency"""
+    text = user_text.lower()
+    has_urgency_keywords = any(keyword in text for keyword in URGENCY_KEYWORDS)
+    has_time_urgency = any(pattern in text for pattern in TIME_PATTERNS)
+    has_exclamations = '!' in text
+    has_repeated_punctuation = any(p * 2 in text for p in '!?.')
+    urgency_score = sum([
+        has_urgency_keywords,
+        has_time_urgency,
+        has_exclamations and has_repeated_punctuation
+    ])
+    return urgency_score >= 1
+
+
+def message(words: int, rng: random.Random, signal_rate: float = 0.02, vocabulary: list = WORDS):
+    parts = []
+    for _ in range(words):
+        if rng.random() < signal_rate:
+            parts.append(rng.choice(URGENCY_KEYWORDS + TIME_PATTERNS))
+        else:
+            parts.append(rng.choice(vocabulary))
+        parts[-1] += rng.choice(PUNCTUATION) if rng.random() < 0.1 else ''
+    return ' '.join(parts)
+
+
+def check_equivalence(sentiment: Sentiment, runs: int = 20000):
+    rng = random.Random(17)
+    for index in range(runs):
+        text = message(rng.randint(0, 40 if index % 10 else 800), rng, rng.choice([0, 0.01, 0.1]), WORDS + TRICKY_WORDS)
+        expected = legacy_analyze_urgency(text)
+        assert sentiment.analyze_urgency(text) == expected, text
+
+        signals = sentiment.urgency_signals(text)
+        lower = text.lower()
+        assert signals['urgent'] == expected, text
+        assert set(signals['keywords']) == {k for k in URGENCY_KEYWORDS if k in lower}, text
+        assert set(signals['time_patterns']) == {p for p in TIME_PATTERNS if p in lower}, text
+        assert signals['exclamation'] == ('!' in lower), text
+        assert set(signals['repeated_punctuation']) == {p * 2 for p in '!?.' if p * 2 in lower}, text
+    return runs
+
+
+def timed(fn, texts: list, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Urgency matcher benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sentiment = Sentiment()
+    print(f"equivalence: {check_equivalence(sentiment)} messages decided and reported like the substring checks")
+
+    rng = random.Random(23)
+    print(f"{'message':<26}{'legacy':>10}{'is_urgent':>12}{'signals':>12}")
+    for label, words, rate in [
+        ('chat, 5 words', 5, 0.0),
+        ('chat, 10 words', 10, 0.0),
+        ('chat, 10 words, signal', 10, 0.1),
+        ('pasted, 300 words', 300, 0.0),
+        ('pasted, 3000 words', 3000, 0.0),
+        ('pasted, 3000 words, signal', 3000, 0.002),
+    ]:
+        texts = [message(words, rng, rate) for _ in range(max(20, 20000 // words))]
+        results = [timed(fn, texts, args.repeat) for fn in
+                   (legacy_analyze_urgency, sentiment.analyze_urgency, sentiment.urgency_signals)]
+        print(f"{label:<26}" + "".join(f"{seconds * 1e6:>10.1f}us" for seconds in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import os
+import time
+import argparse
+import tempfile
+import threading
+from flask import Flask
+from models.db import db
+from models.recommendation import Recommendation
+from modules.RecommendationWriter import RecommendationWriter
+
+# ------------------------------------------
+# Write-Behind Benchmark
+# ------------------------------------------
+# Stores recommendations from concurrent threads in a temporary SQLite
+# database, once with a commit per row (default journal) and once with
+# the write-behind writer (WAL, group commits), and compares throughput
+# and the time a request spends storing its recommendation. Checks that
+# every returned id was written.
+#
+#   python -m benchmarks.bench_write_behind --threads 8 --rows 250
+# ------------------------------------------
+def make_app(path: str):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def recommendation(thread: int, index: int):
+    return Recommendation(
+        user_id=f'user-{thread}', user_name='Bench', restaurant_name=f'Restaurant {index}',
+        cuisine='italian', location='in the city', guests=2, rating=4.5, total_ratings=1200,
+        price_level=2, place_id=f'place-{index}', maps_url='https://maps.google.com/?cid=1'
+    )
+
+
+def run(app, writer: RecommendationWriter, threads: int, rows: int):
+    """Store threads * rows recommendations, returns (seconds, latencies, ids)"""
+    latencies, ids = [], []
+    lock = threading.Lock()
+
+    def worker(thread):
+        local_latencies, local_ids = [], []
+        for index in range(rows):
+            with app.app_context():
+                start = time.perf_counter()
+                stored = writer.add(recommendation(thread, index))
+                local_latencies.append(time.perf_counter() - start)
+                local_ids.append(stored.id)
+        with lock:
+            latencies.extend(local_latencies)
+            ids.extend(local_ids)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(thread,)) for thread in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    writer.flush()
+    return time.perf_counter() - start, latencies, ids
+
+
+def percentile(values: list, fraction: float):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write-behind benchmark')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=250)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+    total = args.threads * args.rows
+
+    print(f"{'mode':<14}{'rows/s':>10}{'p50':>10}{'p99':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ('sync', 'write_behind'):
+            app = make_app(os.path.join(directory, f'{mode}.db'))
+            writer = RecommendationWriter(mode=mode, batch_size=args.batch)
+            writer.init_app(app)
+
+            elapsed, latencies, ids = run(app, writer, args.threads, args.rows)
+            stats = writer.stats()
+            writer.close()
+
+            with app.app_context():
+                stored = set(db.session.execute(db.select(Recommendation.id)).scalars())
+            assert len(set(ids)) == total and stored == set(ids), f"{mode}: returned ids were not all written"
+
+            print(f"{mode:<14}{total / elapsed:>10.0f}"
+                  f"{percentile(latencies, 0.5) * 1000:>8.2f}ms{percentile(latencies, 0.99) * 1000:>8.2f}ms")
+            if mode == 'write_behind':
+                print(f"writer: {stats}")
+
+
+if __name__ == '__main__':
+    main()
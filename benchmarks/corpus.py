@@ -0,0 +1,140 @@
+import re
+import random
+from modules.Response import Response
+
+# ------------------------------------------
+# Benchmark and Test Corpus
+# ------------------------------------------
+# Sample messages shared by the benchmarks and the tests:
+# - user utterances and the previous per-pattern slot filling loop, the
+#   Response methods must fill the same user info as the loop it
+#   replaced, turn by turn
+# - generated greetings and moods for the sentiment analyzer
+# ------------------------------------------
+CORPUS = [
+    "Hi, I'm looking for a nice place for dinner",
+    "It's a date night, something romantic please",
+    "A quiet and cozy place, maybe dim lighting",
+    "Loud and bright, we want to party!",
+    "No, this is my first time",
+    "yes I'm a regular",
+    "I'm vegan, my partner is vegetarian",
+    "no restrictions",
+    "We'd love italian or maybe thai food",
+    "Fast food is fine, or street food",
+    "Tomorrow at 7pm",
+    "today at 19:30 pm or at 8 am",
+    "tonight around 10 pm, or now",
+    "table for 4 people",
+    "party of two persons",
+    "just me, alone",
+    "a couple",
+    "3",
+    "we are 12 people",
+    "near me please",
+    "somewhere in the city or close to my location",
+    "close by, in the neighborhood",
+    "cheap or moderate, nothing expensive",
+    "I want a table for 2 today at 7pm near me, italian, cheap and vegan",
+    "Breakfast tomorrow morning for five people in the town, somewhere bright and outdoor",
+    "NO idea, just something HALAL and Indian in the area at Noon",
+    "   ",
+    "",
+    "coffee and snacks, casual, indoor, at 11:15am, here",
+    "no no no yes",
+    "the party of 6 persons wants a special occasion formal dinner",
+    "CLOſE BY, ıtalıan at 7 PM",
+    "Table For Three People, İndian, Halal",
+]
+
+
+def legacy_check_responses(patterns: dict, responses: dict, user_info: dict):
+    """The previous Response.check_responses, without the session and print"""
+    user_info = dict(user_info)
+    for key, pattern in patterns.items():
+        if key not in user_info.keys():
+            matches = []
+            for response in responses.values():
+                if response:
+                    all_matches = re.finditer(pattern, response.lower(), re.IGNORECASE)
+                    for match in all_matches:
+                        if match.groups():
+                            matches.extend(match.groups())
+                        else:
+                            matches.append(match.group())
+            if matches:
+                user_info[key] = matches
+    return user_info
+
+
+def legacy_conversation(patterns: dict, turns: list, user_info: dict = None):
+    """
+    The user info after the turns (state, text) as the previous flow filled
+    it: the answer of a state replaced the earlier one, and all answers
+    were checked again after every turn
+    """
+    responses, user_info = {}, dict(user_info or {})
+    for state, text in turns:
+        responses[state] = text
+        user_info = legacy_check_responses(patterns, responses, user_info)
+    return user_info
+
+
+class MemoryStore:
+    """A conversation store in a dict, enough for the Response methods"""
+
+    def __init__(self):
+        self.records = {}
+
+    def get(self, user_id: str, key: str, default=None):
+        return self.records.get(user_id, {}).get(key, default)
+
+    def set(self, user_id: str, key: str, value):
+        self.records.setdefault(user_id, {})[key] = value
+
+
+def conversation(response: Response, turns: list, user_info: dict = None, user_id: str = 'user'):
+    """The user info after the turns (state, text) through Response.check_response"""
+    response.store = MemoryStore()
+    if user_info:
+        response.store.set(user_id, 'user_info', dict(user_info))
+    for state, text in turns:
+        response.check_response(state, text, user_id)
+    return response.store.get(user_id, 'user_info', {})
+
+
+def transcripts(count: int, seed: int = 7):
+    """Random multi-turn transcripts built from the corpus, a state may be answered again"""
+    rng = random.Random(seed)
+    states = list(Response().user_info_patterns)
+    for _ in range(count):
+        turns = rng.randint(1, len(states))
+        yield [(rng.choice(states), rng.choice(CORPUS)) for _ in range(turns)]
+
+
+OPENERS = ['Hi', 'Hello', 'Hey there', 'Good evening', "I'm", 'We are', 'Today is', 'Feeling', 'I feel', '']
+WORDS = [
+    'great', 'good', 'bad', 'terrible', 'awful', 'happy', 'sad', 'tired', 'hungry', 'amazing', 'fine',
+    'okay', 'wonderful', 'lonely', 'angry', 'excited', 'nice', 'boring', 'stressed', 'fantastic',
+    'horrible', 'lovely', 'busy', 'calm', 'perfect', 'worst', 'best', 'delicious', 'cold', 'warm',
+]
+FILLERS = ['day', 'evening', 'mood', 'week', 'food', 'dinner', 'for 4 people', 'tonight', 'with friends', 'at 7pm']
+EXTRAS = ['not', 'never', 'no', 'very', 'really', 'so', 'quite', "isn't", "don't", 'pretty', 'extremely']
+ENDINGS = ['', '.', '!', '!!', '?', '...', ' :)', ' :(', ' (!)', ',', '?!']
+
+
+def messages(count: int, seed: int = 13):
+    """Random greetings and moods, some with negations, intensifiers and emoticons"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        parts = [rng.choice(OPENERS)]
+        for _ in range(rng.randint(1, 3)):
+            if rng.random() < 0.25:
+                parts.append(rng.choice(EXTRAS))
+            parts.append(rng.choice(WORDS) + (rng.choice(ENDINGS) if rng.random() < 0.3 else ''))
+            if rng.random() < 0.5:
+                parts.append(rng.choice(FILLERS))
+        text = ' '.join(part for part in parts if part) + rng.choice(ENDINGS)
+        texts.append(text.upper() if rng.random() < 0.05 else text)
+    return texts
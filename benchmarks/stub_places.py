@@ -0,0 +1,148 @@
+import json
+import zlib
+import hashlib
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ------------------------------------------
+# Stub Google Places Server
+# ------------------------------------------
+# A local stand-in for the Google Places text search, details and photo
+# endpoints, used by the benchmarks. Every response is delayed by a
+# configurable latency to mimic the round trip to Google. It can also
+# misbehave, the attributes can be changed while it runs:
+# - status: respond with this status (and an empty body) instead of 200
+# - slow_every / slow_latency: every slow_every-th request takes
+#   slow_latency seconds instead, a long tail of slow responses
+# ------------------------------------------
+class StubPlaces:
+    def __init__(self, latency: float = 0.05, results: int = 20, status: int = 200, slow_every: int = 0, slow_latency: float = 0.0):
+        self.latency = latency
+        self.results = results
+        self.status = status
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.counts = {}
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Allow keep-alive connections
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                try:
+                    stub.handle(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client gave up (timeout or hedged request)
+
+            def log_message(self, *args):
+                pass
+
+        # A listen backlog for bursts of concurrent clients (socketserver's default is 5)
+        server_class = type('StubServer', (ThreadingHTTPServer,), {'request_queue_size': 1024})
+        self.server = server_class(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def google_config(self):
+        """Config overrides that point RatingApi at this stub"""
+        return {
+            "api_key": "stub-key",
+            "base_url": f"{self.base_url}/textsearch/json",
+            "details_url": f"{self.base_url}/details/json",
+            "photo_url": f"{self.base_url}/photo",
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, path: str) -> int:
+        with self.lock:
+            return self.counts.get(path, 0)
+
+    def handle(self, handler):
+        url = urlparse(handler.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.lock:
+            self.counts[url.path] = self.counts.get(url.path, 0) + 1
+            self.requests += 1
+            slow = self.slow_every > 0 and self.requests % self.slow_every == 0
+
+        time.sleep(self.slow_latency if slow else self.latency)
+
+        if self.status != 200:
+            handler.send_response(self.status)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+
+        if url.path == '/textsearch/json':
+            body = {"status": "OK", "results": [self.place(i, query.get('query', '')) for i in range(self.results)]}
+        elif url.path == '/details/json':
+            place_id = query.get('place_id', '')
+            body = {"status": "OK", "result": {
+                "website": f"https://example.com/{place_id}",
+                "url": f"https://maps.google.com/?cid={place_id}",
+            }}
+        elif url.path == '/photo' and query.get('photo_reference', '').startswith('photo-'):
+            self.respond(handler, self.photo(query['photo_reference'], int(query.get('maxwidth', 400))), 'image/jpeg')
+            return
+        else:
+            # Google answers unknown photo references with a 400
+            handler.send_response(400 if url.path == '/photo' else 404)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+
+        self.respond(handler, json.dumps(body).encode(), 'application/json')
+
+    def respond(self, handler, payload: bytes, content_type: str):
+        handler.send_response(200)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def photo(self, photo_reference: str, maxwidth: int):
+        """Fake JPEG bytes of a photo, about 100 bytes per pixel of width"""
+        digest = hashlib.sha256(f'{maxwidth}:{photo_reference}'.encode()).digest()
+        return b'\xff\xd8\xff\xe0' + digest * (maxwidth * 100 // len(digest))
+
+    def place(self, index: int, query: str):
+        """Build a fake text search result, the same place for the same query"""
+        cuisine = (query.split('+')[0] or 'italian').split()[0]
+        location = query.rsplit(' in ', 1)[-1] if ' in ' in query else ''
+        return {
+            "place_id": f"stub-{zlib.crc32(query.encode()):08x}-{index}",
+            "name": f"Stub {cuisine.title()} {index}",
+            "types": [cuisine, "restaurant", "food"] if index % 2 == 0 else ["restaurant", "food"],
+            "rating": round(3.0 + (index * 7 % 20) / 10, 1),
+            "user_ratings_total": index * 97,
+            "price_level": index % 4 + 1,
+            "formatted_address": f"{index} Stub Street, {location}" if location else f"{index} Stub Street",
+            "opening_hours": {"open_now": index % 3 != 0},
+            "geometry": {"location": {"lat": 51.5 + index / 1000, "lng": -0.12 + index / 1000}},
+            "photos": [{"photo_reference": f"photo-{index}"}],
+        }
@@ -1,38 +1,114 @@
 import os
-from git import Repo
+import re
+import click
+import threading
 from models.db import db
 from flask_cors import CORS
 from dotenv import load_dotenv
 from datetime import timedelta
-from flask_migrate import Migrate
-from flask import Flask, request, jsonify
-from modules.Conversation import Conversation
+from modules.Metrics import metrics
+from modules.Export import Export, FORMATS
+from modules.ConversationStore import ConversationStore
+from modules.PhotoCache import PhotoCache, PhotoFetchError, snap_width
+from modules.RecommendationWriter import RecommendationWriter
 from models.recommendation import Recommendation, db
+from flask import Flask, Blueprint, current_app, request, jsonify, send_file, stream_with_context
 
 # --------------------------------
-# Initialize Flask app
+# Flask app
 # --------------------------------
-app = Flask(__name__)
-CORS(app)
+# The app is built by create_app(). Heavy modules are only imported
+# when they are first used: the conversation engine on the first
+# request (Google Places and NumPy on the first recommendation),
+# GitPython by /git_update and Flask-Migrate by the flask CLI. Set
+# APP_WARM_UP to 'background' or 'sync' to load them at startup instead.
+# --------------------------------
+api = Blueprint('api', __name__, cli_group=None)
+conversation_lock = threading.Lock()
+
+# Google photo references are URL safe base64, and Google serves photos at most 1600px wide
+PHOTO_REFERENCE = re.compile(r'[A-Za-z0-9_-]{1,1000}')
+PHOTO_MAX_WIDTH = 1600
+
+def create_app(config: dict = None):
+    """Create and configure the Flask app"""
+    app = Flask(__name__)
+    # Browsers only let clients read the response headers that are exposed
+    CORS(app, expose_headers=['X-Next-Cursor'])
+
+    # Load environment variables
+    load_dotenv()
+
+    # Database configuration, the conversation state is stored in the
+    # database as well and expires after PERMANENT_SESSION_LIFETIME
+    app.config.update(
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        PERMANENT_SESSION_LIFETIME=timedelta(days=1),
+        SQLALCHEMY_DATABASE_URI=os.getenv('DATABASE_URL', 'sqlite:///sessions.db'),
+        SECRET_KEY=os.getenv('SESSION_SECRET', "dev-123"),
+        # Number of recommendations returned by default, at most and as preview
+        # when a conversation starts
+        RECOMMENDATION_HISTORY_LIMIT=int(os.getenv('RECOMMENDATION_HISTORY_LIMIT', 50)),
+        RECOMMENDATION_HISTORY_MAX_LIMIT=int(os.getenv('RECOMMENDATION_HISTORY_MAX_LIMIT', 200)),
+        RECOMMENDATION_PREVIEW_LIMIT=int(os.getenv('RECOMMENDATION_PREVIEW_LIMIT', 5)),
+        # Phase timings and counters on /metrics
+        METRICS_ENABLED=os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+        # Turns accepted by /conversation/batch in one request
+        CONVERSATION_BATCH_MAX_TURNS=int(os.getenv('CONVERSATION_BATCH_MAX_TURNS', 100)),
+    )
+    app.config.update(config or {})
+
+    # Initialise SQLAlchemy with app, migrations are only needed by the CLI
+    db.init_app(app)
+    if os.getenv('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Initialise the modules that hook into the app, the conversation
+    # engine itself is built on first use (see get_conversation)
+    metrics.init_app(app)
+    store = ConversationStore(max_entries=int(os.getenv('CONVERSATION_CACHE_SIZE', 1024)))
+    store.init_app(app)
+    writer = RecommendationWriter.from_env()
+    writer.init_app(app)
+    app.extensions['conversation_store'] = store
+    app.extensions['recommendation_writer'] = writer
+    app.extensions['export'] = Export()
+    app.extensions['photo_cache'] = PhotoCache.from_env()
+
+    app.register_blueprint(api)
 
-# Load environment variables
-load_dotenv()
+    warm = os.getenv('APP_WARM_UP', '').lower()
+    if warm == 'sync':
+        warm_up(app)
+    elif warm == 'background':
+        threading.Thread(target=warm_up, args=(app,), name='warm-up', daemon=True).start()
 
-# Database configuration for session storage
-app.config.update(
-    SESSION_TYPE='sqlalchemy',
-    SQLALCHEMY_TRACK_MODIFICATIONS=False,
-    PERMANENT_SESSION_LIFETIME=timedelta(days=1),
-    SQLALCHEMY_DATABASE_URI='sqlite:///sessions.db',
-    SECRET_KEY=os.getenv('SESSION_SECRET', "dev-123"),
-)
+    return app
 
-# Initialise SQLAlchemy with app
-db.init_app(app)
-migrate = Migrate(app, db)
+def get_conversation():
+    """The conversation engine of the current app, built on first use"""
+    extensions = current_app.extensions
+    if 'conversation' not in extensions:
+        with conversation_lock:
+            if 'conversation' not in extensions:
+                from modules.Conversation import Conversation
+                extensions['conversation'] = Conversation(
+                    store=extensions['conversation_store'],
+                    writer=extensions['recommendation_writer']
+                )
+    return extensions['conversation']
 
-# Initialise other modules
-conversation = Conversation()
+def warm_up(app):
+    """Load the conversation engine, its modules and a database connection"""
+    with app.app_context():
+        conversation = get_conversation()
+        conversation.recommend  # Google Places client and NumPy
+        conversation.analyze_urgency("Hello")
+        conversation.sentiment_analyzer.load_lexicon()
+        conversation.sentiment_analyzer.textblob_polarity("Hello")  # TextBlob fallback
+        db.session.execute(db.text('SELECT 1'))
+    app.extensions['photo_cache'].start()
 
 # Helper function to retrieve JSON data from the request
 def get_json_payload():
@@ -50,57 +126,274 @@ def get_json_payload():
 # Routes
 # --------------------------------
 # Endpoint to update the repository
-@app.route('/git_update', methods=['POST'])
+@api.route('/git_update', methods=['POST'])
 def git_update():
     try:
+        from git import Repo
         repo = Repo('./mysite')
         origin = repo.remotes.origin
         origin.pull()
         return jsonify({"message": "Repository updated successfully."}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+
 # Endpoint to start a new conversation
-@app.route('/', methods=['POST'])
+@api.route('/', methods=['POST'])
 def start_conversation():
     data = get_json_payload()
     if not data or 'user_id' not in data:
         return jsonify({"error": "Missing user_id in request"}), 400
-    
-    # Start a new conversation and get recommendations
-    conv = conversation.start_conversation(data['user_id'], user_name=data['user_name'])
-    recommendations = Recommendation.query.filter_by(user_id=data['user_id']).order_by(Recommendation.created_at.desc()).all()
+
+    # Start a new conversation and get a preview of the latest recommendations
+    conv = get_conversation().start_conversation(data['user_id'], user_name=data['user_name'])
+    recommendations, cursor = Recommendation.history(data['user_id'], limit=current_app.config['RECOMMENDATION_PREVIEW_LIMIT'])
     conv['recommendations'] = [r.to_dict() for r in recommendations]
+    conv['recommendations_cursor'] = cursor
 
     return jsonify(conv)
-    
-# Endpoint to process conversation input
-@app.route('/conversation', methods=['POST'])
-def process_input():
+
+# Helper function to read the optional location of a conversation turn
+def get_coordinates(turn: dict):
+    """
+    Returns the [latitude, longitude] of a turn or None if it has none.
+    Raises ValueError if they are incomplete or out of range.
+    """
+    latitude, longitude = turn.get('latitude'), turn.get('longitude')
+    if latitude is None and longitude is None:
+        return None
+
+    for value, limit in ((latitude, 90), (longitude, 180)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not -limit <= value <= limit:
+            raise ValueError
+    return [float(latitude), float(longitude)]
+
+# Helper function to validate the payload of a conversation turn
+def get_conversation_input():
+    """
+    Returns the user text, user_id and coordinates of a /conversation
+    request, or None and the error response.
+    """
     # Attempt to retrieve the JSON payload
     data = get_json_payload()
     if not data:
-        return jsonify({"error": "Missing or invalid JSON payload."}), 400
+        return None, (jsonify({"error": "Missing or invalid JSON payload."}), 400)
 
     # Ensure the payload contains required keys
     if 'text' not in data or 'user_id' not in data:
-        return jsonify({"error": "Missing 'text' or 'user_id' in JSON payload."}), 400
+        return None, (jsonify({"error": "Missing 'text' or 'user_id' in JSON payload."}), 400)
+
+    try:
+        coordinates = get_coordinates(data)
+    except ValueError:
+        return None, (jsonify({"error": "Invalid 'latitude' or 'longitude' in JSON payload."}), 400)
+
+    return (data['text'], data['user_id'], coordinates), None
+
+# Endpoint to process conversation input
+@api.route('/conversation', methods=['POST'])
+def process_input():
+    turn, error = get_conversation_input()
+    if error:
+        return error
+
+    user_text, user_id, coordinates = turn
+    return get_conversation().process_input(user_text, user_id, coordinates)
+
+# Endpoint to process several queued conversation turns, e.g. sent by
+# a client that was offline, in one request
+@api.route('/conversation/batch', methods=['POST'])
+def process_batch():
+    data = get_json_payload()
+    turns = data.get('turns') if isinstance(data, dict) else None
+    if not isinstance(turns, list) or not turns:
+        return jsonify({"error": "Missing 'turns' list in JSON payload."}), 400
+
+    max_turns = current_app.config['CONVERSATION_BATCH_MAX_TURNS']
+    if len(turns) > max_turns:
+        return jsonify({"error": f"A batch can have at most {max_turns} turns."}), 400
 
-    user_text = data['text']
-    user_id = data['user_id']
+    # Validate all turns before processing any of them
+    coordinates = []
+    for index, turn in enumerate(turns):
+        if not isinstance(turn, dict) or 'text' not in turn or 'user_id' not in turn:
+            return jsonify({"error": f"Missing 'text' or 'user_id' in turn {index}."}), 400
+        try:
+            coordinates.append(get_coordinates(turn))
+        except ValueError:
+            return jsonify({"error": f"Invalid 'latitude' or 'longitude' in turn {index}."}), 400
 
-    return conversation.process_input(user_text, user_id)
+    # The turns are processed in order. The conversation state of every
+    # user is read once and all changes are written in one transaction
+    # after the request. Each reply is serialised right away, as later
+    # turns of the same user change the state it refers to.
+    conversation = get_conversation()
+    results = [
+        current_app.json.dumps(conversation.process_turn(turn['text'], turn['user_id'], turn_coordinates))
+        for turn, turn_coordinates in zip(turns, coordinates)
+    ]
+    body = '{"results":[' + ','.join(results) + ']}\n'
+    return current_app.response_class(body, mimetype='application/json')
+
+# The same endpoint for the ASGI app (asgi.py), the final turn awaits
+# the Google requests instead of blocking a worker
+async def process_input_async():
+    turn, error = get_conversation_input()
+    if error:
+        return error
+
+    user_text, user_id, coordinates = turn
+    return await get_conversation().process_input_async(user_text, user_id, coordinates)
 
 # Add endpoint to get user's recommendations
-@app.route('/recommendations/<user_id>', methods=['GET'])
+@api.route('/recommendations/<user_id>', methods=['GET'])
 def get_recommendations(user_id):
-    # This query finds all recommendations for a specific user
-    recommendations = Recommendation.query.filter_by(user_id=user_id).order_by(Recommendation.created_at.desc()).all()
-    return jsonify([r.to_dict() for r in recommendations])
+    config = current_app.config
+    limit = min(request.args.get('limit', config['RECOMMENDATION_HISTORY_LIMIT'], type=int), config['RECOMMENDATION_HISTORY_MAX_LIMIT'])
+    if limit < 1:
+        return jsonify({"error": "The limit must be a positive number."}), 400
+
+    # This query finds one page of recommendations for a specific user
+    try:
+        recommendations, cursor = Recommendation.history(user_id, limit=limit, before=request.args.get('before'))
+    except ValueError:
+        return jsonify({"error": "Invalid 'before' cursor."}), 400
+
+    response = jsonify([r.to_dict() for r in recommendations])
+    if cursor:
+        response.headers['X-Next-Cursor'] = cursor
+    return response
+
+# Endpoint to export the recommendation history as NDJSON or CSV
+@api.route('/export/recommendations', methods=['GET'])
+def export_recommendations():
+    exporter = current_app.extensions['export']
+    format = request.args.get('format', 'ndjson')
+    try:
+        chunks = exporter.stream(
+            format,
+            user_id=request.args.get('user_id'),
+            since=exporter.parse_time(request.args.get('since')),
+            until=exporter.parse_time(request.args.get('until'))
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The rows are written to the client while they are read
+    return current_app.response_class(
+        stream_with_context(chunks),
+        mimetype=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename=recommendations.{format}'}
+    )
+
+# Endpoint to page through the alternatives of the user's last search. It is
+# a POST because serving an alternative moves the user's position in the
+# ranking and stores a recommendation
+@api.route('/recommendations/<user_id>/next', methods=['POST'])
+def next_recommendation(user_id):
+    offset = request.args.get('offset', type=int)
+    return get_conversation().next_recommendation(user_id, offset=offset)
+
+# Endpoint to serve a restaurant photo from the photo cache, fetched from Google once
+@api.route('/photos/<photo_reference>', methods=['GET'])
+def get_photo(photo_reference):
+    maxwidth = request.args.get('maxwidth', default=400, type=int)
+    if not PHOTO_REFERENCE.fullmatch(photo_reference) or not 1 <= maxwidth <= PHOTO_MAX_WIDTH:
+        return jsonify({"error": "Invalid photo reference or maxwidth."}), 400
+
+    # Only a few widths are fetched and stored, the browser scales the photo down
+    maxwidth = snap_width(maxwidth)
+    photo_cache = current_app.extensions['photo_cache']
+
+    def fetch():
+        # Only photos the app has linked are fetched with its API key
+        rating_api = get_conversation().recommend.rating_api
+        if not rating_api.served_photo(photo_reference):
+            return None
+        return rating_api.fetch_photo(photo_reference, maxwidth)
+
+    # The sweeper may delete the photo before it is sent, then it is fetched again
+    for _ in range(2):
+        try:
+            photo = photo_cache.get(photo_reference, maxwidth, fetch)
+        except PhotoFetchError:
+            return jsonify({"error": "The photo is not available right now."}), 502
+        if photo is None:
+            return jsonify({"error": "Photo not found."}), 404
+
+        # The digest of the bytes is a strong ETag, a reference always shows the same photo
+        try:
+            response = send_file(photo.path, mimetype=photo.content_type, etag=photo.digest, max_age=photo_cache.max_age, conditional=True)
+        except FileNotFoundError:
+            continue
+        response.cache_control.immutable = True
+        return response
+    return jsonify({"error": "The photo is not available right now."}), 502
+
+# Endpoint to inspect the photo cache
+@api.route('/stats/photo_cache', methods=['GET'])
+def get_photo_cache_stats():
+    return jsonify(current_app.extensions['photo_cache'].stats())
+
+# Endpoint to inspect the Google Places search cache
+@api.route('/stats/search_cache', methods=['GET'])
+def get_search_cache_stats():
+    return jsonify(get_conversation().recommend.rating_api.search_cache.stats())
+
+# Endpoint to inspect the coalescing of identical Google Places requests
+@api.route('/stats/single_flight', methods=['GET'])
+def get_single_flight_stats():
+    rating_api = get_conversation().recommend.rating_api
+    return jsonify({"textsearch": rating_api.search_flights.stats(), "details": rating_api.details_flights.stats()})
+
+# Endpoint to inspect the Google Places transport: requests, circuit breakers and hedging
+@api.route('/stats/transport', methods=['GET'])
+def get_transport_stats():
+    return jsonify(get_conversation().recommend.rating_api.transport.stats())
+
+# Endpoint to get the size of the geo index of known restaurants
+@api.route('/stats/geo_index', methods=['GET'])
+def get_geo_index_stats():
+    return jsonify(get_conversation().recommend.geo_index.stats())
+
+# Endpoint to inspect the local catalog of restaurants
+@api.route('/stats/catalog', methods=['GET'])
+def get_catalog_stats():
+    return jsonify(get_conversation().recommend.catalog.stats())
+
+# Endpoint to expose the metrics in the Prometheus text format
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled."}), 404
+    return current_app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Endpoint to inspect the recommendation writer
+@api.route('/stats/recommendation_writer', methods=['GET'])
+def get_recommendation_writer_stats():
+    return jsonify(current_app.extensions['recommendation_writer'].stats())
+
+# --------------------------------
+# CLI commands
+# --------------------------------
+# Export the recommendation history, e.g.
+# flask --app flask_app export-recommendations --format csv --output history.csv
+@api.cli.command('export-recommendations')
+@click.option('--format', 'format', type=click.Choice(list(FORMATS)), default='ndjson')
+@click.option('--user-id', help='Only export the recommendations of this user.')
+@click.option('--since', type=click.DateTime(), help='Only export recommendations created at or after this time.')
+@click.option('--until', type=click.DateTime(), help='Only export recommendations created before this time.')
+@click.option('--output', type=click.File('w'), default='-', help='Output file, stdout by default.')
+def export_recommendations_command(format, user_id, since, until, output):
+    """Export the recommendation history as NDJSON or CSV"""
+    exporter = current_app.extensions['export']
+    for chunk in exporter.stream(format, user_id=user_id, since=since, until=until):
+        output.write(chunk)
+
+
+# The app used by the WSGI server and the flask CLI
+app = create_app()
 
 # Start the Flask app if in development mode
 if __name__ == '__main__':
     # When running locally, enable debug mode for development
     app.run(debug=True)
-
-
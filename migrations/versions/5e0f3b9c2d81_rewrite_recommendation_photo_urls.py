@@ -0,0 +1,66 @@
+"""rewrite recommendation photo urls
+
+Revision ID: 5e0f3b9c2d81
+Revises: a74bab0c01d2
+Create Date: 2026-10-18 16:02:51.118734
+
+"""
+import os
+from urllib.parse import urlsplit, parse_qs, quote
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0f3b9c2d81'
+down_revision = 'a74bab0c01d2'
+branch_labels = None
+depends_on = None
+
+# Stored recommendations link the Google photo URL, with the API key in it.
+# They are rewritten to the /photos proxy, at one of its widths.
+GOOGLE_PHOTO_URL = 'https://maps.googleapis.com/maps/api/place/photo'
+PHOTO_WIDTHS = (100, 200, 400, 800, 1600)
+
+recommendation = sa.table('recommendation', sa.column('id', sa.Integer), sa.column('photo_url', sa.String))
+
+
+def proxy_url(photo_url):
+    query = parse_qs(urlsplit(photo_url).query)
+    if not query.get('photo_reference'):
+        return None
+    try:
+        maxwidth = int(query.get('maxwidth', ['400'])[0])
+    except ValueError:
+        maxwidth = 400
+    maxwidth = next((width for width in PHOTO_WIDTHS if width >= maxwidth), PHOTO_WIDTHS[-1])
+    return f"{os.getenv('PHOTO_PROXY_URL', '')}/photos/{quote(query['photo_reference'][0], safe='')}?maxwidth={maxwidth}"
+
+
+def google_url(photo_url):
+    parts = urlsplit(photo_url)
+    query = parse_qs(parts.query)
+    photo_reference = parts.path.rsplit('/', 1)[-1]
+    return f"{GOOGLE_PHOTO_URL}?maxwidth={query.get('maxwidth', ['400'])[0]}&photo_reference={photo_reference}&key={os.getenv('GOOGLE_API_KEY', '')}"
+
+
+def rewrite(pattern, convert):
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(recommendation.c.id, recommendation.c.photo_url).where(recommendation.c.photo_url.like(pattern))
+    ).all()
+    updates = [{'row_id': row.id, 'new_url': url} for row in rows if (url := convert(row.photo_url))]
+    if updates:
+        connection.execute(
+            recommendation.update().where(recommendation.c.id == sa.bindparam('row_id')).values(photo_url=sa.bindparam('new_url')),
+            updates
+        )
+
+
+def upgrade():
+    rewrite(GOOGLE_PHOTO_URL + '?%', proxy_url)
+
+
+def downgrade():
+    # The API key is not stored, the Google URLs get the current GOOGLE_API_KEY
+    rewrite('%/photos/%', google_url)
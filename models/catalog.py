@@ -0,0 +1,56 @@
+from models.db import db  # Import the shared db instance
+from datetime import datetime
+from sqlalchemy import event, DDL
+
+# ------------------------------------------
+# Catalog Models
+# ------------------------------------------
+# These models store the restaurants of the Google Places search results
+# (the local catalog, see modules/Catalog.py): one row per place, its
+# types, its review snippets and the locations of the searches that
+# found it. The catalog_fts table is an SQLite FTS5 index over the name,
+# types and reviews of every place, its rowid is the id of the place. It
+# is kept up to date by the catalog, and only created on SQLite.
+# ------------------------------------------
+CATALOG_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5("
+    "name, types, reviews, tokenize = 'porter unicode61 remove_diacritics 2')"
+)
+
+
+class CatalogPlace(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    place_id = db.Column(db.String(100), nullable=False, unique=True)
+    name = db.Column(db.String(200), nullable=False)
+    address = db.Column(db.String(500))
+    rating = db.Column(db.Float)
+    user_ratings_total = db.Column(db.Integer)
+    price_level = db.Column(db.Integer)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # Looked up by the /photos proxy, see RatingApi.served_photo
+    photo_reference = db.Column(db.String(500), index=True)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class CatalogPlaceType(db.Model):
+    place_id = db.Column(db.Integer, db.ForeignKey('catalog_place.id'), primary_key=True)
+    type = db.Column(db.String(100), primary_key=True)
+
+
+class CatalogPlaceLocation(db.Model):
+    # The location asked for in the search, e.g. 'near me'
+    location = db.Column(db.String(200), primary_key=True)
+    place_id = db.Column(db.Integer, db.ForeignKey('catalog_place.id'), primary_key=True)
+
+
+class CatalogReview(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    place_id = db.Column(db.Integer, db.ForeignKey('catalog_place.id'), nullable=False, index=True)
+    text = db.Column(db.Text, nullable=False)
+    rating = db.Column(db.Integer)
+
+
+# The FTS5 table is not a model, create it together with the places
+event.listen(CatalogPlace.__table__, 'after_create', DDL(CATALOG_FTS_DDL).execute_if(dialect='sqlite'))
+event.listen(CatalogPlace.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS catalog_fts").execute_if(dialect='sqlite'))
@@ -0,0 +1,16 @@
+from models.db import db  # Import the shared db instance
+from datetime import datetime
+
+# ------------------------------------------
+# Conversation State Model
+# ------------------------------------------
+# This model stores the server-side conversation state, one compact
+# JSON record per user_id. The version is increased on every write so
+# that cached copies in other workers can be detected as outdated.
+# ------------------------------------------
+class ConversationState(db.Model):
+    user_id = db.Column(db.String(50), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
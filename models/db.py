@@ -1,3 +1,40 @@
+import asyncio
+from flask import has_app_context
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy() 
\ No newline at end of file
+db = SQLAlchemy()
+
+# Databases with INSERT ... ON CONFLICT, which the stores use for upserts
+UPSERT_DIALECTS = ('sqlite', 'postgresql')
+
+
+def upsert(table, bind=None):
+    """
+    An INSERT for the dialect of the database (of bind, or the app's), with
+    on_conflict_do_update and on_conflict_do_nothing.
+    Raises NotImplementedError for databases other than SQLite and PostgreSQL.
+    """
+    dialect = (bind if bind is not None else db.engine).dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"Upserts need one of {', '.join(UPSERT_DIALECTS)}, the database is {dialect}")
+    return insert(table)
+
+
+async def in_thread(fn, *args):
+    """
+    Run a blocking database call from async code in a worker thread.
+    The Flask context is carried over, and the session's connection is
+    released afterwards so it is not held while waiting for other I/O.
+    """
+    def call():
+        try:
+            return fn(*args)
+        finally:
+            if has_app_context():
+                db.session.close()
+
+    return await asyncio.to_thread(call)
@@ -0,0 +1,12 @@
+from models.db import db  # Import the shared db instance
+
+# ------------------------------------------
+# Id Block Model
+# ------------------------------------------
+# This model hands out blocks of primary keys (hi/lo allocation), so
+# rows that are written behind can get their id before they are
+# inserted. next_value is the first id of the next free block.
+# ------------------------------------------
+class IdBlock(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
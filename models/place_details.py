@@ -0,0 +1,22 @@
+from models.db import db  # Import the shared db instance
+from datetime import datetime
+
+# ------------------------------------------
+# Place Details Model
+# ------------------------------------------
+# This model stores the Google place details (website and maps URL)
+# per place_id, so they only have to be fetched from Google again
+# once they are older than the refresh-after period.
+# ------------------------------------------
+class PlaceDetails(db.Model):
+    place_id = db.Column(db.String(100), primary_key=True)
+    website_url = db.Column(db.String(500))
+    maps_url = db.Column(db.String(500))
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        """Convert the details to the URLs merged into search results"""
+        return {
+            'website_url': self.website_url or '',
+            'maps_url': self.maps_url or ''
+        }
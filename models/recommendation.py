@@ -8,6 +8,13 @@ from datetime import datetime
 # in the database.
 # ------------------------------------------
 class Recommendation(db.Model):
+    __table_args__ = (
+        # Serves the per-user history, newest first
+        db.Index('ix_recommendation_user_id_created_at', 'user_id', 'created_at'),
+        # Looked up by the /photos proxy, see RatingApi.served_photo
+        db.Index('ix_recommendation_photo_url', 'photo_url'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(50), nullable=False)
     user_name = db.Column(db.String(100))
@@ -35,6 +42,36 @@ class Recommendation(db.Model):
     website_url = db.Column(db.String(500))
     maps_url = db.Column(db.String(500)) 
 
+    @classmethod
+    def history(cls, user_id: str, limit: int, before: str = None):
+        """
+        Get the latest recommendations of a user, newest first, using keyset
+        pagination. Pass the returned cursor as before to get the next page.
+        Returns (recommendations, cursor), the cursor is None on the last page.
+        """
+        query = cls.query.filter(cls.user_id == user_id)
+        if before:
+            created_at, id = cls.parse_cursor(before)
+            query = query.filter(db.tuple_(cls.created_at, cls.id) < db.tuple_(created_at, id))
+
+        # Fetch one more row to know if there is another page
+        recommendations = query.order_by(cls.created_at.desc(), cls.id.desc()).limit(limit + 1).all()
+        if len(recommendations) <= limit:
+            return recommendations, None
+
+        recommendations = recommendations[:limit]
+        return recommendations, recommendations[-1].cursor()
+
+    def cursor(self) -> str:
+        """Keyset cursor pointing at this recommendation"""
+        return f"{self.created_at.isoformat()}_{self.id}"
+
+    @staticmethod
+    def parse_cursor(cursor: str):
+        """Split a cursor into its created_at and id, raises ValueError if invalid"""
+        created_at, id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(id)
+
     def to_dict(self):
         """Convert the recommendation to a dictionary"""
         return {
@@ -0,0 +1,165 @@
+import io
+import sys
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException
+from models.db import in_thread
+
+# ------------------------------------------
+# ASGI Module
+# ------------------------------------------
+# This module serves the Flask app to an ASGI server (see asgi.py).
+# Endpoints with an async view, like the final /conversation turn that
+# waits for Google Places, run on the event loop, so one process can
+# keep hundreds of them open. Their Flask request context is pushed in
+# the asyncio task and blocking work (state, SQLite) is done in worker
+# threads. All other endpoints are handled by the regular Flask app in
+# a worker thread, streamed responses included.
+# ------------------------------------------
+class AsgiApp:
+    def __init__(self, app, async_views: dict = None, threads: int = 32, on_shutdown: list = None):
+        self.app = app
+        self.async_views = async_views or {}  # endpoint -> async view
+        self.threads = threads
+        self.on_shutdown = on_shutdown or []  # coroutine functions awaited when the server stops
+        self.executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        if self.executor is None:
+            self.start()
+
+        environ = self.make_environ(scope, await self.read_body(receive))
+        view = self.async_view(environ)
+        if view is None:
+            await self.call_wsgi(environ, send)
+        else:
+            await self.call_async(view, environ, send)
+
+    def start(self):
+        # Worker threads for the blocking parts, used by asyncio.to_thread
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+        asyncio.get_running_loop().set_default_executor(self.executor)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for callback in self.on_shutdown:
+                    await callback()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    def make_environ(scope, body: bytes) -> dict:
+        """The WSGI environ of an ASGI http scope (PEP 3333)"""
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+            'PATH_INFO': scope['path'].encode().decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = f'HTTP_{name}'
+            value = value.decode('latin-1')
+            environ[name] = f'{environ[name]},{value}' if name in environ else value
+        return environ
+
+    def async_view(self, environ: dict):
+        """The async view of the request's endpoint, if it has one"""
+        if not self.async_views:
+            return None
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        return self.async_views.get(endpoint)
+
+    async def call_async(self, view, environ: dict, send):
+        """Handle a request like Flask's wsgi_app, but await the view"""
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**ctx.request.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = await in_thread(app.finalize_request, rv)
+            except Exception as e:
+                error = e
+                response = await in_thread(app.handle_exception, e)
+
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.to_wsgi_list()],
+            })
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+            response.close()
+        finally:
+            ctx.pop(error)
+
+    async def call_wsgi(self, environ: dict, send):
+        """Run the Flask app in worker threads and stream its response"""
+        loop = asyncio.get_running_loop()
+        # One context for the whole request, so streamed responses keep
+        # their Flask context between chunks
+        context = contextvars.copy_context()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None
+
+        def run(fn, *args):
+            return loop.run_in_executor(None, context.run, fn, *args)
+
+        iterable = await run(self.app, environ, start_response)
+        try:
+            iterator = iter(iterable)
+            chunk = await run(next, iterator, None)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not None:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await run(next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                await run(iterable.close)
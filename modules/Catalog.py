@@ -0,0 +1,252 @@
+import re
+import json
+import threading
+from flask import has_app_context
+from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+from models.db import db, upsert
+from modules.Metrics import metrics
+from models.catalog import CatalogPlace, CatalogPlaceLocation, CatalogPlaceType, CatalogReview
+
+# ------------------------------------------
+# Catalog Module
+# ------------------------------------------
+# This module keeps a local catalog of the restaurants Google Places
+# returned, so later searches for the same cuisine and location can be
+# answered from the database. Every search result is stored in the
+# catalog tables (place, types, review snippets and the location asked
+# for) and in an FTS5 index over the name, types and reviews. A search
+# takes the places found for the same location whose index matches the
+# cuisine and whose types or reviews match the other terms (dietary and
+# atmosphere), most rated first, so a vegan user is not served places
+# found for another search. Budget is left to the Scorer. Places that were not seen in a
+# search result for max_age are not used anymore, except as a fallback
+# while Google Places can't be reached.
+# The catalog needs SQLite (FTS5 and its JSON functions); on other
+# databases it is off, every search goes to Google Places.
+# ------------------------------------------
+# Search results are often served from the search cache, places stored
+# more recently than this are not written again
+INGEST_INTERVAL = timedelta(hours=1)
+
+
+def normalise_location(location) -> str:
+    return " ".join(str(location or "").lower().split())
+
+
+def match_terms(text, columns: str = '') -> str:
+    """
+    The words of a text as quoted FTS5 terms, so no word is read as an
+    operator, each limited to the columns (e.g. '{types reviews} : ') if given
+    """
+    return " ".join(f'{columns}"{word}"' for word in re.findall(r'\w+', str(text or '').lower()))
+
+
+class Catalog:
+    def __init__(self, min_results: int = 10, max_results: int = 60, max_age: timedelta = timedelta(days=7)):
+        self.min_results = min_results
+        self.max_results = max_results
+        self.max_age = max_age
+
+        self.counters = {'searches': 0, 'hits': 0, 'thin': 0, 'ingested': 0, 'errors': 0, 'fallbacks': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    @staticmethod
+    def available() -> bool:
+        """True in an app context on SQLite, the only database the catalog runs on"""
+        return has_app_context() and db.engine.dialect.name == 'sqlite'
+
+    def search(self, cuisine: str, location: str, fallback: bool = False, terms: tuple = ()):
+        """
+        The best matching places for a cuisine in a location as search
+        results, or None if the catalog has fewer than min_results fresh ones.
+        The types or reviews of the places must match the other terms too
+        (e.g. the dietary preference). As a fallback any matching places
+        are used, however old.
+        """
+        location = normalise_location(location)
+        if (self.min_results < 1 and not fallback) or not location or not self.available():
+            return None
+
+        # The best places found for the location, matching the cuisine and
+        # terms if there are any, and then their types and reviews, in one statement
+        query = " ".join(filter(None, [match_terms(cuisine)] + [match_terms(term, '{types reviews} : ') for term in terms]))
+        best = (
+            "SELECT catalog_place.id FROM catalog_place_location"
+            " JOIN catalog_place ON catalog_place.id = catalog_place_location.place_id"
+        )
+        if query:
+            best += " JOIN catalog_fts ON catalog_fts.rowid = catalog_place.id AND catalog_fts MATCH :query"
+        best += (
+            " WHERE catalog_place_location.location = :location AND catalog_place.fetched_at >= :fresh_since"
+            " ORDER BY catalog_place.user_ratings_total DESC, catalog_place.id LIMIT :limit"
+        )
+        sql = (
+            f"WITH best AS ({best})"
+            " SELECT catalog_place.*,"
+            " (SELECT json_group_array(type) FROM catalog_place_type"
+            "  WHERE catalog_place_type.place_id = catalog_place.id) AS types,"
+            " (SELECT json_group_array(json_object('text', text, 'rating', rating)) FROM"
+            "  (SELECT text, rating FROM catalog_review WHERE catalog_review.place_id = catalog_place.id ORDER BY id)) AS reviews"
+            " FROM best JOIN catalog_place ON catalog_place.id = best.id"
+            " ORDER BY catalog_place.user_ratings_total DESC, catalog_place.id"
+        )
+
+        self.count('searches')
+        try:
+            with metrics.span('catalog_search'):
+                rows = db.session.execute(db.text(sql), {
+                    'query': query,
+                    'location': location,
+                    'fresh_since': datetime.min if fallback else datetime.utcnow() - self.max_age,
+                    'limit': self.max_results,
+                }).all()
+        except SQLAlchemyError:
+            db.session.rollback()
+            self.count('errors')
+            return None
+
+        if fallback:
+            if not rows:
+                return None
+            self.count('fallbacks')
+        elif len(rows) < self.min_results:
+            self.count('thin')
+            return None
+        else:
+            self.count('hits')
+        return [self.search_result(row) for row in rows]
+
+    @staticmethod
+    def search_result(row):
+        """Convert a found place back to the shape of a Google Places search result"""
+        result = {
+            'place_id': row.place_id,
+            'name': row.name,
+            'formatted_address': row.address,
+            'types': json.loads(row.types),
+            'reviews': json.loads(row.reviews),
+        }
+        for key in ('rating', 'user_ratings_total', 'price_level'):
+            if getattr(row, key) is not None:
+                result[key] = getattr(row, key)
+        if row.latitude is not None and row.longitude is not None:
+            result['geometry'] = {'location': {'lat': row.latitude, 'lng': row.longitude}}
+        if row.photo_reference:
+            result['photos'] = [{'photo_reference': row.photo_reference}]
+        return result
+
+    def ingest(self, results: list, location: str):
+        """Store the places of Google Places search results for a location and index them"""
+        places = {result['place_id']: result for result in results if result.get('place_id') and result.get('name')}
+        location = normalise_location(location)
+        if not places or not location or not self.available():
+            return 0
+
+        now = datetime.utcnow()
+        try:
+            with metrics.span('catalog_ingest'):
+                recent = set(db.session.execute(
+                    db.select(CatalogPlace.place_id)
+                    .join(CatalogPlaceLocation, db.and_(
+                        CatalogPlaceLocation.place_id == CatalogPlace.id, CatalogPlaceLocation.location == location
+                    ))
+                    .where(CatalogPlace.place_id.in_(list(places)), CatalogPlace.fetched_at >= now - INGEST_INTERVAL)
+                ).scalars())
+                places = {place_id: result for place_id, result in places.items() if place_id not in recent}
+                if not places:
+                    return 0
+
+                stmt = upsert(CatalogPlace).values([self.place_row(result, now) for result in places.values()])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['place_id'],
+                    set_={column: stmt.excluded[column] for column in (
+                        'name', 'address', 'rating', 'user_ratings_total', 'price_level',
+                        'latitude', 'longitude', 'photo_reference', 'fetched_at'
+                    )}
+                )
+                db.session.execute(stmt)
+                ids = dict(db.session.execute(
+                    db.select(CatalogPlace.place_id, CatalogPlace.id).where(CatalogPlace.place_id.in_(list(places)))
+                ).all())
+
+                # Add the location, replace the types, reviews and index entries of the places
+                id_list = list(ids.values())
+                db.session.execute(
+                    upsert(CatalogPlaceLocation).on_conflict_do_nothing(),
+                    [{'location': location, 'place_id': id} for id in id_list]
+                )
+                db.session.execute(db.delete(CatalogPlaceType).where(CatalogPlaceType.place_id.in_(id_list)))
+                db.session.execute(db.delete(CatalogReview).where(CatalogReview.place_id.in_(id_list)))
+                db.session.execute(
+                    db.text("DELETE FROM catalog_fts WHERE rowid IN (SELECT value FROM json_each(:ids))"),
+                    {'ids': json.dumps(id_list)}
+                )
+
+                types = [
+                    {'place_id': ids[place_id], 'type': type}
+                    for place_id, result in places.items() for type in dict.fromkeys(result.get('types') or [])
+                ]
+                reviews = [
+                    {'place_id': ids[place_id], 'text': review['text'], 'rating': review.get('rating')}
+                    for place_id, result in places.items() for review in result.get('reviews') or [] if review.get('text')
+                ]
+                if types:
+                    db.session.execute(db.insert(CatalogPlaceType), types)
+                if reviews:
+                    db.session.execute(db.insert(CatalogReview), reviews)
+                db.session.execute(
+                    db.text("INSERT INTO catalog_fts (rowid, name, types, reviews) VALUES (:id, :name, :types, :reviews)"),
+                    [
+                        {
+                            'id': ids[place_id],
+                            'name': result['name'],
+                            'types': " ".join(result.get('types') or []),
+                            'reviews': " ".join(review['text'] for review in result.get('reviews') or [] if review.get('text')),
+                        }
+                        for place_id, result in places.items()
+                    ]
+                )
+                db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            self.count('errors')
+            return 0
+
+        self.count('ingested', len(places))
+        return len(places)
+
+    @staticmethod
+    def place_row(result: dict, now: datetime):
+        location = (result.get('geometry') or {}).get('location') or {}
+        photos = result.get('photos') or []
+        return {
+            'place_id': result['place_id'],
+            'name': result['name'],
+            'address': result.get('formatted_address'),
+            'rating': result.get('rating'),
+            'user_ratings_total': result.get('user_ratings_total'),
+            'price_level': result.get('price_level'),
+            'latitude': location.get('lat'),
+            'longitude': location.get('lng'),
+            'photo_reference': photos[0].get('photo_reference') if photos else None,
+            'fetched_at': now,
+        }
+
+    def stats(self):
+        """The counters and the number of places, fresh ones separately"""
+        with self.lock:
+            stats = dict(self.counters)
+        if has_app_context():
+            try:
+                stats['places'] = db.session.scalar(db.select(db.func.count(CatalogPlace.id)))
+                stats['fresh_places'] = db.session.scalar(
+                    db.select(db.func.count(CatalogPlace.id)).where(CatalogPlace.fetched_at >= datetime.utcnow() - self.max_age)
+                )
+            except SQLAlchemyError:
+                db.session.rollback()
+        return stats
@@ -1,20 +1,32 @@
-from flask import session, jsonify
+import os
+import threading
+from flask import jsonify
+from models.db import in_thread
+from modules.Metrics import metrics
 from modules.Response import Response
 from modules.Sentiment import Sentiment
-from modules.Recommend import Recommend
+from modules.ConversationStore import ConversationStore
 
 # ------------------------------------------
 # Conversation Module
 # ------------------------------------------
 # This module is responsible for the conversation flow
 # It uses the Sentiment and Response modules to generate responses
-# It also uses the Recommend module to generate recommendations
+# It also uses the Recommend module to generate recommendations,
+# which is only loaded (with Google Places and NumPy) when it is first
+# needed. process_input_async awaits the Google requests of the final
+# turn instead of blocking on them (see asgi.py).
 # ------------------------------------------
 class Conversation(Sentiment, Response):
-    def __init__(self):
+    def __init__(self, store: ConversationStore = None, writer=None):
         Sentiment.__init__(self)  # Initialize Sentiment
         Response.__init__(self)   # Initialize Response
-        self.recommend = Recommend()
+        self.store = store or ConversationStore(max_entries=int(os.getenv('CONVERSATION_CACHE_SIZE', 1024)))  # Server-side conversation state
+
+        # Built on first use, see the recommend property
+        self.writer = writer
+        self._recommend = None
+        self.recommend_lock = threading.Lock()
 
         # Define the conversation flow as a list of steps
         self.conversation_flow = [
@@ -90,7 +102,7 @@ class Conversation(Sentiment, Response):
     def get_current_step(self, user_id: str):
         """Get the current step of the conversation"""
         
-        return session.get(f'current_step_{user_id}', 0)
+        return self.store.get(user_id, 'current_step', 0)
 
     # Helper function: advance conversation state
     def advance_step(self, user_id: str):
@@ -98,19 +110,19 @@ class Conversation(Sentiment, Response):
 
         current = self.get_current_step(user_id)
         if current < len(self.conversation_flow) - 1:
-            session[f'current_step_{user_id}'] = current + 1
+            self.store.set(user_id, 'current_step', current + 1)
         else:
             # Stay at the last step if completed
-            session[f'current_step_{user_id}'] = current
+            self.store.set(user_id, 'current_step', current)
     
     def get_next_step(self, next_step: int, user_id: str):
         """Get the next step of the conversation"""
-        is_urgent = session.get(f'is_urgent_{user_id}', False)
+        is_urgent = self.store.get(user_id, 'is_urgent', False)
 
         while next_step < len(self.conversation_flow):
             
             # Check if the next step is already answered in a previous step
-            if self.conversation_flow[next_step]["state"] in session.get(f'user_info_{user_id}', {}):
+            if self.conversation_flow[next_step]["state"] in self.store.get(user_id, 'user_info', {}):
                 next_step += 1
             else:
                 if is_urgent and not self.conversation_flow[next_step]["is_essential"]:
@@ -120,6 +132,16 @@ class Conversation(Sentiment, Response):
 
         return next_step
     
+    @property
+    def recommend(self):
+        """The recommendation engine, built on first use"""
+        if self._recommend is None:
+            with self.recommend_lock:
+                if self._recommend is None:
+                    from modules.Recommend import Recommend
+                    self._recommend = Recommend(writer=self.writer)
+        return self._recommend
+
     def start_conversation(self, user_id: str, user_name: str="Mr. Food"):
         """
         Start or reset the conversation.
@@ -127,12 +149,15 @@ class Conversation(Sentiment, Response):
         """
         
         # Initialize or reset the conversation for this user
-        session[f'responses_{user_id}'] = {}
-        session[f'user_info_{user_id}'] = {}
-        session[f'current_step_{user_id}'] = 0
-        session[f'is_urgent_{user_id}'] = False
-        session[f'sentiment_{user_id}'] = 'neutral'
-        session[f'user_name_{user_id}'] = user_name
+        self.store.reset(user_id, {
+            'responses': {},
+            'user_info': {},
+            'slots': {},
+            'current_step': 0,
+            'is_urgent': False,
+            'sentiment': 'neutral',
+            'user_name': user_name,
+        })
 
         return {
             "user_id": user_id,
@@ -141,56 +166,108 @@ class Conversation(Sentiment, Response):
             "next_question": self.conversation_flow[0]["question"](user_name)
         }
     
-    def process_input(self, user_text: str, user_id: str):
+    def process_input(self, user_text: str, user_id: str, coordinates: list = None):
         """
         Process user input and return the next question
         This method is called via the /process_input endpoint
         """
 
+        return jsonify(self.process_turn(user_text, user_id, coordinates)), 200
+
+    def process_turn(self, user_text: str, user_id: str, coordinates: list = None) -> dict:
+        """
+        Process one user input and return the reply as a dict.
+        Also used for the turns of the /conversation/batch endpoint
+        """
+
+        reply = self.answer_turn(user_text, user_id, coordinates)
+        if reply is not None:
+            return reply
+
+        # If we have all essential info, make a recommendation
+        # and keep the full ranking to page through alternatives later
+        with metrics.span('ranking'):
+            ranking = self.recommend.rank_candidates(
+                self.store.get(user_id, 'user_info', {}), coordinates=self.store.get(user_id, 'coordinates')
+            )
+        return self.recommendation_reply(user_id, ranking)
+
+    async def process_input_async(self, user_text: str, user_id: str, coordinates: list = None):
+        """
+        Async version of process_input for the ASGI app. Only the Google
+        requests are awaited, the conversation state and the database are
+        handled in worker threads.
+        """
+
+        reply = await in_thread(self.answer_turn, user_text, user_id, coordinates)
+        if reply is None:
+            recommend = await in_thread(lambda: self.recommend)  # Loaded on first use
+            with metrics.span('ranking'):
+                ranking = await recommend.rank_candidates_async(
+                    self.store.get(user_id, 'user_info', {}), coordinates=self.store.get(user_id, 'coordinates')
+                )
+            reply = await in_thread(self.recommendation_reply, user_id, ranking)
+        return jsonify(reply), 200
+
+    def answer_turn(self, user_text: str, user_id: str, coordinates: list = None):
+        """
+        Store the user input and return the reply with the next question,
+        or None if all questions are answered and a recommendation is due
+        """
+
+        # The latest location the user shared, used for nearby recommendations
+        if coordinates:
+            self.store.set(user_id, 'coordinates', list(coordinates))
+
         current_step = self.get_current_step(user_id)
         current_state = self.conversation_flow[current_step]["state"]
 
         # Extract any essential info from current response
-        responses = session.get(f'responses_{user_id}', {})
+        responses = self.store.get(user_id, 'responses', {})
         responses[current_state] = user_text
-        session[f'responses_{user_id}'] = responses
+        self.store.set(user_id, 'responses', responses)
  
         # Only analyse sentiment after the greeting
         if current_state != "greet":
-            sentiment = session.get(f'sentiment_{user_id}', 'neutral')
-            is_urgent = session.get(f'is_urgent_{user_id}', False)
+            sentiment = self.store.get(user_id, 'sentiment', 'neutral')
+            is_urgent = self.store.get(user_id, 'is_urgent', False)
         else:
             # First user input - analyse sentiment and urgency
-            is_urgent = self.analyze_urgency(user_text)
-            sentiment = "urgent" if is_urgent else self.analyze_sentiment(user_text)
+            with metrics.span('urgency'):
+                is_urgent = self.analyze_urgency(user_text)
+            if is_urgent:
+                sentiment = "urgent"
+            else:
+                with metrics.span('sentiment'):
+                    sentiment = self.analyze_sentiment(user_text)
             
-            # Store in session
-            session[f'sentiment_{user_id}'] = sentiment
-            session[f'is_urgent_{user_id}'] = is_urgent
+            # Store in the conversation state
+            self.store.set(user_id, 'sentiment', sentiment)
+            self.store.set(user_id, 'is_urgent', is_urgent)
 
         # Get next question based on current state
         next_step = current_step + 1
 
         # Skip question if it's an already answered essential question or if
         # the user is in urgent mode and the question is not essential
-        self.check_responses(responses=responses, user_id=user_id)
-        if session.get(f'user_info_{user_id}'):
+        self.check_response(state=current_state, user_text=user_text, user_id=user_id)
+        if self.store.get(user_id, 'user_info'):
             next_step = self.get_next_step(next_step=next_step, user_id=user_id)
 
 
         # If the current step is an essential step but no user info is stored, repeat the question
-        if self.conversation_flow[current_step]["is_essential"] and current_state not in session.get(f'user_info_{user_id}').keys():
-            return jsonify({
+        if self.conversation_flow[current_step]["is_essential"] and current_state not in self.store.get(user_id, 'user_info').keys():
+            return {
                 "user_id": user_id,
                 "state": current_state,
                 "sentiment": sentiment,
                 "current_step": current_step,
                 "current_conversation": responses,
-                "user_info": session.get(f'user_info_{user_id}', {}),
+                "user_info": self.store.get(user_id, 'user_info', {}),
                 "next_state": self.conversation_flow[next_step]["state"],
                 "question": self.conversation_flow[current_step]["question"],
                 "next_question": self.conversation_flow[current_step]["specify_question"],
-            }), 200
+            }
 
         if next_step < len(self.conversation_flow):
             question = self.conversation_flow[next_step]["question"]
@@ -215,32 +292,72 @@ class Conversation(Sentiment, Response):
             # Advance to the next step
             self.advance_step(user_id)
 
-            return jsonify({
+            return {
                 "user_id": user_id,
                 "sentiment": sentiment,
                 "current_step": current_step,
                 "next_question": next_question,
                 "current_conversation": responses,
-                "user_info": session.get(f'user_info_{user_id}', {}),
+                "user_info": self.store.get(user_id, 'user_info', {}),
                 "next_state": self.conversation_flow[next_step]["state"],
-            }), 200
-        else:
-            # If we have all essential info, make a recommendation
-            user_info = session.get(f'user_info_{user_id}', {})
-            recommendation = self.recommend.get_recommendation(user_info, user_id)
-            if recommendation:
-                return jsonify({
-                    "response": f"I recommend {recommendation['restaurant_name']}!",
-                    "recommendation": recommendation,
-                    "current_conversation": responses,
-                    "user_id": user_id,
-                    "user_info": user_info
-                }), 200
-                
-            # If the conversation is complete, return the final response
-            return jsonify({
-                "response": "Could not find a restaurant that matches your preferences. Please try again with different preferences.",
-                "sentiment": sentiment,
+            }
+
+        # All questions are answered, a recommendation is due
+        return None
+
+    def recommendation_reply(self, user_id: str, ranking: dict):
+        """Store the ranking and serve its best candidate"""
+
+        user_info = self.store.get(user_id, 'user_info', {})
+        responses = self.store.get(user_id, 'responses', {})
+        self.store.set(user_id, 'ranking', ranking)
+        self.store.set(user_id, 'ranking_offset', 0)
+
+        recommendation = self.recommend.serve_candidate(ranking, 0, user_id, user_name=self.store.get(user_id, 'user_name', ''))
+        if recommendation:
+            return {
+                "response": f"I recommend {recommendation['restaurant_name']}!",
+                "recommendation": recommendation,
                 "current_conversation": responses,
-            }), 200
+                "user_id": user_id,
+                "user_info": user_info
+            }
+            
+        # If the conversation is complete, return the final response
+        return {
+            "response": "Could not find a restaurant that matches your preferences. Please try again with different preferences.",
+            "sentiment": self.store.get(user_id, 'sentiment', 'neutral'),
+            "current_conversation": responses,
+        }
         
+
+    def next_recommendation(self, user_id: str, offset: int = None):
+        """
+        Serve the next alternative from the ranking of the user's last search,
+        or the one at offset if given. No new Google Places search is made.
+        This method is called via the /recommendations/<user_id>/next endpoint
+        """
+
+        ranking = self.store.get(user_id, 'ranking')
+        if not ranking:
+            return jsonify({"error": "No recommendations found. Please finish a conversation first."}), 404
+
+        if offset is None:
+            offset = self.store.get(user_id, 'ranking_offset', 0) + 1
+
+        recommendation = self.recommend.serve_candidate(ranking, offset, user_id, user_name=self.store.get(user_id, 'user_name', ''))
+        if not recommendation:
+            return jsonify({
+                "error": "There are no more recommendations for your preferences.",
+                "offset": offset,
+                "total": len(ranking['candidates']),
+            }), 404
+
+        self.store.set(user_id, 'ranking_offset', offset)
+        return jsonify({
+            "response": f"How about {recommendation['restaurant_name']}?",
+            "recommendation": recommendation,
+            "user_id": user_id,
+            "offset": offset,
+            "remaining": len(ranking['candidates']) - offset - 1,
+        }), 200
@@ -0,0 +1,165 @@
+import json
+import threading
+from flask import g
+from models.db import db, upsert
+from modules.Metrics import metrics
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from models.conversation_state import ConversationState
+
+# ------------------------------------------
+# Conversation Store Module
+# ------------------------------------------
+# This module keeps the conversation state on the server instead of in
+# the session cookie. Every user_id has one compact JSON record in the
+# conversation_state table, with an in-memory LRU cache in front of it.
+# Changes are collected during a request and written behind in a single
+# transaction after the request, so the state is shared by all workers.
+# The cache keeps the JSON of the last committed version, every request
+# works on its own copy, so concurrent requests of a user and failed
+# writes do not leak uncommitted changes into it.
+# Records expire after PERMANENT_SESSION_LIFETIME.
+# ------------------------------------------
+class ConversationStore:
+    def __init__(self, max_entries: int = 1024, purge_every: int = 100):
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self.lifetime = timedelta(days=1)
+
+        # user_id -> (version, JSON of the record), least recently used first
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.flushes = 0
+
+    def init_app(self, app):
+        """Register the store with the Flask app"""
+        lifetime = app.config.get('PERMANENT_SESSION_LIFETIME', self.lifetime)
+        self.lifetime = lifetime if isinstance(lifetime, timedelta) else timedelta(seconds=lifetime)
+
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+
+    # Helper function: records used in the current request
+    def loaded(self):
+        if 'conversation_states' not in g:
+            g.conversation_states = {}
+            g.conversation_dirty = set()
+        return g.conversation_states
+
+    def load(self, user_id: str) -> dict:
+        """Get the record of a user, reading it at most once per request"""
+        states = self.loaded()
+        if user_id not in states:
+            with metrics.span('state_read'):
+                states[user_id] = self.read(user_id)
+        return states[user_id]
+
+    def read(self, user_id: str) -> dict:
+        """Read a record, a copy of the cached one if it is still current"""
+        row = db.session.execute(
+            db.select(ConversationState.version, ConversationState.expires_at)
+            .where(ConversationState.user_id == user_id)
+        ).first()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return {}
+
+        with self.lock:
+            cached = self.cache.get(user_id)
+            if cached and cached[0] == row.version:
+                self.cache.move_to_end(user_id)
+                return json.loads(cached[1])
+
+        data = db.session.execute(
+            db.select(ConversationState.data).where(ConversationState.user_id == user_id)
+        ).scalar()
+        if not data:
+            return {}
+        self.remember(user_id, row.version, data)
+        return json.loads(data)
+
+    def remember(self, user_id: str, version: int, data: str):
+        """Cache the JSON of a committed record"""
+        with self.lock:
+            self.cache[user_id] = (version, data)
+            self.cache.move_to_end(user_id)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    def get(self, user_id: str, key: str, default=None):
+        """Get a value from the conversation state of a user"""
+        return self.load(user_id).get(key, default)
+
+    def set(self, user_id: str, key: str, value):
+        """Set a value in the conversation state of a user"""
+        self.load(user_id)[key] = value
+        g.conversation_dirty.add(user_id)
+
+    def reset(self, user_id: str, record: dict):
+        """Replace the whole conversation state of a user"""
+        self.loaded()[user_id] = dict(record)
+        g.conversation_dirty.add(user_id)
+
+    def flush(self):
+        """Write all records changed in this request in one transaction"""
+        dirty = g.get('conversation_dirty')
+        states = g.get('conversation_states', {})
+        if not dirty:
+            return
+        g.conversation_dirty = set()
+
+        now = datetime.utcnow()
+        data = {user_id: json.dumps(states[user_id], separators=(',', ':'), default=str) for user_id in dirty}
+        stmt = upsert(ConversationState).values([
+            {
+                'user_id': user_id,
+                'data': data[user_id],
+                'version': 1,
+                'updated_at': now,
+                'expires_at': now + self.lifetime,
+            }
+            for user_id in dirty
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={
+                'data': stmt.excluded.data,
+                'version': ConversationState.version + 1,
+                'updated_at': stmt.excluded.updated_at,
+                'expires_at': stmt.excluded.expires_at,
+            }
+        )
+
+        with metrics.span('state_write'):
+            try:
+                db.session.execute(stmt)
+                versions = db.session.execute(
+                    db.select(ConversationState.user_id, ConversationState.version)
+                    .where(ConversationState.user_id.in_(dirty))
+                ).all()
+
+                # Remove expired records from time to time
+                self.flushes += 1
+                if self.flushes % self.purge_every == 0:
+                    db.session.execute(db.delete(ConversationState).where(ConversationState.expires_at <= now))
+
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.forget(dirty)
+                raise
+
+        for user_id, version in versions:
+            self.remember(user_id, version, data[user_id])
+
+    def forget(self, user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.cache.pop(user_id, None)
+
+    def after_request(self, response):
+        self.flush()
+        return response
+
+    def teardown_request(self, exc):
+        g.pop('conversation_states', None)
+        g.pop('conversation_dirty', None)
@@ -0,0 +1,94 @@
+import io
+import csv
+import json
+from datetime import datetime
+from models.db import db
+from models.recommendation import Recommendation
+
+# ------------------------------------------
+# Export Module
+# ------------------------------------------
+# This module exports the recommendation history as NDJSON or CSV.
+# Only the exported columns are selected (no ORM objects) and the rows
+# are fetched in batches with a server-side cursor, and written out
+# chunk by chunk, so the memory use does not grow with the number of
+# exported rows.
+# ------------------------------------------
+EXPORT_COLUMNS = (
+    'id', 'user_id', 'user_name', 'created_at', 'restaurant_name', 'cuisine', 'location',
+    'guests', 'dietary', 'booking_time', 'atmosphere', 'budget', 'rating', 'total_ratings',
+    'price_level', 'address', 'place_id', 'photo_url', 'latitude', 'longitude',
+    'website_url', 'maps_url'
+)
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+class Export:
+    def __init__(self, batch_size: int = 1000):
+        # Rows fetched from the database and written per chunk
+        self.batch_size = batch_size
+
+    def rows(self, user_id: str = None, since: datetime = None, until: datetime = None):
+        """Yield the matching recommendations as tuples of EXPORT_COLUMNS, oldest first"""
+        query = db.select(*(getattr(Recommendation, column) for column in EXPORT_COLUMNS))
+        if user_id:
+            query = query.where(Recommendation.user_id == user_id)
+        if since:
+            query = query.where(Recommendation.created_at >= since)
+        if until:
+            query = query.where(Recommendation.created_at < until)
+        query = query.order_by(Recommendation.created_at, Recommendation.id)
+
+        result = db.session.execute(query.execution_options(yield_per=self.batch_size))
+        try:
+            for partition in result.partitions():
+                yield from partition
+        finally:
+            result.close()
+
+    @staticmethod
+    def parse_time(value: str):
+        """Parse an ISO date or datetime filter, raises ValueError if invalid"""
+        return datetime.fromisoformat(value) if value else None
+
+    @staticmethod
+    def convert(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    def write_ndjson(self, rows):
+        """Write the rows as one JSON object per line, in chunks"""
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, map(self.convert, row)))))
+            if len(lines) == self.batch_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    def write_csv(self, rows):
+        """Write the rows as CSV with a header line, in chunks"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+
+        count = 0
+        for row in rows:
+            writer.writerow(map(self.convert, row))
+            count += 1
+            if count == self.batch_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                count = 0
+        yield buffer.getvalue()
+
+    def stream(self, format: str, user_id: str = None, since: datetime = None, until: datetime = None):
+        """Yield the export in the given format ('ndjson' or 'csv') chunk by chunk"""
+        if format not in FORMATS:
+            raise ValueError(f"Unknown export format '{format}'")
+
+        write = self.write_ndjson if format == 'ndjson' else self.write_csv
+        return write(self.rows(user_id, since, until))
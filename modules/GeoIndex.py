@@ -0,0 +1,231 @@
+import math
+import threading
+import numpy as np
+
+# ------------------------------------------
+# Geo Index Module
+# ------------------------------------------
+# This module keeps an in-memory grid index of the restaurants we know,
+# so "near me" requests with coordinates can be answered without a
+# Google Places search. The index is filled from stored recommendations
+# and from search results (see Recommend). Places are bucketed into grid
+# cells of a fixed size in degrees. Every cell keeps the coordinates and
+# cuisines of its places as arrays, rebuilt when the cell changes, so a
+# radius query gathers the cells overlapping the circle and filters them
+# with vectorised operations. A k-nearest query runs radius queries with
+# a doubling radius until it has k places. Distances use the
+# equirectangular approximation at the query's latitude, which is
+# accurate to well under 1% at city distances. With max_places the
+# places added or updated least recently are dropped beyond that many.
+# ------------------------------------------
+METRES_PER_DEGREE = 111_320
+
+# Fields kept of a place, enough to score and serve it
+PLACE_FIELDS = (
+    'name', 'rating', 'user_ratings_total', 'price_level', 'formatted_address',
+    'place_id', 'geometry', 'types', 'photo_url', 'website_url', 'maps_url'
+)
+
+# Cuisines are kept as bits of a mask, the slot extractor knows far fewer
+MAX_CUISINES = 64
+
+
+def normalise_cuisine(cuisine) -> str:
+    return " ".join(str(cuisine or "").lower().split())
+
+
+class Cell:
+    """The places of one grid cell, with their arrays built on demand"""
+    __slots__ = ('entries', 'arrays')
+
+    def __init__(self):
+        self.entries = {}   # place_id -> (lat, lng, cuisine mask)
+        self.arrays = None  # (place_ids, lats, lngs, masks) arrays, None after a change
+
+    def get_arrays(self):
+        if self.arrays is None:
+            values = list(self.entries.values())
+            self.arrays = (
+                np.array(list(self.entries), dtype=object),
+                np.array([value[0] for value in values], dtype=float),
+                np.array([value[1] for value in values], dtype=float),
+                np.array([value[2] for value in values], dtype=np.uint64),
+            )
+        return self.arrays
+
+
+class GeoIndex:
+    def __init__(self, cell_size: float = 1000.0, max_places: int = None):
+        # Cell size in degrees, cells are narrower in metres away from the equator
+        self.cell = cell_size / METRES_PER_DEGREE
+        self.max_places = max_places
+
+        self.cells = {}   # (row, column) -> Cell
+        self.places = {}  # place_id -> (lat, lng, place, cuisine mask), least recently added first
+        self.cuisine_bits = {}  # cuisine -> bit of the cuisine masks
+        self.bounds = None  # first row, last row, first column, last column with places (or once had)
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def cell_of(self, lat: float, lng: float):
+        return math.floor(lat / self.cell), math.floor(lng / self.cell)
+
+    @staticmethod
+    def location(place: dict):
+        location = (place.get('geometry') or {}).get('location') or {}
+        lat, lng = location.get('lat'), location.get('lng')
+        if lat is None or lng is None:
+            return None
+        return float(lat), float(lng)
+
+    def cuisine_bit(self, cuisine: str, create: bool = False) -> int:
+        """The mask bit of a cuisine, 0 if it is unknown (or there are too many)"""
+        bit = self.cuisine_bits.get(cuisine)
+        if bit is None:
+            if not create or len(self.cuisine_bits) >= MAX_CUISINES:
+                return 0
+            bit = self.cuisine_bits[cuisine] = 1 << len(self.cuisine_bits)
+        return bit
+
+    def add(self, place: dict, cuisine: str = None):
+        """Add or update a place, found for the given cuisine. Places without coordinates are ignored"""
+        location = self.location(place)
+        if location is None or not place.get('place_id'):
+            return False
+
+        place_id = place['place_id']
+        compact = {field: place[field] for field in PLACE_FIELDS if place.get(field) is not None}
+        if place.get('photos'):
+            compact['photos'] = place['photos'][:1]
+        row, column = self.cell_of(*location)
+
+        with self.lock:
+            mask = self.cuisine_bit(normalise_cuisine(cuisine), create=True) if cuisine else 0
+            known = self.places.pop(place_id, None)
+            if known:
+                # Keep the fields that only the older entry has, e.g. the URLs of a recommendation
+                compact = {**known[2], **compact}
+                mask |= known[3]
+                old = self.cells[self.cell_of(known[0], known[1])]
+                del old.entries[place_id]
+                old.arrays = None
+
+            self.places[place_id] = (*location, compact, mask)
+            cell = self.cells.get((row, column))
+            if cell is None:
+                cell = self.cells[(row, column)] = Cell()
+            cell.entries[place_id] = (*location, mask)
+            cell.arrays = None
+
+            if self.bounds is None:
+                self.bounds = (row, row, column, column)
+            else:
+                first_row, last_row, first_column, last_column = self.bounds
+                self.bounds = (min(first_row, row), max(last_row, row), min(first_column, column), max(last_column, column))
+
+            if self.max_places and len(self.places) > self.max_places:
+                self.evict(next(iter(self.places)))
+        return True
+
+    def evict(self, place_id: str):
+        """Drop a place, the lock must be held"""
+        lat, lng, _, _ = self.places.pop(place_id)
+        key = self.cell_of(lat, lng)
+        cell = self.cells[key]
+        del cell.entries[place_id]
+        if cell.entries:
+            cell.arrays = None
+        else:
+            del self.cells[key]
+        self.evictions += 1
+
+    def add_all(self, places: list, cuisine: str = None) -> int:
+        return sum(self.add(place, cuisine) for place in places)
+
+    @staticmethod
+    def distance(lat: float, lng: float, other_lat: float, other_lng: float) -> float:
+        """Distance in metres from the first point, as computed by the queries"""
+        x = (other_lng - lng) * max(math.cos(math.radians(lat)), 0.01)
+        return math.hypot(x, other_lat - lat) * METRES_PER_DEGREE
+
+    def search(self, lat: float, lng: float, radius: float, bit: int):
+        """
+        Squared distances in degrees and place_ids of the places within
+        radius metres with the cuisine bit (any cuisine for bit None)
+        """
+        scale = max(math.cos(math.radians(lat)), 0.01)
+        span_lat = radius / METRES_PER_DEGREE
+        span_lng = span_lat / scale
+        first_row, first_column = self.cell_of(lat - span_lat, lng - span_lng)
+        last_row, last_column = self.cell_of(lat + span_lat, lng + span_lng)
+
+        # Only the cells that can have places
+        bounds = self.bounds
+        rows = range(max(first_row, bounds[0]), min(last_row, bounds[1]) + 1)
+        columns = range(max(first_column, bounds[2]), min(last_column, bounds[3]) + 1)
+        cells = self.cells
+        arrays = [cell.get_arrays() for cell in (cells.get((row, column)) for row in rows for column in columns) if cell]
+        if not arrays:
+            return np.empty(0), np.empty(0, dtype=object)
+
+        place_ids, lats, lngs, masks = (np.concatenate([cell_arrays[i] for cell_arrays in arrays]) for i in range(4))
+        x = (lngs - lng) * scale
+        y = lats - lat
+        squared = x * x + y * y
+
+        selected = squared <= span_lat * span_lat
+        if bit is not None:
+            selected &= (masks & np.uint64(bit)) != 0
+        indices = np.flatnonzero(selected)
+        return squared[indices], place_ids[indices]
+
+    def results(self, squared, place_ids, order):
+        """(distance in metres, place) in the given order"""
+        distances = (np.sqrt(squared[order]) * METRES_PER_DEGREE).tolist()
+        places = self.places
+        return [(distance, places[place_id][2]) for distance, place_id in zip(distances, place_ids[order].tolist())]
+
+    def cuisine_filter(self, cuisine: str):
+        """The bit to filter by, None for any cuisine and 0 if no place has the cuisine"""
+        cuisine = normalise_cuisine(cuisine)
+        return self.cuisine_bit(cuisine) if cuisine else None
+
+    def within(self, lat: float, lng: float, radius: float, cuisine: str = None):
+        """Places within radius metres, optionally found for a cuisine, as (distance, place) nearest first"""
+        with self.lock:
+            bit = self.cuisine_filter(cuisine)
+            if self.bounds is None or bit == 0:
+                return []
+            squared, place_ids = self.search(lat, lng, radius, bit)
+            return self.results(squared, place_ids, np.argsort(squared, kind='stable'))
+
+    def nearest(self, lat: float, lng: float, k: int, max_distance: float = 50_000, cuisine: str = None):
+        """The k nearest places within max_distance metres, optionally found for a cuisine, as (distance, place)"""
+        with self.lock:
+            bit = self.cuisine_filter(cuisine)
+            if self.bounds is None or bit == 0 or k < 1:
+                return []
+
+            # Widen the radius until it holds k places, these are the k nearest
+            radius = min(self.cell * METRES_PER_DEGREE, max_distance)
+            while True:
+                squared, place_ids = self.search(lat, lng, radius, bit)
+                if len(place_ids) >= k or radius >= max_distance:
+                    break
+                radius = min(radius * 2, max_distance)
+
+            order = np.argsort(squared, kind='stable')[:k]
+            return self.results(squared, place_ids, order)
+
+    def __len__(self):
+        return len(self.places)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "places": len(self.places),
+                "max_places": self.max_places,
+                "evictions": self.evictions,
+                "cells": len(self.cells),
+                "cuisines": len(self.cuisine_bits),
+            }
@@ -0,0 +1,196 @@
+import time
+import threading
+from flask import g, request
+from bisect import bisect_left
+from contextvars import ContextVar
+from contextlib import nullcontext
+
+# ------------------------------------------
+# Metrics Module
+# ------------------------------------------
+# This module collects timings and counters of the engine and renders
+# them in the Prometheus text format for the /metrics endpoint.
+# Phases of a turn (slot extraction, sentiment, Places search, details
+# lookups, scoring, SQLite writes, ...) are timed with spans:
+#
+#   with metrics.span('scoring'):
+#       ...
+#
+# and aggregated into one histogram per phase. Outbound Google requests
+# are counted in total and per Flask request, requests saved by sharing
+# an identical one in flight (SingleFlight) in total. The metrics are kept per
+# process. With METRICS_ENABLED=false (see init_app) spans are a shared
+# no-op, nothing is recorded and /metrics is not available.
+# ------------------------------------------
+PREFIX = 'recommendai'
+
+# Bucket bounds in seconds and in outbound requests per request
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+OUTBOUND_ENDPOINTS = ('textsearch', 'details')
+NO_SPAN = nullcontext()
+
+
+def format_labels(labels: tuple, extra: str = '') -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                bucket = format_labels(labels, 'le="%s"' % bound)
+                yield f'{self.name}_bucket{bucket} {cumulative}'
+            yield f'{self.name}_sum{format_labels(labels)} {format_value(series[-1])}'
+            yield f'{self.name}_count{format_labels(labels)} {cumulative}'
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.series = {}  # labels -> value
+
+    def inc(self, labels: tuple, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.series.items()):
+            yield f'{self.name}{format_labels(labels)} {format_value(value)}'
+
+
+class Span:
+    """Times the enclosed block as one observation of a phase"""
+    __slots__ = ('metrics', 'labels', 'start')
+
+    def __init__(self, metrics, phase: str):
+        self.metrics = metrics
+        self.labels = (('phase', phase),)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.metrics.phases, self.labels, time.perf_counter() - self.start)
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+
+        self.phases = Histogram(f'{PREFIX}_phase_seconds', 'Time spent in each phase of the engine.', SECONDS_BUCKETS)
+        self.requests = Histogram(f'{PREFIX}_request_seconds', 'Time to handle a request, by endpoint.', SECONDS_BUCKETS)
+        self.responses = Counter(f'{PREFIX}_requests_total', 'Handled requests, by endpoint and status.')
+        self.outbound = Counter(f'{PREFIX}_outbound_requests_total', 'Requests sent to Google Places, by endpoint.')
+        self.outbound_per_request = Histogram(
+            f'{PREFIX}_outbound_requests_per_request', 'Requests sent to Google Places per request, by endpoint and Places endpoint.', COUNT_BUCKETS
+        )
+        self.coalesced = Counter(
+            f'{PREFIX}_coalesced_requests_total', 'Requests to Google Places saved by sharing an identical request in flight, by endpoint.'
+        )
+        self.metrics = (self.phases, self.requests, self.responses, self.outbound, self.outbound_per_request, self.coalesced)
+
+        # Outbound requests of the current Flask request, by endpoint
+        self.request_outbound = ContextVar('request_outbound', default=None)
+
+    def init_app(self, app):
+        """Time every request of the Flask app, unless METRICS_ENABLED is off"""
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        app.extensions['metrics'] = self
+        if self.enabled:
+            app.before_request(self.before_request)
+            app.after_request(self.after_request)
+            app.teardown_request(self.teardown_request)
+
+    def span(self, phase: str):
+        """Context manager that times a phase"""
+        return Span(self, phase) if self.enabled else NO_SPAN
+
+    def observe(self, histogram: Histogram, labels: tuple, value: float):
+        with self.lock:
+            histogram.observe(labels, value)
+
+    def count_outbound(self, endpoint: str, amount: int = 1):
+        """Count requests sent to Google, also for the current Flask request"""
+        if not self.enabled or not amount:
+            return
+        with self.lock:
+            self.outbound.inc((('endpoint', endpoint),), amount)
+        counts = self.request_outbound.get()
+        if counts is not None:
+            counts[endpoint] = counts.get(endpoint, 0) + amount
+
+    def count_coalesced(self, endpoint: str, amount: int = 1):
+        """Count requests to Google that were not sent because an identical one was in flight"""
+        if not self.enabled or not amount:
+            return
+        with self.lock:
+            self.coalesced.inc((('endpoint', endpoint),), amount)
+
+    def before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_token = self.request_outbound.set({})
+
+    def after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def teardown_request(self, exc):
+        start = g.pop('metrics_start', None)
+        token = g.pop('metrics_token', None)
+        if start is None:
+            return
+
+        elapsed = time.perf_counter() - start
+        counts = self.request_outbound.get() or {}
+        self.request_outbound.reset(token)
+
+        endpoint = request.endpoint or 'unknown'
+        status = 500 if exc is not None else g.pop('metrics_status', 200)
+        with self.lock:
+            self.requests.observe((('endpoint', endpoint),), elapsed)
+            self.responses.inc((('endpoint', endpoint), ('status', status)))
+            for name in OUTBOUND_ENDPOINTS:
+                self.outbound_per_request.observe((('endpoint', endpoint), ('places_endpoint', name)), counts.get(name, 0))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            lines = [line for metric in self.metrics for line in metric.render()]
+        return '\n'.join(lines) + '\n'
+
+
+# Shared instance, like the shared db
+metrics = Metrics()
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import tempfile
+import threading
+from modules.SingleFlight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------
+# Photo Cache Module
+# ------------------------------------------
+# This module keeps the restaurant photos served by /photos on disk, so
+# a photo is fetched from Google Places once and not every time the app
+# shows a recommendation. The directory has two parts:
+# - objects/ab/abcdef...: the photo bytes, named by their SHA-256, so
+#   the same photo is stored once and its name is a strong ETag
+# - refs/12/1234...: a small JSON file per photo reference and width,
+#   with the digest and the content type of its photo
+# Concurrent requests for the same photo wait for the one fetch in
+# flight (SingleFlight). Files are written to a temporary file and
+# renamed, so several workers can share the directory. Serving a photo
+# touches its modification time (at most once per touch_interval), a
+# background sweeper deletes the least recently served photos once the
+# directory holds more than max_bytes, down to 90% of it, and the
+# references to them. A reference whose photo is gone is fetched again.
+# The sweeper starts with the first photo asked for (or the warm-up), so
+# CLI commands and scripts that create the app do not run it.
+# Widths are rounded up to one of PHOTO_WIDTHS (snap_width), so a photo
+# reference is fetched and stored at most once per width.
+# ------------------------------------------
+# Photos are only touched again after this many seconds, to save writes
+TOUCH_INTERVAL = 60
+
+# The sweeper deletes photos down to this fraction of max_bytes
+SWEEP_LOW_WATER = 0.9
+
+# The photo widths that are fetched and stored, Google serves at most 1600px
+PHOTO_WIDTHS = (100, 200, 400, 800, 1600)
+
+
+def snap_width(maxwidth: int) -> int:
+    """The smallest stored width at least maxwidth wide, at most the largest one"""
+    return next((width for width in PHOTO_WIDTHS if width >= maxwidth), PHOTO_WIDTHS[-1])
+
+
+class PhotoFetchError(Exception):
+    """The photo could not be fetched from Google Places"""
+
+
+class Photo:
+    """A cached photo: its file, digest (the ETag) and content type"""
+
+    def __init__(self, path: str, digest: str, content_type: str):
+        self.path = path
+        self.digest = digest
+        self.content_type = content_type
+
+
+class PhotoCache:
+    def __init__(self, directory: str = 'photo_cache', max_bytes: int = 512 * 1024 * 1024,
+                 max_age: int = 30 * 24 * 3600, sweep_interval: float = 300):
+        self.directory = directory
+        self.objects = os.path.join(directory, 'objects')
+        self.refs = os.path.join(directory, 'refs')
+        self.max_bytes = max_bytes
+        self.max_age = max_age  # Cache-Control max-age of the responses
+        self.sweep_interval = sweep_interval
+
+        # Bytes of the stored photos, counted by the sweeper and new photos
+        self.size = None
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "fetches": 0,
+            "shared": 0,
+            "not_found": 0,
+            "errors": 0,
+            "sweeps": 0,
+            "evictions": 0,
+        }
+
+        self.thread = None
+        self.sweep_needed = threading.Event()
+        self.stopped = threading.Event()
+
+    @classmethod
+    def from_env(cls):
+        """Photo cache configured from the PHOTO_CACHE_* environment variables"""
+        return cls(
+            directory=os.getenv('PHOTO_CACHE_DIR', 'photo_cache'),
+            max_bytes=int(os.getenv('PHOTO_CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+            max_age=int(os.getenv('PHOTO_CACHE_MAX_AGE', 30 * 24 * 3600)),
+            sweep_interval=float(os.getenv('PHOTO_CACHE_SWEEP_INTERVAL', 300)),
+        )
+
+    def start(self):
+        """Start the background sweeper, once"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='photo-cache-sweeper', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    @staticmethod
+    def ref_key(photo_reference: str, maxwidth: int) -> str:
+        return hashlib.blake2b(f'{maxwidth}:{photo_reference}'.encode(), digest_size=16).hexdigest()
+
+    def ref_path(self, key: str) -> str:
+        return os.path.join(self.refs, key[:2], key)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def get(self, photo_reference: str, maxwidth: int, fetch):
+        """
+        The cached photo of a reference and width, fetched with fetch() on a miss.
+        fetch returns (content, content_type), or None if Google has no such photo.
+        Returns a Photo or None, raises PhotoFetchError if fetching failed.
+        """
+        if self.thread is None:
+            self.start()
+
+        key = self.ref_key(photo_reference, maxwidth)
+        photo = self.lookup(key)
+        if photo is not None:
+            self.count("hits")
+            return photo
+
+        self.count("misses")
+        photo, shared = self.flights.do(key, lambda: self.load(key, fetch))
+        if shared:
+            self.count("shared")
+        return photo
+
+    def lookup(self, key: str):
+        """The stored photo of a reference key, or None"""
+        try:
+            with open(self.ref_path(key)) as file:
+                ref = json.load(file)
+            path = self.object_path(ref['digest'])
+            modified = os.stat(path).st_mtime
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Mark the photo as recently used for the sweeper
+        now = time.time()
+        if now - modified > TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+        return Photo(path, ref['digest'], ref['content_type'])
+
+    def load(self, key: str, fetch):
+        # Another worker may have stored it in the meantime
+        photo = self.lookup(key)
+        if photo is not None:
+            return photo
+
+        self.count("fetches")
+        try:
+            fetched = fetch()
+        except Exception as e:
+            self.count("errors")
+            raise PhotoFetchError(str(e)) from e
+        if fetched is None:
+            self.count("not_found")
+            return None
+
+        content, content_type = fetched
+        return self.store(key, content, content_type)
+
+    def store(self, key: str, content: bytes, content_type: str):
+        """Store a photo under its digest and point the reference key at it"""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            self.write_atomic(path, content)
+            with self.lock:
+                if self.size is not None:
+                    self.size += len(content)
+                    if self.size > self.max_bytes:
+                        self.sweep_needed.set()
+        self.write_atomic(self.ref_path(key), json.dumps({'digest': digest, 'content_type': content_type}).encode())
+        return Photo(path, digest, content_type)
+
+    @staticmethod
+    def write_atomic(path: str, content: bytes):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(content)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def scan(self, root: str):
+        """Yield (path, stat) of the files below root, without temporary files"""
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    pass  # Deleted by another worker
+
+    def sweep(self):
+        """Delete the least recently served photos while over max_bytes, returns the number deleted"""
+        photos = sorted(self.scan(self.objects), key=lambda item: item[1].st_mtime)
+        size = sum(stat.st_size for _, stat in photos)
+        deleted = 0
+        if size > self.max_bytes:
+            target = self.max_bytes * SWEEP_LOW_WATER
+            for path, stat in photos:
+                if size <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                size -= stat.st_size
+                deleted += 1
+
+            # Drop the references to deleted photos
+            for path, _ in self.scan(self.refs):
+                try:
+                    with open(path) as file:
+                        digest = json.load(file)['digest']
+                    if not os.path.exists(self.object_path(digest)):
+                        os.unlink(path)
+                except (OSError, ValueError, KeyError):
+                    pass
+
+        with self.lock:
+            self.size = size
+            self.counters["sweeps"] += 1
+            self.counters["evictions"] += deleted
+        return deleted
+
+    def run(self):
+        """Sweep every sweep_interval seconds and when new photos exceed max_bytes"""
+        while not self.stopped.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Photo cache sweep failed")
+            self.sweep_needed.wait(self.sweep_interval)
+            self.sweep_needed.clear()
+
+    def close(self):
+        self.stopped.set()
+        self.sweep_needed.set()
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "in_flight": self.flights.stats()["in_flight"],
+            }
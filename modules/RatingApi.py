@@ -1,7 +1,26 @@
 import os
+import asyncio
+import threading
+from collections import OrderedDict
+from functools import partial
+from urllib.parse import quote
 import requests
-from flask import jsonify
+from models.db import db, in_thread, upsert
 from dotenv import load_dotenv
+from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from modules.Metrics import metrics
+from modules.SearchCache import SearchCache
+from modules.SingleFlight import SingleFlight
+from modules.Transport import create_transport, TransportError
+from modules.Resilience import ResilientTransport
+from modules.PhotoCache import snap_width, PHOTO_WIDTHS
+from models.place_details import PlaceDetails
+from models.catalog import CatalogPlace
+from models.recommendation import Recommendation
+from flask import jsonify, has_app_context
 
 load_dotenv()
 
@@ -10,6 +29,18 @@ load_dotenv()
 # ------------------------------------------
 # This module is used to fetch ratings from Google Places.
 # It is used to get the ratings for a specific location and cuisine.
+# The *_async methods do the same without blocking an event loop: the
+# Google requests are awaited and the database work runs in threads.
+# Identical searches and details lookups that are in flight at the same
+# time, from threads or tasks, are sent to Google once (SingleFlight).
+# Requests time out, may be hedged and fail fast while Google is failing
+# (Resilience); a failed search is then answered from the search cache,
+# however old its entry, or with no results.
+# Photo URLs point to our /photos proxy, which fetches each photo from
+# Google once (fetch_photo) and serves it from disk (PhotoCache), so the
+# API key is not handed out. The proxy only fetches the photos the app
+# has linked (served_photo), in search results, catalog places or
+# stored recommendations.
 # ------------------------------------------
 class RatingApi:
     def __init__(self):
@@ -19,52 +50,431 @@ class RatingApi:
                 "api_key": os.getenv('GOOGLE_API_KEY'),
                 "base_url": "https://maps.googleapis.com/maps/api/place/textsearch/json",
                 "details_url": "https://maps.googleapis.com/maps/api/place/details/json",
-                "photo_url": "https://maps.googleapis.com/maps/api/place/photo"
+                "photo_url": "https://maps.googleapis.com/maps/api/place/photo",
+                # Base URL of the /photos proxy in the photo URLs, relative by default
+                "photo_proxy_url": os.getenv('PHOTO_PROXY_URL', ''),
+                # Maximum number of place details requests in flight at once
+                "details_concurrency": int(os.getenv('GOOGLE_DETAILS_CONCURRENCY', 8)),
+                # Photo references of recent photo URLs kept in memory for the /photos proxy
+                "served_photos": int(os.getenv('SERVED_PHOTOS_MAX_ENTRIES', 10000)),
+            },
+            "search_cache": {
+                "ttl": float(os.getenv('SEARCH_CACHE_TTL', 600)),
+                "grace": float(os.getenv('SEARCH_CACHE_GRACE', 300)),
+                "max_entries": int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 512)),
+                "max_bytes": int(os.getenv('SEARCH_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+            },
+            "transport": {
+                # live, record (to the archive) or replay (from the archive)
+                "mode": os.getenv('PLACES_TRANSPORT', 'live'),
+                "archive": os.getenv('PLACES_ARCHIVE', 'places_archive'),
+                # Simulated latency of replayed responses in seconds
+                "latency": float(os.getenv('PLACES_REPLAY_LATENCY', 0)),
+                # Seconds to connect and to wait for the response of a live request
+                "timeout": (float(os.getenv('PLACES_CONNECT_TIMEOUT', 3.05)), float(os.getenv('PLACES_READ_TIMEOUT', 10))),
+            },
+            "resilience": {
+                # Failed requests in a row that open the circuit breaker (0 disables it)
+                "breaker_failures": int(os.getenv('PLACES_BREAKER_FAILURES', 5)),
+                # Seconds the breaker stays open before a trial request
+                "breaker_reset": float(os.getenv('PLACES_BREAKER_RESET', 30)),
+                # Send a second request once a request is slower than the p95
+                "hedge": os.getenv('PLACES_HEDGE', 'false').lower() in ('1', 'true', 'yes'),
+            },
+            "place_details": {
+                # Stored place details older than this are fetched again
+                "refresh_after": timedelta(days=float(os.getenv('PLACE_DETAILS_REFRESH_DAYS', 30))),
             },
         }
 
+        # Shared keep-alive connection pool, sized so that every concurrent
+        # details lookup can reuse an open connection
+        concurrency = max(1, self.config["google"]["details_concurrency"])
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=concurrency + 1)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Sends the requests to Google, or records or replays them, with a
+        # circuit breaker and optional hedging
+        self.transport = ResilientTransport(create_transport(self.session, **self.config["transport"]), **self.config["resilience"])
+
+        # Worker pool for the place details fan-out
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='place-details')
+
+        # Cache for search results of recently asked queries
+        self.search_cache = SearchCache(**self.config["search_cache"])
+
+        # Concurrent identical searches (by cache key) and details lookups
+        # (by place_id) wait for the one in flight
+        self.search_flights = SingleFlight()
+        self.details_flights = SingleFlight()
+
+        # Photo references of the photo URLs handed out, most recent last
+        self.photo_references = OrderedDict()
+        self.photo_references_lock = threading.Lock()
+
     # Function to fetch restaurant ratings from Google Places
     def fetch_google_ratings(self, location: str, cuisine: str):
-        """Fetch ratings from Google Places"""
-        url = f'{self.config["google"]["base_url"]}?query={cuisine}+restaurants+in+{location}&key={self.config["google"]["api_key"]}'
+        """Fetch ratings from Google Places, including photo and place URLs"""
+
+        return self.enrich_places(self.search_places(location, cuisine))
+
+    async def fetch_google_ratings_async(self, location: str, cuisine: str):
+        """Async version of fetch_google_ratings"""
+
+        return await self.enrich_places_async(await self.search_places_async(location, cuisine))
+
+    def search_places(self, location: str, cuisine: str):
+        """
+        Run a Google Places text search, using the search cache if possible.
+        If Google can't be reached, an expired cache entry is used if there is one.
+        The results are not enriched with photo or place URLs, see enrich_places.
+        """
+        key = self.search_cache.make_key(cuisine, location)
+        try:
+            with metrics.span('places_search'):
+                results = self.search_cache.get_or_load(key, lambda: self.search_places_shared(key, location, cuisine))
+        except TransportError:
+            results = self.search_cache.fallback(key) or []
+
+        # Hand out copies so callers cannot modify cached results
+        return [dict(result) for result in results]
+
+    async def search_places_async(self, location: str, cuisine: str):
+        """Async version of search_places, stale entries are still refreshed in a thread"""
+        key = self.search_cache.make_key(cuisine, location)
+        try:
+            with metrics.span('places_search'):
+                results = await self.search_cache.get_or_load_async(
+                    key,
+                    lambda: self.search_places_shared(key, location, cuisine),
+                    lambda: self.search_places_shared_async(key, location, cuisine)
+                )
+        except TransportError:
+            results = self.search_cache.fallback(key) or []
+        return [dict(result) for result in results]
+
+    def search_places_shared(self, key, location: str, cuisine: str):
+        """Run a Google Places text search, or wait for the same search in flight"""
+        results, shared = self.search_flights.do(key, lambda: self.search_places_uncached(location, cuisine))
+        if shared:
+            metrics.count_coalesced('textsearch')
+        return results
+
+    async def search_places_shared_async(self, key, location: str, cuisine: str):
+        """Async version of search_places_shared"""
+        results, shared = await self.search_flights.do_async(key, lambda: self.search_places_uncached_async(location, cuisine))
+        if shared:
+            metrics.count_coalesced('textsearch')
+        return results
+
+    def search_url(self, location: str, cuisine: str):
+        return f'{self.config["google"]["base_url"]}?query={cuisine}+restaurants+in+{location}&key={self.config["google"]["api_key"]}'
+
+    def search_places_uncached(self, location: str, cuisine: str):
+        """Run a Google Places text search, raises TransportError if it failed"""
+        url = self.search_url(location, cuisine)
         
-        response = requests.get(url)
+        metrics.count_outbound('textsearch')
+        with metrics.span('places_search_request'):
+            response = self.transport.get('textsearch', url)
         if response.status_code == 200:
-            results = response.json().get('results', [])
-            
-            # Add photo URL for each result that has photos
-            for result in results:
-                # Add photo URL if available
-                if result.get('photos'):
-                    photo_reference = result['photos'][0]['photo_reference']  # Get first photo reference
-                    result['photo_url'] = self.get_photo_url(photo_reference)
-                
-                # Get URLs if place_id is available
-                if result.get('place_id'):
-                    urls = self.get_place_details(result['place_id'])
-                    result.update(urls)
-            
-            return results
+            return response.json().get('results', [])
         else:
             return []
+
+    async def search_places_uncached_async(self, location: str, cuisine: str):
+        """Run a Google Places text search without blocking"""
+        url = self.search_url(location, cuisine)
+
+        metrics.count_outbound('textsearch')
+        with metrics.span('places_search_request'):
+            response = await self.transport.get_async('textsearch', url)
+        if response.status_code == 200:
+            return response.json().get('results', [])
+        else:
+            return []
+
+    def enrich_places(self, results: list, fetch_missing: bool = True):
+        """
+        Add the photo URL and the place URLs to the given search results.
+        With fetch_missing=False only stored place details are used.
+        """
+
+        self.add_photo_urls(results)
+        
+        # Get URLs for all results with a place_id in one concurrent batch
+        details = self.get_places_details([result['place_id'] for result in results if result.get('place_id')], fetch_missing)
+        return self.merge_details(results, details)
+
+    async def enrich_places_async(self, results: list, fetch_missing: bool = True):
+        """Async version of enrich_places"""
+
+        self.add_photo_urls(results)
+        details = await self.get_places_details_async([result['place_id'] for result in results if result.get('place_id')], fetch_missing)
+        return self.merge_details(results, details)
+
+    def add_photo_urls(self, results: list):
+        # Add photo URL for each result that has photos
+        for result in results:
+            # Add photo URL if available
+            if result.get('photos'):
+                photo_reference = result['photos'][0]['photo_reference']  # Get first photo reference
+                result['photo_url'] = self.get_photo_url(photo_reference)
+                self.remember_photo(photo_reference)
+
+    def remember_photo(self, photo_reference: str):
+        """Record a photo reference handed out in a photo URL"""
+        with self.photo_references_lock:
+            self.photo_references[photo_reference] = True
+            self.photo_references.move_to_end(photo_reference)
+            while len(self.photo_references) > self.config['google']['served_photos']:
+                self.photo_references.popitem(last=False)
+
+    def served_photo(self, photo_reference: str) -> bool:
+        """
+        True if the app has linked the photo: in a recent search result, a
+        catalog place or a stored recommendation. Only these are fetched
+        from Google by the /photos proxy.
+        """
+        with self.photo_references_lock:
+            if photo_reference in self.photo_references:
+                return True
+        if not has_app_context():
+            return False
+
+        # Linked by another worker or before a restart
+        urls = [self.get_photo_url(photo_reference, width) for width in PHOTO_WIDTHS]
+        try:
+            found = db.session.execute(
+                db.select(CatalogPlace.id).where(CatalogPlace.photo_reference == photo_reference).limit(1)
+            ).first() or db.session.execute(
+                db.select(Recommendation.id).where(Recommendation.photo_url.in_(urls)).limit(1)
+            ).first()
+        except SQLAlchemyError:
+            db.session.rollback()
+            return False
+        if found is None:
+            return False
+        self.remember_photo(photo_reference)
+        return True
+
+    def merge_details(self, results: list, details: dict):
+        for result in results:
+            if result.get('place_id'):
+                result.update(details[result['place_id']])
+        
+        return results
     
     def get_photo_url(self, photo_reference: str, maxwidth: int = 400):
-        """Generate photo URL using the photo reference"""
+        """Generate the URL of the photo on our /photos proxy, at one of the stored widths"""
+
+        return f"{self.config['google']['photo_proxy_url']}/photos/{quote(photo_reference, safe='')}?maxwidth={snap_width(maxwidth)}"
+
+    def photo_upstream_url(self, photo_reference: str, maxwidth: int = 400):
+        """Generate the Google photo URL, which includes the API key"""
 
         return f"{self.config['google']['photo_url']}?maxwidth={maxwidth}&photo_reference={photo_reference}&key={self.config['google']['api_key']}"
+
+    def fetch_photo(self, photo_reference: str, maxwidth: int = 400):
+        """
+        Fetch a photo from Google, returns (content, content_type) or None
+        if there is no such photo. Raises TransportError if the request failed.
+        """
+        metrics.count_outbound('photo')
+        with metrics.span('photo_request'):
+            response = self.transport.get('photo', self.photo_upstream_url(photo_reference, maxwidth))
+        # Google answers an unknown or invalid photo reference with a 404 or 400
+        if response.status_code in (400, 404):
+            return None
+        if response.status_code != 200:
+            raise TransportError(f"Google Places responded with status {response.status_code} to a photo request")
+
+        # Replayed responses have no headers, Google photos are JPEGs
+        headers = getattr(response, 'headers', None) or {}
+        return response.content, headers.get('Content-Type', 'image/jpeg')
     
     def get_place_details(self, place_id: str):
         """Fetch detailed place information including URLs"""
-        url = f"{self.config['google']['details_url']}?place_id={place_id}&fields=website,url&key={self.config['google']['api_key']}"
         
-        response = requests.get(url)
-        if response.status_code == 200:
-            result = response.json().get('result', {})
-            return {
-                'website_url': result.get('website', ''),  # Restaurant's own website
-                'maps_url': result.get('url', '')          # Google Maps URL
+        return self.fetch_place_details(place_id)[0] or {'website_url': '', 'maps_url': ''}
+
+    async def get_place_details_async(self, place_id: str):
+        """Async version of get_place_details"""
+
+        return (await self.fetch_place_details_async(place_id))[0] or {'website_url': '', 'maps_url': ''}
+
+    def details_url(self, place_id: str):
+        return f"{self.config['google']['details_url']}?place_id={place_id}&fields=website,url&key={self.config['google']['api_key']}"
+
+    def fetch_place_details(self, place_id: str):
+        """
+        Fetch the URLs of a place from Google, or wait for the same lookup in flight.
+        Returns (urls, shared), urls is None if the lookup failed.
+        """
+        urls, shared = self.details_flights.do(place_id, lambda: self.fetch_place_details_uncached(place_id))
+        if shared:
+            metrics.count_coalesced('details')
+        return urls, shared
+
+    async def fetch_place_details_async(self, place_id: str):
+        """Async version of fetch_place_details"""
+        urls, shared = await self.details_flights.do_async(place_id, lambda: self.fetch_place_details_uncached_async(place_id))
+        if shared:
+            metrics.count_coalesced('details')
+        return urls, shared
+
+    def fetch_place_details_uncached(self, place_id: str):
+        """Fetch the URLs of a place from Google, returns None if the lookup failed"""
+        url = self.details_url(place_id)
+        
+        try:
+            with metrics.span('place_details_request'):
+                response = self.transport.get('details', url)
+            if response.status_code == 200:
+                return self.parse_place_details(response)
+        except (TransportError, ValueError):
+            pass
+        return None
+
+    async def fetch_place_details_uncached_async(self, place_id: str):
+        """Fetch the URLs of a place without blocking, returns None if the lookup failed"""
+        url = self.details_url(place_id)
+
+        try:
+            with metrics.span('place_details_request'):
+                response = await self.transport.get_async('details', url)
+            if response.status_code == 200:
+                return self.parse_place_details(response)
+        except (TransportError, ValueError):
+            pass
+        return None
+
+    def parse_place_details(self, response):
+        result = response.json().get('result', {})
+        return {
+            'website_url': result.get('website', ''),  # Restaurant's own website
+            'maps_url': result.get('url', '')          # Google Maps URL
+        }
+
+    def get_places_details(self, place_ids: list, fetch_missing: bool = True):
+        """
+        Get the URLs for several places.
+        Fresh details are read from the place details store in one query,
+        only missing or expired places are fetched from Google, concurrently
+        (unless fetch_missing is False). Places that are already being
+        fetched for another request are not fetched again.
+        Returns a dict mapping each place_id to its URLs. A failed lookup
+        falls back to the stored (or empty) URLs without affecting the others.
+        """
+        place_ids = list(dict.fromkeys(place_ids))  # Drop duplicates, keep order
+
+        stored = self.load_place_details(place_ids)
+        missing = self.missing_place_details(place_ids, stored) if fetch_missing else []
+
+        with metrics.span('place_details'):
+            # Join the lookups in flight before queueing, the pool may only
+            # get to a queued one after the same lookup of another request ended
+            calls = {
+                place_id: self.details_flights.submit(self.executor, place_id, partial(self.fetch_place_details_uncached, place_id))
+                for place_id in missing
+            }
+            lookups = {place_id: (future.result(), shared) for place_id, (future, shared) in calls.items()}
+        metrics.count_coalesced('details', sum(shared for _, shared in lookups.values()))
+        return self.finish_place_details(place_ids, stored, lookups)
+
+    async def get_places_details_async(self, place_ids: list, fetch_missing: bool = True):
+        """
+        Async version of get_places_details. The missing places are
+        fetched concurrently, at most details_concurrency at once.
+        """
+        place_ids = list(dict.fromkeys(place_ids))
+
+        stored = await in_thread(self.load_place_details, place_ids)
+        missing = self.missing_place_details(place_ids, stored) if fetch_missing else []
+
+        semaphore = asyncio.Semaphore(max(1, self.config["google"]["details_concurrency"]))
+
+        async def fetch(place_id):
+            async with semaphore:
+                return await self.fetch_place_details_async(place_id)
+
+        with metrics.span('place_details'):
+            lookups = dict(zip(missing, await asyncio.gather(*map(fetch, missing))))
+        return await in_thread(self.finish_place_details, place_ids, stored, lookups)
+
+    def finish_place_details(self, place_ids: list, stored: dict, lookups: dict):
+        """
+        Count and store the details fetched by this request, lookups maps
+        place_ids to (urls, shared). Shared lookups are stored by the
+        request that sent them.
+        """
+        metrics.count_outbound('details', sum(not shared for _, shared in lookups.values()))
+        self.store_place_details({place_id: urls for place_id, (urls, shared) in lookups.items() if urls is not None and not shared})
+
+        fetched = {place_id: urls for place_id, (urls, _) in lookups.items()}
+        return self.combine_place_details(place_ids, stored, fetched)
+
+    def missing_place_details(self, place_ids: list, stored: dict):
+        """Places without stored details, or with expired ones"""
+        expired_before = datetime.utcnow() - self.config["place_details"]["refresh_after"]
+        return [place_id for place_id in place_ids if place_id not in stored or stored[place_id]['fetched_at'] < expired_before]
+
+    def combine_place_details(self, place_ids: list, stored: dict, fetched: dict):
+        details = {}
+        for place_id in place_ids:
+            if fetched.get(place_id) is not None:
+                details[place_id] = fetched[place_id]
+            elif place_id in stored:
+                details[place_id] = {'website_url': stored[place_id]['website_url'], 'maps_url': stored[place_id]['maps_url']}
+            else:
+                details[place_id] = {'website_url': '', 'maps_url': ''}
+        return details
+
+    def load_place_details(self, place_ids: list):
+        """Load the stored details for the given places with a single query"""
+        if not place_ids or not has_app_context():
+            return {}
+
+        try:
+            with metrics.span('place_details_read'):
+                rows = db.session.execute(
+                    db.select(PlaceDetails.place_id, PlaceDetails.website_url, PlaceDetails.maps_url, PlaceDetails.fetched_at)
+                    .where(PlaceDetails.place_id.in_(place_ids))
+                ).all()
+        except SQLAlchemyError:
+            db.session.rollback()
+            return {}
+        return {
+            row.place_id: {'website_url': row.website_url or '', 'maps_url': row.maps_url or '', 'fetched_at': row.fetched_at}
+            for row in rows
+        }
+
+    def store_place_details(self, details: dict):
+        """Insert or update the fetched details in the place details store"""
+        if not details or not has_app_context():
+            return
+
+        now = datetime.utcnow()
+        stmt = upsert(PlaceDetails).values([
+            {'place_id': place_id, 'website_url': urls['website_url'], 'maps_url': urls['maps_url'], 'fetched_at': now}
+            for place_id, urls in details.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['place_id'],
+            set_={
+                'website_url': stmt.excluded.website_url,
+                'maps_url': stmt.excluded.maps_url,
+                'fetched_at': stmt.excluded.fetched_at,
             }
-        return {'website_url': '', 'maps_url': ''}
+        )
+        try:
+            with metrics.span('place_details_write'):
+                db.session.execute(stmt)
+                db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
 
     # Endpoint to process conversation input and return the next question
     def process_reccomendations(self, location: str, cuisine: str):
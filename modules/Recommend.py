@@ -1,9 +1,22 @@
+import os
 import re
-from flask import session
-from datetime import datetime
+import time
+import logging
+import threading
+from flask import has_app_context, current_app
+from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+from models.db import in_thread
+from modules.Metrics import metrics
+from modules.GeoIndex import GeoIndex
+from modules.Catalog import Catalog
 from modules.RatingApi import RatingApi
+from modules.Scorer import Scorer, CandidatePool
+from modules.RecommendationWriter import RecommendationWriter
 from models.recommendation import Recommendation, db
 
+logger = logging.getLogger(__name__)
+
 # ------------------------------------------
 # Recommendation Module
 # ------------------------------------------
@@ -12,10 +25,66 @@ from models.recommendation import Recommendation, db
 # It uses the RatingApi module to fetch restaurant data from Google Places.
 # It also uses the Recommendation model to store the recommendations 
 # in the database.
+# When the user shared coordinates, known restaurants nearby (GeoIndex)
+# are scored instead and Google is only searched if there are too few.
+# The geo index is loaded from the stored recommendations by a background
+# thread, so requests never wait for it.
+# Otherwise the local catalog of earlier search results (Catalog) is
+# searched first, Google only if it has too few fresh matches. If Google
+# can't be reached either, any older matches in the catalog are used.
 # ------------------------------------------
+# Recommendations stored by other workers can show up a little late
+# (write-behind), so every refresh of the geo index looks back this far
+GEO_REFRESH_OVERLAP = timedelta(minutes=5)
+
 class Recommend:
-    def __init__(self):
+    def __init__(self, writer: RecommendationWriter = None):
         self.rating_api = RatingApi()
+        self.scorer = Scorer()
+
+        # Number of best scored candidates that get photo and place URLs
+        self.enrich_top_k = int(os.getenv('RECOMMEND_ENRICH_TOP_K', 1))
+
+        # Number of ranked candidates kept to page through alternatives
+        self.max_candidates = int(os.getenv('RECOMMEND_MAX_CANDIDATES', 20))
+        self.candidate_fields = (
+            'name', 'rating', 'user_ratings_total', 'price_level', 'formatted_address',
+            'place_id', 'geometry', 'photo_url', 'website_url', 'maps_url'
+        )
+
+        # Stores the recommendations, committed right away ('sync') or
+        # written behind in group commits ('write_behind')
+        self.writer = writer or RecommendationWriter.from_env()
+
+        # Known restaurants by location, from the stored recommendations
+        # (reloaded every GEO_INDEX_REFRESH seconds by a background thread)
+        # and the search results, at most GEO_INDEX_MAX_PLACES (0 for no limit)
+        self.geo_index = GeoIndex(
+            cell_size=float(os.getenv('GEO_INDEX_CELL_SIZE', 1000)),
+            max_places=int(os.getenv('GEO_INDEX_MAX_PLACES', 100_000)),
+        )
+        self.geo_refresh_every = float(os.getenv('GEO_INDEX_REFRESH', 60))
+        self.geo_refreshed_at = None
+        self.geo_lock = threading.Lock()
+        self.geo_thread = None
+
+        # Nearby restaurants within this radius (metres) are used instead of a
+        # Google search if there are at least RECOMMEND_LOCAL_MIN_RESULTS of them
+        self.local_radius = float(os.getenv('RECOMMEND_LOCAL_RADIUS', 2000))
+        self.local_min_results = int(os.getenv('RECOMMEND_LOCAL_MIN_RESULTS', 10))
+        self.local_max_results = int(os.getenv('RECOMMEND_LOCAL_MAX_RESULTS', 60))
+
+        # Earlier search results, used instead of a Google search if there are
+        # at least CATALOG_MIN_RESULTS matches seen in the last CATALOG_MAX_AGE_DAYS
+        self.catalog = Catalog(
+            min_results=int(os.getenv('CATALOG_MIN_RESULTS', 10)),
+            max_results=int(os.getenv('CATALOG_MAX_RESULTS', 60)),
+            max_age=timedelta(days=float(os.getenv('CATALOG_MAX_AGE_DAYS', 7))),
+        )
+
+        # Load the geo index away from the requests, if it is used
+        if self.local_min_results > 0 and has_app_context():
+            self.start_geo_refresh(current_app._get_current_object())
 
     def parse_time(self, time_str):
         """Convert time string to datetime object"""
@@ -76,97 +145,267 @@ class Recommend:
         except (ValueError, TypeError):
             return 1  # Default to 1 if conversion fails
 
-    def get_recommendation(self, user_info: dict, user_id: str):
-        """Generate restaurant recommendation based on user preferences"""
-        
-        # Extract relevant information
-        cuisine = user_info.get('ask_cuisine', [None])[0]
-        location = user_info.get('ask_location', [None])[0]
-        guests = self.parse_guests(user_info.get('ask_guests', [None])[0])
-        time = self.parse_time(user_info.get('ask_time_day', [None])[0])
-        dietary = user_info.get('ask_dietary', [None])[0]
-        budget = user_info.get('ask_budget', [None])[0]
-        atmosphere = user_info.get('ask_atmosphere', [None])[0]
-        
+    def get_preferences(self, user_info: dict):
+        """Extract the preferences relevant for a recommendation from the user info"""
+
+        return {
+            'cuisine': user_info.get('ask_cuisine', [None])[0],
+            'location': user_info.get('ask_location', [None])[0],
+            'guests': self.parse_guests(user_info.get('ask_guests', [None])[0]),
+            'time': self.parse_time(user_info.get('ask_time_day', [None])[0]),
+            'dietary': user_info.get('ask_dietary', [None])[0],
+            'budget': user_info.get('ask_budget', [None])[0],
+            'atmosphere': user_info.get('ask_atmosphere', [None])[0],
+        }
+
+    @staticmethod
+    def catalog_terms(preferences: dict) -> tuple:
+        """The preferences that the places from the catalog must match, besides cuisine and location"""
+        dietary = preferences['dietary'] if preferences['dietary'] != 'no restrictions' else None
+        return tuple(filter(None, (dietary, preferences['atmosphere'])))
+
+    def build_search_string(self, preferences: dict) -> str:
+        """Build the Google Places search query from the preferences"""
+
         # Build search query with all relevant info
         search_query = []
-        if cuisine:
-            search_query.append(cuisine)
-        if dietary:
-            search_query.append(dietary)
-        if atmosphere:
-            search_query.append(atmosphere)
-        if budget:
-            search_query.append(budget)
-        if location:
-            search_query.append(f"in {location}")
+        if preferences['cuisine']:
+            search_query.append(preferences['cuisine'])
+        if preferences['dietary']:
+            search_query.append(preferences['dietary'])
+        if preferences['atmosphere']:
+            search_query.append(preferences['atmosphere'])
+        if preferences['budget']:
+            search_query.append(preferences['budget'])
+        if preferences['location']:
+            search_query.append(f"in {preferences['location']}")
         
         # Combine into search string
-        search_string = " ".join(search_query)
-        
-        # Get restaurant recommendations from Google Places with enhanced query
-        restaurants = self.rating_api.fetch_google_ratings(location, search_string)
+        return " ".join(search_query)
+
+    def score_restaurants(self, restaurants: list, preferences: dict, top_k: int = None):
+        """
+        Phase one: score the raw search results against the preferences.
+        Returns a list of (restaurant, score) tuples, best match first,
+        limited to the top K if given.
+        """
+        with metrics.span('scoring'):
+            pool = restaurants if isinstance(restaurants, CandidatePool) else CandidatePool(restaurants)
+            order, scores = self.scorer.rank(pool, preferences, top_k)
+        return [(pool.restaurants[index], float(score)) for index, score in zip(order, scores)]
+
+    def enrich_candidates(self, scored_restaurants: list, top_k: int = None):
+        """
+        Phase two: add photo and place URLs to the top K scored restaurants.
+        Only these candidates cause place details lookups.
+        """
+        if top_k is None:
+            top_k = self.enrich_top_k
+
+        self.rating_api.enrich_places([restaurant for restaurant, _ in scored_restaurants[:top_k]])
+        return scored_restaurants
+
+    def compact_candidate(self, restaurant: dict, score: float):
+        """Keep only the search result fields needed to serve a recommendation"""
+
+        candidate = {field: restaurant[field] for field in self.candidate_fields if field in restaurant}
+        if restaurant.get('photos'):
+            candidate['photos'] = restaurant['photos'][:1]
+        candidate['score'] = score
+        return candidate
+
+    def rank_candidates(self, user_info: dict, enrich_top_k: int = None, coordinates: list = None):
+        """
+        Search and score restaurants for the user preferences.
+        With coordinates (lat, lng) known restaurants nearby are used if
+        there are enough of them, then matches in the local catalog,
+        otherwise Google Places is searched (older catalog matches are
+        used if that finds nothing).
+        Only the top candidates (enrich_top_k, defaults to RECOMMEND_ENRICH_TOP_K)
+        are enriched. Returns the ranking, a JSON serialisable dict with the
+        preferences and the compact candidates (best match first) from which
+        recommendations are served.
+        """
         
-        # Enhanced scoring system
-        scored_restaurants = []
-        for restaurant in restaurants:
-            score = 0
-            
-            # Basic match criteria
-            if cuisine and cuisine.lower() in restaurant.get('types', []):
-                score += 2
-            
-            # Dietary requirements (critical)
-            if dietary:
-                if any(dietary.lower() in tag.lower() for tag in restaurant.get('types', [])):
-                    score += 3
-                elif dietary.lower() in restaurant.get('name', '').lower():
-                    score += 2
-            
-            # Atmosphere matching
-            if atmosphere:
-                if any(atmosphere.lower() in review.get('text', '').lower() 
-                      for review in restaurant.get('reviews', [])):
-                    score += 1
-            
-            # Budget matching
-            price_level = restaurant.get('price_level', 2)
-            if budget:
-                budget_map = {'cheap': 1, 'moderate': 2, 'expensive': 3}
-                if price_level == budget_map.get(budget.lower(), 2):
-                    score += 2
-            
-            # Rating boost
-            rating = restaurant.get('rating', 0)
-            score += rating / 2  # Add up to 2.5 points for 5-star rating
-            
-            # Number of ratings boost
-            user_ratings_total = restaurant.get('user_ratings_total', 0)
-            score += min(user_ratings_total / 1000, 1)  # Up to 1 point for 1000+ reviews
-            
-            # Opening hours check
-            if time and restaurant.get('opening_hours', {}).get('open_now'):
-                score += 1
-            
-            scored_restaurants.append((restaurant, score))
+        # Extract relevant information
+        preferences = self.get_preferences(user_info)
+        restaurants = self.local_candidates(preferences, coordinates)
+        if restaurants is None:
+            restaurants = self.catalog.search(preferences['cuisine'], preferences['location'], terms=self.catalog_terms(preferences))
+        if restaurants is None:
+            search_string = self.build_search_string(preferences)
+
+            # Get restaurant recommendations from Google Places with enhanced query
+            restaurants = self.rating_api.search_places(preferences['location'], search_string)
+            self.remember_restaurants(restaurants, preferences)
+            if not restaurants:
+                restaurants = self.catalog.search(
+                    preferences['cuisine'], preferences['location'], fallback=True, terms=self.catalog_terms(preferences)
+                ) or []
         
-        # Sort by score and get best match
-        scored_restaurants.sort(key=lambda x: x[1], reverse=True)
-        if not scored_restaurants:
+        # Keep the best candidates as alternatives, but only fetch details
+        # for the ones we are likely to serve
+        scored_restaurants = self.score_restaurants(restaurants, preferences, self.max_candidates)
+        top_k = max(1, self.enrich_top_k if enrich_top_k is None else enrich_top_k)
+        self.enrich_candidates(scored_restaurants, top_k)
+
+        return self.build_ranking(preferences, scored_restaurants)
+
+    async def rank_candidates_async(self, user_info: dict, enrich_top_k: int = None, coordinates: list = None):
+        """Async version of rank_candidates, the Google requests are awaited"""
+
+        preferences = self.get_preferences(user_info)
+        restaurants = await in_thread(self.local_candidates, preferences, coordinates) if coordinates else None
+        if restaurants is None:
+            restaurants = await in_thread(
+                self.catalog.search, preferences['cuisine'], preferences['location'], False, self.catalog_terms(preferences)
+            )
+        if restaurants is None:
+            search_string = self.build_search_string(preferences)
+            restaurants = await self.rating_api.search_places_async(preferences['location'], search_string)
+            await in_thread(self.remember_restaurants, restaurants, preferences)
+            if not restaurants:
+                restaurants = await in_thread(
+                    self.catalog.search, preferences['cuisine'], preferences['location'], True, self.catalog_terms(preferences)
+                ) or []
+
+        scored_restaurants = self.score_restaurants(restaurants, preferences, self.max_candidates)
+        top_k = max(1, self.enrich_top_k if enrich_top_k is None else enrich_top_k)
+        await self.rating_api.enrich_places_async([restaurant for restaurant, _ in scored_restaurants[:top_k]])
+
+        return self.build_ranking(preferences, scored_restaurants)
+
+    def remember_restaurants(self, restaurants: list, preferences: dict):
+        """Add Google search results to the geo index and the catalog"""
+        self.geo_index.add_all(restaurants, preferences['cuisine'])
+        self.catalog.ingest(restaurants, preferences['location'])
+
+    def local_candidates(self, preferences: dict, coordinates: list = None):
+        """
+        The known restaurants nearest to the coordinates that were found for
+        the cuisine, or None if there are too few of them to skip the search
+        """
+        if not coordinates or self.local_min_results < 1:
             return None
-        
-        best_match = scored_restaurants[0][0]
+
+        # Without the background thread, the request refreshes it
+        if self.geo_thread is None:
+            self.refresh_geo_index()
+        with metrics.span('local_search'):
+            nearby = self.geo_index.nearest(
+                *coordinates, k=self.local_max_results, max_distance=self.local_radius, cuisine=preferences['cuisine']
+            )
+        if len(nearby) < self.local_min_results:
+            return None
+        return [dict(place) for _, place in nearby]
+
+    def start_geo_refresh(self, app):
+        """Load the geo index in a background thread, then the new recommendations every geo_refresh_every seconds"""
+        if self.geo_thread is None:
+            self.geo_thread = threading.Thread(target=self.run_geo_refresh, args=(app,), name='geo-index-refresh', daemon=True)
+            self.geo_thread.start()
+
+    def run_geo_refresh(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    self.refresh_geo_index()
+                except Exception:
+                    logger.exception("Geo index refresh failed")
+            time.sleep(self.geo_refresh_every)
+
+    def refresh_geo_index(self):
+        """
+        Add the restaurants of the recommendations stored since the last
+        refresh. The first load reads the latest recommendations only, as
+        many as the geo index keeps places. Returns right away if another
+        thread is refreshing it.
+        """
+        if not has_app_context() or not self.geo_lock.acquire(blocking=False):
+            return
+
+        try:
+            now = datetime.utcnow()
+            if self.geo_refreshed_at and (now - self.geo_refreshed_at).total_seconds() < self.geo_refresh_every:
+                return
+
+            query = db.select(
+                Recommendation.place_id, Recommendation.restaurant_name, Recommendation.cuisine,
+                Recommendation.latitude, Recommendation.longitude, Recommendation.rating,
+                Recommendation.total_ratings, Recommendation.price_level, Recommendation.address,
+                Recommendation.photo_url, Recommendation.website_url, Recommendation.maps_url
+            ).where(
+                Recommendation.place_id.isnot(None),
+                Recommendation.latitude.isnot(None),
+                Recommendation.longitude.isnot(None)
+            )
+            if self.geo_refreshed_at:
+                query = query.where(Recommendation.created_at >= self.geo_refreshed_at - GEO_REFRESH_OVERLAP)
+
+            try:
+                with metrics.span('geo_index_load'):
+                    # Oldest first, so the latest data of a place wins
+                    if self.geo_refreshed_at is None and self.geo_index.max_places:
+                        latest = query.order_by(Recommendation.created_at.desc()).limit(self.geo_index.max_places)
+                        rows = reversed(db.session.execute(latest).all())
+                    else:
+                        rows = db.session.execute(query.order_by(Recommendation.created_at).execution_options(yield_per=1000))
+                    for row in rows:
+                        self.geo_index.add({
+                            'place_id': row.place_id,
+                            'name': row.restaurant_name,
+                            'rating': row.rating,
+                            'user_ratings_total': row.total_ratings,
+                            'price_level': row.price_level,
+                            'formatted_address': row.address,
+                            'geometry': {'location': {'lat': row.latitude, 'lng': row.longitude}},
+                            'photo_url': row.photo_url,
+                            'website_url': row.website_url,
+                            'maps_url': row.maps_url,
+                        }, row.cuisine)
+            except SQLAlchemyError:
+                db.session.rollback()
+                return
+            self.geo_refreshed_at = now
+        finally:
+            self.geo_lock.release()
+
+    def build_ranking(self, preferences: dict, scored_restaurants: list):
+        """The JSON serialisable ranking of the scored restaurants"""
+
+        return {
+            'preferences': {**preferences, 'time': preferences['time'].isoformat() if preferences['time'] else None},
+            'candidates': [self.compact_candidate(restaurant, score) for restaurant, score in scored_restaurants],
+        }
+
+    def serve_candidate(self, ranking: dict, offset: int, user_id: str, user_name: str = ''):
+        """
+        Store and return the candidate at offset in the ranking as a recommendation.
+        Candidates that were not enriched during ranking only get the place
+        details already stored, so serving never calls Google Places.
+        Returns None if there is no candidate at offset.
+        """
+        candidates = ranking.get('candidates', [])
+        if offset < 0 or offset >= len(candidates):
+            return None
+
+        best_match = dict(candidates[offset])
+        if 'maps_url' not in best_match:
+            self.rating_api.enrich_places([best_match], fetch_missing=False)
+
+        preferences = ranking['preferences']
+        time = datetime.fromisoformat(preferences['time']) if preferences.get('time') else None
         
         # Enhanced recommendation data
         recommendation_data = {
             'name': best_match.get('name'),
-            'cuisine': cuisine,
-            'location': location,
-            'guests': guests,
-            'dietary': dietary,
+            'cuisine': preferences.get('cuisine'),
+            'location': preferences.get('location'),
+            'guests': preferences.get('guests'),
+            'dietary': preferences.get('dietary'),
             'booking_time': time,
-            'atmosphere': atmosphere,
-            'budget': budget,
+            'atmosphere': preferences.get('atmosphere'),
+            'budget': preferences.get('budget'),
             'rating': best_match.get('rating'),
             'total_ratings': best_match.get('user_ratings_total'),
             'price_level': best_match.get('price_level'),
@@ -182,7 +421,7 @@ class Recommend:
         # Store recommendation with user_id
         recommendation = Recommendation(
             user_id=user_id,
-            user_name=session.get(f'user_name_{user_id}', ''),
+            user_name=user_name,
             restaurant_name=recommendation_data.get('name'),
             cuisine=recommendation_data.get('cuisine'),
             location=recommendation_data.get('location'),
@@ -202,7 +441,13 @@ class Recommend:
             website_url=recommendation_data.get('website_url'),
             maps_url=recommendation_data.get('maps_url')
         )
-        db.session.add(recommendation)
-        db.session.commit()
+        with metrics.span('recommendation_write'):
+            self.writer.add(recommendation)
         
         return recommendation.to_dict()
+
+    def get_recommendation(self, user_info: dict, user_id: str, enrich_top_k: int = None, user_name: str = '', coordinates: list = None):
+        """Generate and store the best restaurant recommendation based on user preferences"""
+
+        ranking = self.rank_candidates(user_info, enrich_top_k, coordinates)
+        return self.serve_candidate(ranking, 0, user_id, user_name)
@@ -0,0 +1,206 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import event
+from models.db import db, upsert
+from models.id_block import IdBlock
+from sqlalchemy.exc import SQLAlchemyError
+from models.recommendation import Recommendation
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------
+# Recommendation Writer Module
+# ------------------------------------------
+# This module stores the recommendations. By default every
+# recommendation is committed right away. In write-behind mode the
+# rows are put into a bounded queue and a background thread inserts
+# them in group commits, once batch_size rows are waiting or after
+# flush_interval seconds. SQLite is switched to WAL mode so readers do
+# not block the writer. The ids are handed out from blocks reserved in
+# the id_block table, so the response has the final id before the row
+# is written. All processes writing recommendations must use the same
+# mode. The queue is drained when the process exits.
+# ------------------------------------------
+class RecommendationWriter:
+    def __init__(self, mode: str = 'sync', batch_size: int = 100, flush_interval: float = 0.05,
+                 max_pending: int = 1000, id_block_size: int = 100, max_retries: int = 3):
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.id_block_size = id_block_size
+        self.max_retries = max_retries
+
+        self.app = None
+        self.thread = None
+        self.queue = queue.Queue(maxsize=max_pending)
+
+        # Ids of the reserved block still to hand out: [next_id, end_id)
+        self.id_lock = threading.Lock()
+        self.next_id = self.end_id = 0
+
+        self.lock = threading.Lock()
+        self.counters = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "errors": 0,
+            "dropped": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Writer configured from the RECOMMENDATION_WRITE_* environment variables"""
+        return cls(
+            mode=os.getenv('RECOMMENDATION_WRITE_MODE', 'sync'),
+            batch_size=int(os.getenv('RECOMMENDATION_WRITE_BATCH', 100)),
+            flush_interval=float(os.getenv('RECOMMENDATION_WRITE_INTERVAL', 0.05)),
+            max_pending=int(os.getenv('RECOMMENDATION_WRITE_QUEUE', 1000))
+        )
+
+    def init_app(self, app):
+        """Start the background writer if write-behind mode is enabled"""
+        if self.mode != 'write_behind':
+            return
+
+        self.app = app
+        with app.app_context():
+            engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', self.set_pragmas)
+            engine.dispose()  # Reopen pooled connections with the pragmas
+
+        self.thread = threading.Thread(target=self.run, name='recommendation-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL, no fsync per commit
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
+
+    @property
+    def write_behind(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def add(self, recommendation: Recommendation) -> Recommendation:
+        """Store a recommendation, it has its id and created_at on return"""
+        if not self.write_behind:
+            db.session.add(recommendation)
+            db.session.commit()
+            return recommendation
+
+        recommendation.id = self.allocate_id()
+        if recommendation.created_at is None:
+            recommendation.created_at = datetime.utcnow()
+
+        row = {column.name: getattr(recommendation, column.name) for column in Recommendation.__table__.columns}
+        self.queue.put(row)  # Blocks while the queue is full
+        self.count("queued")
+        return recommendation
+
+    def allocate_id(self) -> int:
+        with self.id_lock:
+            if self.next_id >= self.end_id:
+                self.next_id, self.end_id = self.reserve_ids()
+            id = self.next_id
+            self.next_id += 1
+            return id
+
+    def reserve_ids(self):
+        """Reserve the next block of recommendation ids in its own transaction"""
+        table = IdBlock.__table__
+        first_free = db.select(db.func.coalesce(db.func.max(Recommendation.id), 0) + 1).scalar_subquery()
+
+        with db.engine.begin() as connection:
+            # The insert (SQLite) or the update of the row (PostgreSQL) takes the
+            # write lock, so the block is reserved atomically. Rows committed
+            # directly (sync mode) are skipped over.
+            connection.execute(upsert(table, connection).values(name='recommendation', next_value=1).on_conflict_do_nothing())
+            # SQLite's max() of several arguments is greatest() elsewhere
+            greatest = db.func.max if connection.dialect.name == 'sqlite' else db.func.greatest
+            connection.execute(
+                table.update()
+                .where(table.c.name == 'recommendation')
+                .values(next_value=greatest(table.c.next_value, first_free) + self.id_block_size)
+            )
+            end_id = connection.execute(
+                db.select(table.c.next_value).where(table.c.name == 'recommendation')
+            ).scalar()
+        return end_id - self.id_block_size, end_id
+
+    def run(self):
+        """Collect queued rows and write them in group commits"""
+        stopping = False
+        while not stopping:
+            row = self.queue.get()
+            if row is None:
+                self.queue.task_done()
+                break
+
+            rows = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                try:
+                    row = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                rows.append(row)
+
+            self.write(rows)
+            for _ in range(len(rows) + stopping):
+                self.queue.task_done()
+
+    def write(self, rows: list):
+        with self.app.app_context():
+            for attempt in range(self.max_retries):
+                try:
+                    db.session.execute(db.insert(Recommendation.__table__), rows)
+                    db.session.commit()
+                    self.count("written", len(rows))
+                    self.count("batches")
+                    return
+                except SQLAlchemyError:
+                    db.session.rollback()
+                    self.count("errors")
+                    logger.exception("Writing %d recommendations failed (attempt %d)", len(rows), attempt + 1)
+                    time.sleep(self.flush_interval)
+
+        self.count("dropped", len(rows))
+        logger.error("Dropped %d recommendations: %s", len(rows), [row['id'] for row in rows])
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def flush(self):
+        """Wait until all queued recommendations are written"""
+        if self.write_behind:
+            self.queue.join()
+
+    def close(self):
+        """Drain the queue and stop the background writer"""
+        if self.write_behind:
+            self.queue.put(None)
+            self.thread.join()
+
+    def stats(self):
+        """Return the writer counters and queue usage"""
+        with self.lock:
+            return {
+                **self.counters,
+                "mode": self.mode if self.write_behind else 'sync',
+                "pending": self.queue.qsize(),
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+            }
@@ -0,0 +1,286 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from modules.Transport import TransportError
+
+# ------------------------------------------
+# Resilience Module
+# ------------------------------------------
+# This module wraps the transport of the RatingApi (live, record or
+# replay) so a slow or failing Google Places API does not hold up the
+# conversations:
+# - Circuit breaker: after `failures` failed requests in a row (errors,
+#   timeouts, 5xx or 429 responses) of an endpoint, its requests fail
+#   right away with CircuitOpenError for `reset_after` seconds. Then one
+#   trial request is let through, its outcome closes or opens it again.
+#   A trial that is cancelled is given to the next request, a trial that
+#   has not ended after `reset_after` seconds opens the breaker again.
+# - Hedging (optional): if a request takes longer than the p95 latency
+#   of its endpoint, a second identical request is sent and the first
+#   response wins. The p95 is taken over the latest successful requests.
+#   Sync requests run in a small thread pool for this, the request that
+#   loses runs until it completes or times out. Async requests are
+#   tasks, the one that loses is cancelled.
+# The callers degrade while the breaker is open, see RatingApi.
+# ------------------------------------------
+# Responses that mean the upstream is in trouble
+FAILED_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(TransportError):
+    """The circuit breaker of the endpoint is open, the request was not sent"""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failures: int = 5, reset_after: float = 30.0):
+        self.max_failures = failures
+        self.reset_after = reset_after
+
+        self.state = self.CLOSED
+        self.failures = 0      # Failed requests in a row
+        self.opened_at = 0.0
+        self.trial = False     # A half open trial request is in flight
+        self.trial_at = 0.0
+        self.lock = threading.Lock()
+        self.counters = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now"""
+        if self.max_failures < 1:
+            return True
+
+        with self.lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN and self.trial and now - self.trial_at >= self.reset_after:
+                # The trial request hangs, wait for another one
+                self.state = self.OPEN
+                self.opened_at = now
+                self.trial = False
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                self.trial = False
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self.trial):
+                self.trial = self.state == self.HALF_OPEN
+                self.trial_at = now
+                return True
+
+            self.counters["rejected"] += 1
+            return False
+
+    def success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.max_failures >= 1 and (self.state == self.HALF_OPEN or self.failures >= self.max_failures):
+                if self.state != self.OPEN:
+                    self.counters["opened"] += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+    def release(self):
+        """A request ended without an outcome (cancelled), the next request may be the trial"""
+        with self.lock:
+            self.trial = False
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "state": self.state, "failures": self.failures}
+
+
+class LatencyWindow:
+    """Latencies of the latest successful requests of an endpoint"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def p95(self):
+        """The 95th percentile in seconds, None until there are enough samples"""
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            samples = sorted(self.samples)
+        return samples[int(0.95 * (len(samples) - 1))]
+
+
+class ResilientTransport:
+    def __init__(self, transport, breaker_failures: int = 5, breaker_reset: float = 30.0, hedge: bool = False, hedge_workers: int = 32):
+        self.transport = transport
+        self.mode = transport.mode
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.hedge = hedge
+
+        self.breakers = {}   # endpoint -> CircuitBreaker
+        self.latencies = {}  # endpoint -> LatencyWindow
+        self.lock = threading.Lock()
+        self.counters = {"failures": 0, "rejected": 0, "hedged": 0, "hedge_wins": 0}
+
+        # Runs the sync requests that may be hedged
+        self.executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='places-hedge') if hedge else None
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def endpoint_state(self, endpoint: str):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.breaker_failures, self.breaker_reset)
+                self.latencies[endpoint] = LatencyWindow()
+            return self.breakers[endpoint], self.latencies[endpoint]
+
+    def hedge_delay(self, latencies: LatencyWindow):
+        return latencies.p95() if self.hedge else None
+
+    def check(self, response):
+        if response.status_code in FAILED_STATUSES:
+            raise TransportError(f"Google Places responded with status {response.status_code}")
+        return response
+
+    def get(self, endpoint: str, url: str):
+        """Send a GET request, raises TransportError if it failed or the breaker is open"""
+        breaker, latencies = self.endpoint_state(endpoint)
+        if not breaker.allow():
+            self.count("rejected")
+            raise CircuitOpenError(f"Circuit breaker for {endpoint} is open")
+
+        try:
+            response = self.send(endpoint, url, latencies)
+        except Exception:
+            # Errors of the transport itself, e.g. writing the archive, count too
+            breaker.failure()
+            self.count("failures")
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.success()
+        return response
+
+    def send(self, endpoint: str, url: str, latencies: LatencyWindow):
+        delay = self.hedge_delay(latencies)
+        if delay is None:
+            return self.timed(endpoint, url, latencies)
+
+        first = self.executor.submit(self.timed, endpoint, url, latencies)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        # Slower than usual, ask again and take the first response
+        self.count("hedged")
+        second = self.executor.submit(self.timed, endpoint, url, latencies)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except TransportError as e:
+                    error = e
+                    continue
+                if future is second:
+                    self.count("hedge_wins")
+                return response
+        raise error
+
+    def timed(self, endpoint: str, url: str, latencies: LatencyWindow):
+        start = time.perf_counter()
+        response = self.check(self.transport.get(endpoint, url))
+        latencies.add(time.perf_counter() - start)
+        return response
+
+    async def get_async(self, endpoint: str, url: str):
+        """Async version of get"""
+        breaker, latencies = self.endpoint_state(endpoint)
+        if not breaker.allow():
+            self.count("rejected")
+            raise CircuitOpenError(f"Circuit breaker for {endpoint} is open")
+
+        try:
+            response = await self.send_async(endpoint, url, latencies)
+        except Exception:
+            # Errors of the transport itself, e.g. writing the archive, count too
+            breaker.failure()
+            self.count("failures")
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.success()
+        return response
+
+    async def send_async(self, endpoint: str, url: str, latencies: LatencyWindow):
+        delay = self.hedge_delay(latencies)
+        if delay is None:
+            return await self.timed_async(endpoint, url, latencies)
+
+        first = asyncio.ensure_future(self.timed_async(endpoint, url, latencies))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            self.count("hedged")
+            second = asyncio.ensure_future(self.timed_async(endpoint, url, latencies))
+            pending, error = {first, second}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        response = task.result()
+                    except TransportError as e:
+                        error = e
+                        continue
+                    if task is second:
+                        self.count("hedge_wins")
+                    return response
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def timed_async(self, endpoint: str, url: str, latencies: LatencyWindow):
+        start = time.perf_counter()
+        response = self.check(await self.transport.get_async(endpoint, url))
+        latencies.add(time.perf_counter() - start)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    def close(self):
+        self.transport.close()
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            breakers = dict(self.breakers)
+            latencies = dict(self.latencies)
+        p95 = {endpoint: window.p95() for endpoint, window in latencies.items()}
+        return {
+            **self.transport.stats(),
+            **counters,
+            "hedge": self.hedge,
+            "endpoints": {
+                endpoint: {**breaker.stats(), "p95_ms": None if p95[endpoint] is None else round(p95[endpoint] * 1000, 1)}
+                for endpoint, breaker in breakers.items()
+            },
+        }
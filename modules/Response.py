@@ -1,5 +1,5 @@
-import re
-from flask import session
+from modules.Metrics import metrics
+from modules.SlotExtractor import SlotExtractor
 
 # ------------------------------------------
 # Response Module
@@ -23,30 +23,36 @@ class Response:
             'ask_budget': r'(cheap|moderate|expensive)',
         }
 
-    def check_responses(self, responses: dict, user_id: str):
-        """Check all responses for user info and store in session"""
-        
-        user_info = session.get(f'user_info_{user_id}', {})
+        # Compile all patterns once into a single scanner
+        self.slot_extractor = SlotExtractor(self.user_info_patterns)
+
+    def check_response(self, state: str, user_text: str, user_id: str):
+        """
+        Check only the newest response for user info and store in the
+        conversation state.
+        The extraction results are kept per turn, so earlier responses are
+        never scanned again.
+        """
+
+        turn_slots = self.store.get(user_id, 'slots', {})
+        user_info = self.store.get(user_id, 'user_info', {})
+        with metrics.span('slot_extraction'):
+            turn_slots[state] = self.slot_extractor.extract(user_text)
+            self.merge_slots(user_info, turn_slots.values())
+
+        self.store.set(user_id, 'slots', turn_slots)
 
-        for key, pattern in self.user_info_patterns.items():
+        self.store.set(user_id, 'user_info', user_info)
+
+    def merge_slots(self, user_info: dict, extracted: list):
+        """Add the matches of the extracted turns for all slots not yet in user_info"""
+
+        for key in self.user_info_patterns:
             
             # Only check for user info if informmation is not yet available
             if key not in user_info.keys():
-                matches = []
-                for response in responses.values():
-                    if response:
-                        print(response, key, user_info)
-                        # Find all matches in the response
-                        all_matches = re.finditer(pattern, response.lower(), re.IGNORECASE)
-                        for match in all_matches:
-                            # Add each match to the matches array
-                            if match.groups():
-                                matches.extend(match.groups())
-                            else:
-                                matches.append(match.group())
+                matches = [match for slots in extracted for match in slots.get(key, [])]
             
                 # Only store if we found matches
                 if matches:
                     user_info[key] = matches
-
-        session[f'user_info_{user_id}'] = user_info
@@ -0,0 +1,122 @@
+import numpy as np
+
+# ------------------------------------------
+# Scorer Module
+# ------------------------------------------
+# This module scores restaurant candidates against the user preferences.
+# A candidate set is turned into column arrays once (CandidatePool), the
+# match features of all candidates are computed with vectorised string
+# and comparison operations, and the weights are applied to the whole
+# feature matrix in one step. The top K are picked with argpartition.
+# The scores and the ranking are the same as scoring each restaurant in
+# a Python loop and sorting the list.
+# ------------------------------------------
+SEPARATOR = '\x1f'  # Joins list fields, never part of a search term
+
+class CandidatePool:
+    def __init__(self, restaurants: list):
+        """Build the column arrays of a candidate set, reusable for many queries"""
+        self.restaurants = list(restaurants)
+
+        def joined(values):
+            return SEPARATOR + SEPARATOR.join(values) + SEPARATOR
+
+        types = [joined(r.get('types', [])) for r in self.restaurants]
+        self.types = np.array(types, dtype=str)
+        self.types_lower = np.array([value.lower() for value in types], dtype=str)
+        self.names_lower = np.array([(r.get('name') or '').lower() for r in self.restaurants], dtype=str)
+        self.reviews_lower = np.array([
+            joined(review.get('text', '') for review in r.get('reviews', [])).lower()
+            for r in self.restaurants
+        ], dtype=str)
+
+        self.price_level = np.array([r.get('price_level', 2) for r in self.restaurants], dtype=float)
+        self.rating = np.array([r.get('rating', 0) for r in self.restaurants], dtype=float)
+        self.user_ratings_total = np.array([r.get('user_ratings_total', 0) for r in self.restaurants], dtype=float)
+        self.open_now = np.array([bool((r.get('opening_hours') or {}).get('open_now')) for r in self.restaurants], dtype=bool)
+
+    def __len__(self):
+        return len(self.restaurants)
+
+
+class Scorer:
+    # Weights of the match features, in the column order of features()
+    MATCH_WEIGHTS = np.array([
+        2.0,  # Cuisine is one of the types
+        3.0,  # Dietary requirement in the types (critical)
+        2.0,  # Dietary requirement only in the name
+        1.0,  # Atmosphere mentioned in a review
+        2.0,  # Price level matches the budget
+    ])
+    BUDGET_MAP = {'cheap': 1, 'moderate': 2, 'expensive': 3}
+
+    def features(self, pool: CandidatePool, preferences: dict):
+        """
+        Build the feature matrix of a candidate pool: the match features
+        (see MATCH_WEIGHTS) followed by the rating boost, the number of
+        ratings boost and the opening hours boost.
+        """
+        count = len(pool)
+        features = np.zeros((count, 8))
+
+        cuisine = preferences.get('cuisine')
+        if cuisine:
+            features[:, 0] = np.char.find(pool.types, SEPARATOR + cuisine.lower() + SEPARATOR) >= 0
+
+        dietary = preferences.get('dietary')
+        if dietary:
+            in_types = np.char.find(pool.types_lower, dietary.lower()) >= 0
+            features[:, 1] = in_types
+            features[:, 2] = ~in_types & (np.char.find(pool.names_lower, dietary.lower()) >= 0)
+
+        atmosphere = preferences.get('atmosphere')
+        if atmosphere:
+            features[:, 3] = np.char.find(pool.reviews_lower, atmosphere.lower()) >= 0
+
+        budget = preferences.get('budget')
+        if budget:
+            features[:, 4] = pool.price_level == self.BUDGET_MAP.get(budget.lower(), 2)
+
+        features[:, 5] = pool.rating / 2                                    # Up to 2.5 points for 5-star rating
+        features[:, 6] = np.minimum(pool.user_ratings_total / 1000, 1)      # Up to 1 point for 1000+ reviews
+        if preferences.get('time'):
+            features[:, 7] = pool.open_now
+
+        return features
+
+    def score(self, pool: CandidatePool, preferences: dict):
+        """Score all candidates of the pool"""
+        features = self.features(pool, preferences)
+
+        # The match features are whole numbers, so their weighted sum is
+        # exact; the boosts are added in the same order as before to get
+        # bit-identical scores
+        scores = features[:, :5] @ self.MATCH_WEIGHTS
+        scores += features[:, 5]
+        scores += features[:, 6]
+        scores += features[:, 7]
+        return scores
+
+    def rank(self, pool: CandidatePool, preferences: dict, top_k: int = None):
+        """
+        Rank the candidates of the pool, best match first.
+        Returns (indices, scores) of the top K candidates, or of all
+        candidates if top_k is None. Ties keep the order of the pool.
+        """
+        scores = self.score(pool, preferences)
+        count = len(scores)
+
+        if top_k is None or top_k >= count:
+            selected = np.arange(count)
+        elif top_k <= 0:
+            selected = np.arange(0)
+        else:
+            # Take everything above the K-th best score, then fill up with
+            # the earliest candidates that tie with it
+            kth = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+            above = np.flatnonzero(scores > kth)
+            ties = np.flatnonzero(scores == kth)[:top_k - len(above)]
+            selected = np.sort(np.concatenate([above, ties]))
+
+        order = selected[np.argsort(-scores[selected], kind='stable')]
+        return order, scores[order]
@@ -0,0 +1,168 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# ------------------------------------------
+# Search Cache Module
+# ------------------------------------------
+# This module is a bounded in-process cache for Google Places search
+# results. Entries expire after a TTL and are evicted in LRU order once
+# the entry or memory limit is reached. Within a grace window after
+# expiry, stale entries are still served while they are refreshed in
+# the background. Misses can be loaded synchronously or awaited.
+# Expired entries stay until they are evicted, so they can still be
+# served as a fallback while Google can't be reached.
+# ------------------------------------------
+class SearchCache:
+    def __init__(self, ttl: float = 600, grace: float = 300, max_entries: int = 512, max_bytes: int = 16 * 1024 * 1024):
+        self.ttl = ttl
+        self.grace = grace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # key -> {"value", "size", "expires_at", "refreshing"}, oldest first
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "fallbacks": 0,
+        }
+
+        # Background refreshes for stale entries
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='search-cache')
+
+    @staticmethod
+    def make_key(query: str, location: str):
+        """Normalise a (query, location) pair into a cache key"""
+
+        def normalise(value):
+            return " ".join(str(value or "").lower().split())
+
+        return (normalise(query), normalise(location))
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, calling loader on a miss.
+        Stale entries within the grace window are returned immediately
+        and refreshed in the background.
+        """
+        found, value = self.lookup(key, loader)
+        if not found:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    async def get_or_load_async(self, key, loader, async_loader):
+        """
+        As get_or_load, but a miss awaits async_loader. Stale entries are
+        still refreshed in the background with loader.
+        """
+        found, value = self.lookup(key, loader)
+        if not found:
+            value = await async_loader()
+            self.set(key, value)
+        return value
+
+    def lookup(self, key, loader):
+        """Return (True, value) for a cached key, (False, None) on a miss"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now < entry["expires_at"]:
+                self.counters["hits"] += 1
+                self.entries.move_to_end(key)
+                return True, entry["value"]
+
+            if entry and now < entry["expires_at"] + self.grace:
+                self.counters["stale_hits"] += 1
+                self.entries.move_to_end(key)
+                if not entry["refreshing"]:
+                    entry["refreshing"] = True
+                    self.executor.submit(self.refresh, key, loader)
+                return True, entry["value"]
+
+            self.counters["misses"] += 1
+            return False, None
+
+    def fallback(self, key):
+        """Return the cached value for key however old it is, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.counters["fallbacks"] += 1
+            return entry["value"]
+
+    def refresh(self, key, loader):
+        """Reload a stale entry, keeping the stale value if loading fails"""
+        try:
+            value = loader()
+        except Exception:
+            value = None
+
+        with self.lock:
+            if value:
+                self.counters["refreshes"] += 1
+            else:
+                self.counters["refresh_errors"] += 1
+                entry = self.entries.get(key)
+                if entry:
+                    entry["refreshing"] = False
+                return
+
+        self.set(key, value)
+
+    def set(self, key, value):
+        """Store a value, evicting least recently used entries if needed"""
+
+        # Empty results are usually failed searches, so don't keep them
+        if not value or self.ttl <= 0:
+            return
+
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.size -= old["size"]
+
+            self.entries[key] = {
+                "value": value,
+                "size": size,
+                "expires_at": time.monotonic() + self.ttl,
+                "refreshing": False,
+            }
+            self.size += size
+
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted["size"]
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return the cache counters and current usage"""
+        with self.lock:
+            return {
+                **self.counters,
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "grace": self.grace,
+            }
@@ -1,13 +1,36 @@
-from textblob import TextBlob
+import os
+from modules.SentimentAnalyzer import SentimentAnalyzer
+from modules.UrgencyMatcher import UrgencyMatcher
 
 # ------------------------------------------
 # Sentiment Module
 # ------------------------------------------
 # This module is responsible for analysing the sentiment of user messages
 # and generating appropriate responses based on the sentiment.
+# The sentiment is classified by the SentimentAnalyzer, which only
+# falls back to TextBlob for messages the lexicon cannot score.
 # ------------------------------------------
 class Sentiment:
     def __init__(self):
+        self.sentiment_analyzer = SentimentAnalyzer(cache_size=int(os.getenv('SENTIMENT_CACHE_SIZE', 4096)))
+
+        # Keywords indicating urgency
+        urgency_keywords = [
+            'quick', 'hurry', 'fast', 'asap', 'urgent', 'soon',
+            'running late', 'immediately', 'right now', 'emergency',
+            'quickly', 'rush', 'short time', 'busy', 'no time'
+        ]
+
+        # Time-related patterns indicating urgency
+        time_patterns = [
+            'next hour', 'within hour', '30 minutes', '15 minutes',
+            'half hour', 'quarter hour'
+        ]
+
+        # Urgency keywords, time patterns, exclamation marks and repeated
+        # punctuation (!!!???) are found in one pass
+        self.urgency_matcher = UrgencyMatcher(urgency_keywords, time_patterns)
+
         # Define sentiment-specific questions and responses
         self.sentiment_responses = {
             "happy": {
@@ -33,56 +56,23 @@ class Sentiment:
         """
         Analyze if the user's message indicates urgency
         """
-        # Keywords indicating urgency
-        urgency_keywords = [
-            'quick', 'hurry', 'fast', 'asap', 'urgent', 'soon',
-            'running late', 'immediately', 'right now', 'emergency',
-            'quickly', 'rush', 'short time', 'busy', 'no time'
-        ]
-        
-        # Time-related patterns indicating urgency
-        time_patterns = [
-            'next hour', 'within hour', '30 minutes', '15 minutes',
-            'half hour', 'quarter hour'
-        ]
+        return self.urgency_matcher.is_urgent(user_text)
 
-        text = user_text.lower()
-        
-        # Check for urgency keywords
-        has_urgency_keywords = any(keyword in text for keyword in urgency_keywords)
-        
-        # Check for time patterns
-        has_time_urgency = any(pattern in text for pattern in time_patterns)
-        
-        # Check for exclamation marks (might indicate urgency)
-        has_exclamations = '!' in text
-        
-        # Check for repeated punctuation (!!!???)
-        has_repeated_punctuation = any(p * 2 in text for p in '!?.')
-        
-        # Return True if multiple urgency indicators are present
-        urgency_score = sum([
-            has_urgency_keywords,
-            has_time_urgency,
-            has_exclamations and has_repeated_punctuation
-        ])
-        
-        return urgency_score >= 1
+    def urgency_signals(self, user_text: str) -> dict:
+        """
+        Report which urgency signals the user's message contains
+        """
+        return self.urgency_matcher.signals(user_text)
     
     def analyze_sentiment(self, user_text: str):
         """Analyze the sentiment of the user's message"""
 
-        blob = TextBlob(user_text)
-        sentiment = blob.sentiment.polarity
-        
-        # Enhanced sentiment analysis with subjectivity consideration
-        if sentiment > 0.3:
-            return "happy"
-        elif sentiment < -0.2:
-            return "sad"
-        else:
-            return "neutral"
-        
+        return self.sentiment_analyzer.analyze(user_text)
+
+    def analyze_sentiments(self, user_texts: list):
+        """Analyze the sentiment of many messages in one call"""
+
+        return self.sentiment_analyzer.analyze_many(user_texts)
 
     def make_question_urgent(self, question: str) -> str:
         """Make questions more concise for urgent cases"""
@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+import importlib.util
+from functools import lru_cache
+from xml.etree import ElementTree
+from modules.Metrics import metrics
+
+# ------------------------------------------
+# Sentiment Analyzer Module
+# ------------------------------------------
+# This module classifies the sentiment of a message as happy, neutral
+# or sad with the same polarity as TextBlob, but without TextBlob for
+# most messages. TextBlob's English sentiment lexicon (en-sentiment.xml)
+# is read directly, and simple messages (words, quotes and end-of-word
+# punctuation, no negations or intensifiers) are scored by averaging
+# the lexicon polarities, as TextBlob does. Everything else, and scores
+# close to the happy or sad threshold, falls back to TextBlob, which is
+# only imported then. Results are cached per text.
+# ------------------------------------------
+HAPPY_THRESHOLD = 0.3   # Polarity above this is happy
+SAD_THRESHOLD = -0.2    # Polarity below this is sad
+
+# Words followed by optional punctuation; anything else goes to TextBlob
+SIMPLE_WORD = re.compile(r'([A-Za-z0-9]+)([.,;:?!]*)')
+# Words TextBlob keeps together with a following period (abbreviations)
+ABBREVIATION = re.compile(r'[A-Za-z]|[A-Z][bcdfghjklmnpqrstvwxz|]+')
+NEGATIONS = frozenset(('no', 'not', 'never'))
+
+
+def classify(polarity: float) -> str:
+    """Turn a polarity into happy, neutral or sad"""
+    if polarity > HAPPY_THRESHOLD:
+        return "happy"
+    elif polarity < SAD_THRESHOLD:
+        return "sad"
+    else:
+        return "neutral"
+
+
+class SentimentAnalyzer:
+    def __init__(self, margin: float = 0.05, cache_size: int = 4096):
+        # Lexicon scores within margin of a threshold are checked with TextBlob
+        self.margin = margin
+
+        self.polarities = None  # word -> polarity
+        self.modifiers = None   # Words that intensify the next word (adverbs)
+        self.lexicon_lock = threading.Lock()
+        self.textblob = None
+
+        self.counters = {"lexicon": 0, "textblob": 0}
+        self.analyze = lru_cache(maxsize=cache_size)(self.analyze_uncached)
+
+    @staticmethod
+    def lexicon_path():
+        """Path of TextBlob's sentiment lexicon, found without importing TextBlob"""
+        spec = importlib.util.find_spec('textblob')
+        if spec is None or not spec.submodule_search_locations:
+            return None
+        return os.path.join(spec.submodule_search_locations[0], 'en', 'en-sentiment.xml')
+
+    def load_lexicon(self):
+        """Read the word polarities the same way TextBlob does"""
+        with self.lexicon_lock:
+            if self.polarities is not None:
+                return
+
+            path = self.lexicon_path()
+            words = {}
+            if path and os.path.exists(path):
+                for word in ElementTree.parse(path).getroot().findall('word'):
+                    form = word.attrib.get('form')
+                    if form:
+                        polarity = float(word.attrib.get('polarity', 0.0))
+                        words.setdefault(form, {}).setdefault(word.attrib.get('pos'), []).append(polarity)
+
+            # Average over the senses of each part of speech, then over the parts of speech
+            for form, tags in words.items():
+                words[form] = {pos: sum(values) / float(len(values)) for pos, values in tags.items()}
+            for form, tags in words.items():
+                tags[None] = sum(tags.values()) / float(len(tags))
+
+            # TextBlob also maps adjectives to adverbs ("terrible" -> "terribly")
+            for form, tags in list(words.items()):
+                if 'JJ' in tags:
+                    if form.endswith('y'):
+                        form = form[:-1] + 'i'
+                    if form.endswith('le'):
+                        form = form[:-2]
+                    adverb = words.setdefault(form + 'ly', {})
+                    adverb['RB'] = adverb[None] = tags['JJ']
+
+            self.modifiers = frozenset(form for form, tags in words.items() if 'RB' in tags)
+            self.polarities = {form: tags[None] for form, tags in words.items()}
+
+    def lexicon_polarity(self, text: str):
+        """
+        Polarity of a simple message from the lexicon, or None if the
+        message needs TextBlob (negations, intensifiers, other tokens)
+        """
+        if self.polarities is None:
+            self.load_lexicon()
+        if not self.polarities:
+            return None  # Lexicon not found
+
+        # Quotes are separate tokens for TextBlob, after splitting off "n't"
+        text = text.replace("n't", " n't").replace("'", " ").replace('"', ' ')
+
+        scores = []
+        for chunk in text.split():
+            match = SIMPLE_WORD.fullmatch(chunk)
+            if match is None:
+                return None
+            word, punctuation = match.groups()
+            if '.' in punctuation and ABBREVIATION.fullmatch(word):
+                return None
+
+            word = word.lower()
+            if word in NEGATIONS or word in self.modifiers:
+                return None
+            if word in self.polarities:
+                scores.append(self.polarities[word])
+
+            # Exclamation marks boost the previous word
+            for _ in range(punctuation.count('!')):
+                if scores:
+                    scores[-1] = max(-1.0, min(scores[-1] * 1.25, +1.0))
+
+        return sum(scores) / float(len(scores) or 1)
+
+    def textblob_polarity(self, text: str) -> float:
+        if self.textblob is None:
+            from textblob import TextBlob
+            self.textblob = TextBlob
+        return self.textblob(text).sentiment.polarity
+
+    def near_threshold(self, polarity: float) -> bool:
+        return abs(polarity - HAPPY_THRESHOLD) <= self.margin or abs(polarity - SAD_THRESHOLD) <= self.margin
+
+    def analyze_uncached(self, text: str) -> str:
+        polarity = self.lexicon_polarity(text)
+        if polarity is None or self.near_threshold(polarity):
+            self.counters["textblob"] += 1
+            with metrics.span('textblob'):
+                polarity = self.textblob_polarity(text)
+        else:
+            self.counters["lexicon"] += 1
+        return classify(polarity)
+
+    def analyze_many(self, texts: list) -> list:
+        """Classify many messages at once, each distinct text is analysed once"""
+        results = {}
+        for text in texts:
+            if text not in results:
+                results[text] = self.analyze(text)
+        return [results[text] for text in texts]
+
+    def stats(self):
+        """Return how many messages were scored by the lexicon and by TextBlob"""
+        info = self.analyze.cache_info()
+        return {**self.counters, "cache_hits": info.hits, "cache_misses": info.misses, "cache_size": info.currsize}
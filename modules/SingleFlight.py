@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+# ------------------------------------------
+# Single Flight Module
+# ------------------------------------------
+# This module coalesces identical calls that are in flight at the same
+# time: the first caller of a key runs the call, callers of the same key
+# that arrive before it finished wait for it and get its result (or its
+# exception) instead of running their own. Threads and asyncio tasks
+# share the same calls, every call is tracked with a concurrent Future
+# that threads wait on and tasks await. An async call runs in its own
+# task, so cancelling one of the callers does not cancel it for the
+# others. Finished calls are forgotten, caching results is left to the
+# caller (see SearchCache).
+# ------------------------------------------
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}  # key -> Future of the call in flight
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "shared": 0}
+
+    def join(self, key):
+        """Return (future, leader), leader is True if the caller has to run the call"""
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.counters["shared"] += 1
+                return future, False
+
+            future = self.calls[key] = Future()
+            future.set_running_or_notify_cancel()  # Waiters can't cancel it
+            self.counters["calls"] += 1
+            return future, True
+
+    def finish(self, key, future: Future, result=None, error: BaseException = None):
+        with self.lock:
+            del self.calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """
+        Call fn unless a call for key is already in flight, then wait for that one.
+        Returns (result, shared), shared is True if the result came from another caller.
+        """
+        future, leader = self.join(key)
+        if not leader:
+            return future.result(), True
+        return self.run(key, future, fn), False
+
+    def submit(self, executor, key, fn):
+        """
+        As do, but fn runs in the executor and the caller does not wait.
+        Returns (future, shared), the future of the result of the call.
+        Callers of the same key then share the call even if the executor
+        would only have run theirs after the first one finished.
+        """
+        future, leader = self.join(key)
+        if leader:
+            executor.submit(self.run, key, future, fn)
+        return future, not leader
+
+    def run(self, key, future: Future, fn):
+        try:
+            result = fn()
+        except BaseException as error:
+            self.finish(key, future, error=error)
+            raise
+        self.finish(key, future, result)
+        return result
+
+    async def do_async(self, key, fn):
+        """As do, but fn returns a coroutine and the call is awaited"""
+        future, leader = self.join(key)
+        if leader:
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda task: self.finish_task(key, future, task))
+
+        return await asyncio.wrap_future(future), not leader
+
+    def finish_task(self, key, future: Future, task: asyncio.Task):
+        if task.cancelled():
+            self.finish(key, future, error=asyncio.CancelledError())
+        else:
+            self.finish(key, future, task.result() if task.exception() is None else None, task.exception())
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "in_flight": len(self.calls)}
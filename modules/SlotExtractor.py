@@ -0,0 +1,79 @@
+import re
+
+# ------------------------------------------
+# Slot Extractor Module
+# ------------------------------------------
+# This module extracts the user info slots from an utterance. All slot
+# patterns are compiled once into a combined scanner: one alternation
+# that finds the next position where any slot matches, and one matcher
+# with a named lookahead group per slot that reads every slot at that
+# position. This finds all slots in a single pass over the text, with
+# the same matches as running re.finditer with each pattern on its own.
+# ------------------------------------------
+class SlotExtractor:
+    # Lowercase characters that match an ASCII letter with re.IGNORECASE
+    IGNORECASE_FOLD = str.maketrans({'ı': 'i', 'ſ': 's'})
+
+    def __init__(self, patterns: dict):
+        """
+        Compile the slot patterns (slot name -> regex) into the scanner.
+        Matching is case-insensitive, the patterns must not be able to
+        match an empty string.
+        """
+        self.patterns = dict(patterns)
+        names = [f"slot{index}" for index in range(len(self.patterns))]
+
+        # The text is lowercased before matching, so lowercase ASCII patterns
+        # can be matched case-sensitively on the folded text, which is a lot
+        # faster than re.IGNORECASE
+        self.fold = all(pattern.isascii() and pattern == pattern.lower() for pattern in self.patterns.values())
+        flags = 0 if self.fold else re.IGNORECASE
+
+        self.finder = re.compile("|".join(f"(?:{pattern})" for pattern in self.patterns.values()), flags)
+        self.matcher = re.compile("".join(
+            f"(?:(?=(?P<{name}>{pattern})))?"
+            for name, pattern in zip(names, self.patterns.values())
+        ), flags)
+
+        # (slot, group of the whole slot match, groups of the slot pattern)
+        self.slot_groups = []
+        for name, (slot, pattern) in zip(names, self.patterns.items()):
+            group = self.matcher.groupindex[name]
+            inner_groups = tuple(range(group + 1, group + 1 + re.compile(pattern).groups))
+            self.slot_groups.append((slot, group, inner_groups))
+
+    def extract(self, text: str) -> dict:
+        """
+        Find all slot matches in a single pass over the text.
+        Returns a dict slot -> list of matches (the pattern's groups, or
+        the whole match for patterns without groups) for every slot found.
+        """
+        found = {}
+        if not text:
+            return found
+
+        text = text.lower()
+        scan_text = text.translate(self.IGNORECASE_FOLD) if self.fold else text
+
+        # Position from which the next match of each slot may start, which
+        # keeps the matches of a slot non-overlapping like re.finditer
+        next_start = {}
+        hit = self.finder.search(scan_text)
+        while hit:
+            position = hit.start()
+            match = self.matcher.match(scan_text, position)
+            for slot, group, inner_groups in self.slot_groups:
+                end = match.end(group)
+                if end < 0 or position < next_start.get(slot, 0):
+                    continue
+
+                next_start[slot] = end
+
+                # Slice the original text, the folded text has the same length
+                matches = found.setdefault(slot, [])
+                for group_start, group_end in (match.span(inner) for inner in inner_groups or (group,)):
+                    matches.append(text[group_start:group_end] if group_start >= 0 else None)
+
+            hit = self.finder.search(scan_text, position + 1)
+
+        return found
@@ -0,0 +1,337 @@
+import os
+import json
+import mmap
+import time
+import asyncio
+import struct
+import atexit
+import hashlib
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------
+# Transport Module
+# ------------------------------------------
+# This module sends the Google Places requests of the RatingApi.
+# - live: requests go to Google (default)
+# - record: requests go to Google and the responses are saved in an
+#   on-disk archive
+# - replay: the responses are served from the archive, optionally after
+#   a simulated latency, without any network access
+# Every transport can also be awaited (get_async); live requests are then
+# sent with aiohttp, which is only imported for the async path. Live
+# requests have a connect and a read timeout, failed requests raise a
+# TransportError on both paths.
+# A request is identified by its endpoint and query parameters without
+# the API key. The archive is a directory with an append-only data file
+# and an index sorted by request hash, which is memory-mapped and
+# binary searched, so a replay lookup costs a few microseconds. As in
+# git's pack index, a fan-out table of the first hash byte narrows the
+# search first.
+# ------------------------------------------
+MODES = ('live', 'record', 'replay')
+
+INDEX_MAGIC = b'PLACEIX1'
+INDEX_HEADER = struct.Struct('<8sQQ')     # magic, data file size, entries
+INDEX_FANOUT = struct.Struct('<256I')     # entries with a first hash byte <= i
+INDEX_ENTRY = struct.Struct('<16sQIH2x')  # request hash, body offset, body length, status
+RECORD_HEADER = struct.Struct('<16sHI')   # request hash, status, body length
+
+
+class TransportError(Exception):
+    """A request failed (connection error, timeout, ...)"""
+
+
+class ArchivedResponse:
+    """The parts of a requests.Response used by the RatingApi, for replayed
+    and async responses"""
+
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class PlacesArchive:
+    def __init__(self, path: str):
+        self.path = path
+        self.data_path = os.path.join(path, 'responses.bin')
+        self.index_path = os.path.join(path, 'responses.idx')
+
+        self.lock = threading.Lock()
+        self.file = None     # Data file opened for appending (record)
+        self.entries = None  # hash -> (offset, length, status) while recording
+        self.data = None     # Memory-mapped data and index files (replay)
+        self.index = None
+        self.fanout = None
+
+    @staticmethod
+    def request_params(url: str) -> list:
+        """The sorted query parameters of a request, without the API key"""
+        return sorted((name, value) for name, value in parse_qsl(urlsplit(url).query, keep_blank_values=True) if name != 'key')
+
+    @classmethod
+    def request_key(cls, endpoint: str, url: str) -> bytes:
+        """Hash of the endpoint and the sorted query parameters, without the API key"""
+        return hashlib.blake2b(json.dumps([endpoint, cls.request_params(url)]).encode(), digest_size=16).digest()
+
+    def scan(self) -> dict:
+        """Read the entries of the data file, the last response of a request wins"""
+        entries = {}
+        if not os.path.exists(self.data_path) or not os.path.getsize(self.data_path):
+            return entries
+
+        with open(self.data_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset, size = 0, len(data)
+            while offset + RECORD_HEADER.size <= size:
+                key, status, length = RECORD_HEADER.unpack_from(data, offset)
+                offset += RECORD_HEADER.size
+                if offset + length > size:
+                    break  # Incomplete last record
+                entries[key] = (offset, length, status)
+                offset += length
+        return entries
+
+    def write_index(self, entries: dict):
+        """Write the index of entries, sorted by request hash, atomically"""
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        temporary = self.index_path + '.tmp'
+        fanout = [0] * 256
+        for key in entries:
+            fanout[key[0]] += 1
+        for byte in range(1, 256):
+            fanout[byte] += fanout[byte - 1]
+
+        with open(temporary, 'wb') as file:
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, data_size, len(entries)))
+            file.write(INDEX_FANOUT.pack(*fanout))
+            file.write(b''.join(INDEX_ENTRY.pack(key, *entries[key]) for key in sorted(entries)))
+        os.replace(temporary, self.index_path)
+
+    def index_is_current(self) -> bool:
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as file:
+            header = file.read(INDEX_HEADER.size)
+        if len(header) < INDEX_HEADER.size:
+            return False
+        magic, data_size, _ = INDEX_HEADER.unpack(header)
+        return magic == INDEX_MAGIC and data_size == os.path.getsize(self.data_path)
+
+    def open_for_replay(self):
+        """Map the data and index files, rebuilding the index if it is missing or outdated"""
+        if not os.path.exists(self.data_path):
+            logger.warning("Places archive %s is empty, every request will miss", self.path)
+            return self
+        if not self.index_is_current():
+            self.write_index(self.scan())
+
+        with open(self.index_path, 'rb') as file:
+            self.index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.fanout = (0,) + INDEX_FANOUT.unpack_from(self.index, INDEX_HEADER.size)
+        if os.path.getsize(self.data_path):
+            with open(self.data_path, 'rb') as file:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def open_for_record(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.entries = self.scan()
+
+        # Drop an incomplete last record left by an interrupted recording
+        end = max((offset + length for offset, length, _ in self.entries.values()), default=0)
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > end:
+            os.truncate(self.data_path, end)
+
+        self.file = open(self.data_path, 'ab')
+        return self
+
+    def lookup(self, key: bytes):
+        """Binary search the index, returns (status, body) or None"""
+        low, high = self.fanout[key[0]], self.fanout[key[0] + 1]
+        index, header, entry = self.index, INDEX_HEADER.size + INDEX_FANOUT.size, INDEX_ENTRY.size
+        while low < high:
+            middle = (low + high) // 2
+            position = header + middle * entry
+            found = index[position:position + 16]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                _, offset, length, status = INDEX_ENTRY.unpack_from(index, position)
+                return status, self.data[offset:offset + length]
+        return None
+
+    def append(self, key: bytes, status: int, body: bytes):
+        with self.lock:
+            self.file.write(RECORD_HEADER.pack(key, status, len(body)))
+            offset = self.file.tell()
+            self.file.write(body)
+            self.file.flush()
+            self.entries[key] = (offset, len(body), status)
+
+    def save(self):
+        """Write the index of everything recorded so far"""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                self.write_index(self.entries)
+
+    def close(self):
+        self.save()
+        with self.lock:
+            for resource in (self.file, self.data, self.index):
+                if resource is not None:
+                    resource.close()
+            self.file = self.data = self.index = None
+
+
+class LiveTransport:
+    mode = 'live'
+
+    def __init__(self, session, max_connections: int = 100, timeout: tuple = (3.05, 10.0)):
+        self.session = session
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0}
+
+        # Seconds to connect and between bytes of the response
+        self.timeout = timeout
+
+        # aiohttp sessions of the async path, one per event loop they were made in
+        self.max_connections = max_connections
+        self.async_sessions = {}
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def get(self, endpoint: str, url: str):
+        """Send a GET request to a Google Places endpoint"""
+        self.count("requests")
+        try:
+            return self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise TransportError(str(e)) from e
+
+    async def get_async_session(self):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            session = self.async_sessions.get(loop)
+            # Sessions of event loops that have ended, their connectors would leak
+            ended = [self.async_sessions.pop(other) for other in list(self.async_sessions) if other.is_closed()]
+            if session is None:
+                import aiohttp
+                session = self.async_sessions[loop] = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=self.max_connections),
+                    timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout[0], sock_read=self.timeout[1]),
+                )
+        # Their loop is closed, so closing them only releases the connectors
+        for other in ended:
+            await other.close()
+        return session
+
+    async def get_async(self, endpoint: str, url: str):
+        """Send a GET request to a Google Places endpoint without blocking the event loop"""
+        import aiohttp
+        self.count("requests")
+        try:
+            session = await self.get_async_session()
+            async with session.get(url) as response:
+                return ArchivedResponse(response.status, await response.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise TransportError(str(e)) from e
+
+    async def aclose(self):
+        """Close the aiohttp session of the running event loop"""
+        with self.lock:
+            session = self.async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def close(self):
+        pass
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "mode": self.mode}
+
+
+class RecordTransport(LiveTransport):
+    mode = 'record'
+
+    def __init__(self, session, archive: PlacesArchive, save_every: int = 1000, timeout: tuple = (3.05, 10.0)):
+        super().__init__(session, timeout=timeout)
+        self.archive = archive.open_for_record()
+        self.save_every = save_every
+        self.counters["recorded"] = 0
+        atexit.register(self.close)
+
+    def get(self, endpoint: str, url: str):
+        return self.record(endpoint, url, super().get(endpoint, url))
+
+    async def get_async(self, endpoint: str, url: str):
+        return self.record(endpoint, url, await super().get_async(endpoint, url))
+
+    def record(self, endpoint: str, url: str, response):
+        self.archive.append(self.archive.request_key(endpoint, url), response.status_code, response.content)
+        self.count("recorded")
+        if self.counters["recorded"] % self.save_every == 0:
+            self.archive.save()
+        return response
+
+    def close(self):
+        self.archive.close()
+
+
+class ReplayTransport(LiveTransport):
+    mode = 'replay'
+
+    def __init__(self, archive: PlacesArchive, latency: float = 0.0):
+        super().__init__(None)
+        self.archive = archive.open_for_replay()
+        self.latency = latency
+        self.counters.update(hits=0, misses=0)
+
+    def get(self, endpoint: str, url: str):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.replay(endpoint, url)
+
+    async def get_async(self, endpoint: str, url: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.replay(endpoint, url)
+
+    def replay(self, endpoint: str, url: str):
+        self.count("requests")
+        key = self.archive.request_key(endpoint, url)
+        found = self.archive.lookup(key) if self.archive.index else None
+        if found is None:
+            self.count("misses")
+            # The parameters without the API key, the URL would leak it into the logs
+            logger.warning("No recorded response for %s request %s (%s)",
+                           endpoint, urlencode(self.archive.request_params(url)), key.hex())
+            return ArchivedResponse(404, b'{}')
+        self.count("hits")
+        return ArchivedResponse(*found)
+
+    def close(self):
+        self.archive.close()
+
+
+def create_transport(session, mode: str = 'live', archive: str = 'places_archive', latency: float = 0.0, timeout: tuple = (3.05, 10.0)):
+    """Create the transport for a mode: live, record or replay"""
+    if mode == 'live':
+        return LiveTransport(session, timeout=timeout)
+    if mode == 'record':
+        return RecordTransport(session, PlacesArchive(archive), timeout=timeout)
+    if mode == 'replay':
+        return ReplayTransport(PlacesArchive(archive), latency)
+    raise ValueError(f"Unknown transport mode '{mode}', use one of: {', '.join(MODES)}")
@@ -0,0 +1,87 @@
+import re
+
+# ------------------------------------------
+# Urgency Matcher Module
+# ------------------------------------------
+# This module finds the urgency signals of a message: urgency keywords,
+# urgent time patterns, exclamation marks and repeated punctuation.
+# All phrases are compiled once into a single alternation, factored as
+# a trie so every position of a message is checked in one step, however
+# long the message is.
+# Matching is plain substring matching on the lowercased message, so
+# 'fast' also matches 'breakfast'.
+# ------------------------------------------
+REPEATED_PUNCTUATION = ('!!', '??', '..')
+
+
+def compile_phrases(phrases, lookahead: bool = False):
+    """Compile phrases into one regex, factored by common prefixes"""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else '(?:%s)' % '|'.join(alternatives)
+        return '(?:%s)?' % body if '' in node else body
+
+    pattern = build(trie)
+    # A lookahead finds the phrases starting at every position, overlapping ones included
+    return re.compile('(?=(%s))' % pattern if lookahead else pattern)
+
+
+class UrgencyMatcher:
+    def __init__(self, keywords: list, time_patterns: list):
+        self.keywords = tuple(keywords)
+        self.time_patterns = tuple(time_patterns)
+
+        # Decides if a message is urgent: any keyword, time pattern or '!!'
+        self.phrases = self.keywords + self.time_patterns + ('!!',)
+        self.search = compile_phrases(self.phrases)
+
+        # Finds all signals, with the category of every phrase. A match
+        # also counts for the phrases it starts with ('quickly' -> 'quick').
+        self.categories = {phrase: 'repeated_punctuation' for phrase in REPEATED_PUNCTUATION}
+        self.categories['!'] = 'exclamation'
+        self.categories.update((phrase, 'time_patterns') for phrase in self.time_patterns)
+        self.categories.update((phrase, 'keywords') for phrase in self.keywords)
+        self.finder = compile_phrases(self.categories, lookahead=True)
+        self.prefixes = {
+            phrase: [other for other in self.categories if phrase.startswith(other)]
+            for phrase in self.categories
+        }
+
+    def is_urgent(self, text: str) -> bool:
+        """True if the message has an urgency keyword or time pattern, or '!' and repeated punctuation"""
+        text = text.lower()
+        if self.search.search(text) is not None:
+            return True
+
+        # '!!' is covered above, '!' may come with '??' or '..' anywhere else
+        return '!' in text and ('??' in text or '..' in text)
+
+    def signals(self, text: str) -> dict:
+        """All urgency signals of the message, in order of first appearance"""
+        text = text.lower()
+        found = []
+        for match in self.finder.finditer(text):
+            found.extend(phrase for phrase in self.prefixes[match.group(1)] if phrase not in found)
+
+        signals = {'keywords': [], 'time_patterns': [], 'exclamation': False, 'repeated_punctuation': []}
+        for phrase in found:
+            category = self.categories[phrase]
+            if category == 'exclamation':
+                signals['exclamation'] = True
+            else:
+                signals[category].append(phrase)
+
+        signals['urgent'] = bool(
+            signals['keywords'] or signals['time_patterns'] or
+            (signals['exclamation'] and signals['repeated_punctuation'])
+        )
+        return signals
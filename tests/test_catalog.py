@@ -0,0 +1,83 @@
+import pytest
+from flask import Flask
+from models.db import db
+from modules.Recommend import Recommend
+from modules.RecommendationWriter import RecommendationWriter
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Catalog Tests
+# ------------------------------------------
+# Fills the catalog with the search results of a stub Google Places
+# server for a cuisine and location, then checks which preferences are
+# answered from the catalog and which still go to Google: places must
+# match the dietary and atmosphere preferences in their types or reviews.
+# ------------------------------------------
+USER_INFO = {'ask_cuisine': ['italian'], 'ask_location': ['city']}
+
+
+@pytest.fixture
+def stub():
+    with StubPlaces(latency=0, results=12) as stub:
+        yield stub
+
+
+@pytest.fixture
+def recommend(stub, tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+
+    # Built outside the app context, so the geo index is not loaded in the background
+    recommend = Recommend(writer=RecommendationWriter())
+    recommend.rating_api.config['google'].update(stub.google_config())
+    recommend.catalog.min_results = 10
+    with app.app_context():
+        db.create_all()
+        results = recommend.rating_api.search_places('city', 'italian')
+        # Half of the places have a review that mentions vegan food
+        for result in results[::2]:
+            result['reviews'] = [{'text': 'Great vegan options', 'rating': 5}]
+        recommend.catalog.ingest(results, 'city')
+        yield recommend
+        db.session.remove()
+
+
+def searches(stub, recommend, user_info: dict) -> int:
+    """The Google searches sent to rank the candidates for the user info"""
+    before = stub.count('/textsearch/json')
+    ranking = recommend.rank_candidates(user_info)
+    assert ranking['candidates']
+    return stub.count('/textsearch/json') - before
+
+
+def test_cuisine_and_location_are_answered_from_the_catalog(stub, recommend):
+    assert searches(stub, recommend, USER_INFO) == 0
+    assert searches(stub, recommend, {**USER_INFO, 'ask_dietary': ['no restrictions']}) == 0
+
+
+@pytest.mark.parametrize('dietary', ['halal', 'vegan'])
+def test_unmatched_dietary_preference_searches_google(stub, recommend, dietary):
+    # Enough places for the cuisine and location, too few (vegan) or none (halal) for the diet
+    assert searches(stub, recommend, {**USER_INFO, 'ask_dietary': [dietary]}) == 1
+    assert recommend.catalog.stats()['thin'] == 1
+
+
+def test_matched_dietary_preference_is_answered_from_the_catalog(stub, recommend):
+    recommend.catalog.min_results = 5
+    before = stub.count('/textsearch/json')
+    ranking = recommend.rank_candidates({**USER_INFO, 'ask_dietary': ['vegan']})
+    assert stub.count('/textsearch/json') == before
+    assert len(ranking['candidates']) == 6
+
+
+def test_unmatched_atmosphere_searches_google(stub, recommend):
+    assert searches(stub, recommend, {**USER_INFO, 'ask_atmosphere': ['quiet']}) == 1
+
+
+def test_catalog_is_off_on_other_databases(stub, recommend, monkeypatch):
+    # FTS5 and the JSON functions are SQLite's
+    monkeypatch.setattr(db.engine.dialect, 'name', 'postgresql')
+    assert recommend.catalog.search('italian', 'city', fallback=True) is None
+    assert recommend.catalog.ingest([{'place_id': 'place-x', 'name': 'Trattoria'}], 'city') == 0
+    assert searches(stub, recommend, USER_INFO) == 1
@@ -0,0 +1,80 @@
+import pytest
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from models.db import db
+from modules.ConversationStore import ConversationStore
+
+# ------------------------------------------
+# Conversation Store Tests
+# ------------------------------------------
+# Every request must work on its own copy of the conversation state:
+# changes of a request that is still running, or whose write failed,
+# must not be seen by other requests.
+# ------------------------------------------
+USER = 'user-1'
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    store = ConversationStore()
+    store.init_app(app)
+    app.extensions['conversation_store'] = store
+    with app.app_context():
+        db.create_all()
+
+        # A committed record, in the cache
+        store.set(USER, 'step', 1)
+        store.set(USER, 'slots', {'ask_cuisine': ['italian']})
+        store.flush()
+    return app
+
+
+def test_interleaved_requests_do_not_see_each_other(app):
+    store = app.extensions['conversation_store']
+    with app.app_context():
+        assert store.get(USER, 'step') == 1
+        store.set(USER, 'step', 2)
+        store.get(USER, 'slots')['ask_location'] = ['city']
+
+        # A second request of the user before the first one is written
+        with app.app_context():
+            assert store.get(USER, 'step') == 1
+            assert store.get(USER, 'slots') == {'ask_cuisine': ['italian']}
+
+        store.flush()
+
+    with app.app_context():
+        assert store.get(USER, 'step') == 2
+        assert store.get(USER, 'slots') == {'ask_cuisine': ['italian'], 'ask_location': ['city']}
+
+
+def test_failed_flush_is_not_read_as_committed(app, monkeypatch):
+    store = app.extensions['conversation_store']
+    with app.app_context():
+        store.set(USER, 'step', 2)
+
+        def commit():
+            raise OperationalError('COMMIT', {}, Exception('database is locked'))
+
+        monkeypatch.setattr(db.session, 'commit', commit)
+        with pytest.raises(OperationalError):
+            store.flush()
+        monkeypatch.undo()
+
+    with app.app_context():
+        assert store.get(USER, 'step') == 1
+        assert store.get(USER, 'slots') == {'ask_cuisine': ['italian']}
+
+
+def test_cached_record_is_current_after_a_write(app):
+    store = app.extensions['conversation_store']
+    with app.app_context():
+        store.set(USER, 'step', 3)
+        store.flush()
+    assert store.cache[USER][0] == 2
+
+    with app.app_context():
+        assert store.get(USER, 'step') == 3
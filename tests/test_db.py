@@ -0,0 +1,39 @@
+import pytest
+from types import SimpleNamespace
+from flask import Flask
+from sqlalchemy.dialects import postgresql, mysql
+from models.db import db, upsert
+from models.place_details import PlaceDetails
+
+# ------------------------------------------
+# Database Helper Tests
+# ------------------------------------------
+# The stores upsert with the INSERT ... ON CONFLICT of the database's
+# dialect, SQLite or PostgreSQL; other databases are refused.
+# ------------------------------------------
+def place_details_upsert(bind=None):
+    stmt = upsert(PlaceDetails, bind).values(place_id='place-1', website_url='https://example.com', maps_url='')
+    return stmt.on_conflict_do_update(index_elements=['place_id'], set_={'website_url': stmt.excluded.website_url})
+
+
+def test_upsert_on_sqlite(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(place_details_upsert())
+        db.session.execute(place_details_upsert())
+        db.session.commit()
+        assert db.session.scalar(db.select(db.func.count()).select_from(PlaceDetails)) == 1
+
+
+def test_upsert_on_postgresql():
+    dialect = postgresql.dialect()
+    sql = str(place_details_upsert(SimpleNamespace(dialect=dialect)).compile(dialect=dialect))
+    assert 'ON CONFLICT (place_id) DO UPDATE SET website_url = excluded.website_url' in sql
+
+
+def test_upsert_needs_sqlite_or_postgresql():
+    with pytest.raises(NotImplementedError):
+        upsert(PlaceDetails, SimpleNamespace(dialect=mysql.dialect()))
@@ -0,0 +1,74 @@
+import pytest
+from models.db import db
+from models.catalog import CatalogPlace
+from models.recommendation import Recommendation
+from flask_app import create_app, get_conversation
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Photo Proxy Tests
+# ------------------------------------------
+# The /photos proxy fetches photos from a stub Google Places server with
+# the app's API key, so it must only fetch the photos the app has linked:
+# in a search result, a catalog place or a stored recommendation. The
+# photo cache sweeper must not start before the first photo is asked for.
+# ------------------------------------------
+@pytest.fixture
+def stub():
+    with StubPlaces(latency=0) as stub:
+        yield stub
+
+
+@pytest.fixture
+def app(stub, tmp_path, monkeypatch):
+    monkeypatch.setenv('PHOTO_CACHE_DIR', str(tmp_path / 'photos'))
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}"})
+    with app.app_context():
+        db.create_all()
+        get_conversation().recommend.rating_api.config['google'].update(stub.google_config())
+    yield app
+    app.extensions['photo_cache'].close()
+    app.extensions['recommendation_writer'].close()
+
+
+@pytest.fixture
+def rating_api(app):
+    with app.app_context():
+        return get_conversation().recommend.rating_api
+
+
+def test_sweeper_starts_with_the_first_photo(app):
+    photo_cache = app.extensions['photo_cache']
+    assert photo_cache.thread is None
+    app.test_client().get('/photos/photo-1')
+    assert photo_cache.thread is not None and photo_cache.thread.is_alive()
+
+
+def test_unlinked_reference_is_not_fetched(app, stub):
+    response = app.test_client().get('/photos/photo-1?maxwidth=400')
+    assert response.status_code == 404
+    assert stub.count('/photo') == 0
+
+
+def test_reference_of_a_search_result_is_fetched(app, stub, rating_api):
+    results = [{'name': 'Trattoria', 'photos': [{'photo_reference': 'photo-1'}]}]
+    rating_api.add_photo_urls(results)
+    response = app.test_client().get(results[0]['photo_url'])
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert stub.count('/photo') == 1
+    response.close()
+
+
+def test_references_of_catalog_places_and_recommendations_are_fetched(app, stub, rating_api):
+    with app.app_context():
+        db.session.add(CatalogPlace(place_id='place-2', name='Osteria', photo_reference='photo-2'))
+        db.session.add(Recommendation(user_id='user-1', photo_url=rating_api.get_photo_url('photo-3', 800)))
+        db.session.commit()
+
+    client = app.test_client()
+    for url in ('/photos/photo-2', '/photos/photo-3?maxwidth=200'):
+        response = client.get(url)
+        assert response.status_code == 200, url
+        response.close()
+    assert stub.count('/photo') == 2
+    assert 'photo-2' in rating_api.photo_references and 'photo-3' in rating_api.photo_references
@@ -0,0 +1,256 @@
+import time
+import asyncio
+import pytest
+import requests
+from flask import Flask
+from models.db import db
+from modules.Catalog import Catalog
+from modules.RatingApi import RatingApi
+from modules.Resilience import CircuitBreaker, CircuitOpenError, ResilientTransport
+from modules.Transport import create_transport, TransportError
+from benchmarks.stub_places import StubPlaces
+
+# ------------------------------------------
+# Resilience Tests
+# ------------------------------------------
+# Points the transport of the RatingApi at a stub Google Places server
+# that hangs, fails or is slow now and then, with small timeouts, and
+# checks the read timeout, the circuit breaker, the fallbacks to the
+# expired search cache and the catalog, and hedging.
+# ------------------------------------------
+QUERY = ('in the city', 'italian')
+
+
+def make_transport(timeout=(1.0, 0.2), **resilience):
+    return ResilientTransport(create_transport(requests.Session(), timeout=timeout), **resilience)
+
+
+def make_api(stub: StubPlaces, timeout=(1.0, 0.2), **resilience):
+    api = RatingApi()
+    api.config['google'].update(stub.google_config())
+    api.transport = ResilientTransport(create_transport(api.session, timeout=timeout), **resilience)
+    return api
+
+
+def details_url(stub: StubPlaces, place_id: str = 'place-1'):
+    return f"{stub.base_url}/details/json?place_id={place_id}&key=stub-key"
+
+
+class FailingTransport:
+    """A transport whose requests raise an error that is not a TransportError"""
+    mode = 'live'
+
+    def get(self, endpoint: str, url: str):
+        raise OSError("No space left on device")
+
+    def stats(self):
+        return {"mode": self.mode}
+
+
+@pytest.fixture
+def stub():
+    with StubPlaces(latency=0.01) as stub:
+        yield stub
+
+
+def test_read_timeout_cuts_off_a_hung_upstream(stub):
+    stub.latency = 30
+    api = make_api(stub, breaker_failures=0)
+
+    start = time.perf_counter()
+    with pytest.raises(TransportError):
+        api.transport.get('details', details_url(stub))
+    assert api.search_places(*QUERY) == []
+    assert api.fetch_place_details_uncached('place-2') is None
+    assert time.perf_counter() - start < 3
+
+
+def test_async_read_timeout_cuts_off_a_hung_upstream(stub):
+    stub.latency = 30
+    api = make_api(stub, breaker_failures=0)
+
+    async def main():
+        try:
+            return await api.search_places_async(*QUERY)
+        finally:
+            await api.transport.aclose()
+
+    start = time.perf_counter()
+    assert asyncio.run(main()) == []
+    assert time.perf_counter() - start < 3
+
+
+def test_async_session_of_an_ended_loop_is_closed(stub):
+    transport = create_transport(requests.Session(), timeout=(1.0, 1.0))
+
+    async def send():
+        assert (await transport.get_async('details', details_url(stub))).status_code == 200
+        return await transport.get_async_session()
+
+    # One event loop ends without closing its session, as the next one starts
+    first = asyncio.run(send())
+    assert not first.closed
+
+    async def main():
+        try:
+            return await send()
+        finally:
+            await transport.aclose()
+
+    second = asyncio.run(main())
+    assert first.closed and second.closed and second is not first
+    assert transport.async_sessions == {}
+
+
+def test_breaker_opens_fails_fast_and_closes_after_a_trial(stub):
+    transport = make_transport(breaker_failures=3, breaker_reset=0.2)
+    stub.status = 500
+    for _ in range(3):
+        with pytest.raises(TransportError):
+            transport.get('details', details_url(stub))
+    assert transport.stats()['endpoints']['details']['state'] == 'open'
+
+    # Open: the requests are not sent
+    sent = stub.count('/details/json')
+    for _ in range(10):
+        with pytest.raises(CircuitOpenError):
+            transport.get('details', details_url(stub))
+    assert stub.count('/details/json') == sent
+    assert transport.stats()['rejected'] == 10
+
+    # Half open: one trial request, it closes the breaker
+    stub.status = 200
+    time.sleep(0.25)
+    assert transport.get('details', details_url(stub)).status_code == 200
+    assert stub.count('/details/json') == sent + 1
+    assert transport.stats()['endpoints']['details']['state'] == 'closed'
+
+
+def test_failed_trial_opens_the_breaker_again(stub):
+    transport = make_transport(breaker_failures=1, breaker_reset=0.1)
+    stub.status = 500
+    with pytest.raises(TransportError):
+        transport.get('details', details_url(stub))
+    time.sleep(0.15)
+    with pytest.raises(TransportError):
+        transport.get('details', details_url(stub))  # The trial
+    with pytest.raises(CircuitOpenError):
+        transport.get('details', details_url(stub))
+    assert transport.stats()['endpoints']['details']['opened'] == 2
+
+
+def test_cancelled_trial_lets_the_next_request_through(stub):
+    transport = make_transport(timeout=(1.0, 5.0), breaker_failures=1, breaker_reset=0.1)
+    stub.status = 500
+    with pytest.raises(TransportError):
+        transport.get('details', details_url(stub))
+    stub.status, stub.latency = 200, 2
+    time.sleep(0.15)
+
+    async def main():
+        try:
+            trial = asyncio.ensure_future(transport.get_async('details', details_url(stub)))
+            await asyncio.sleep(0.1)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+
+            stub.latency = 0.01
+            return await transport.get_async('details', details_url(stub, 'place-2'))
+        finally:
+            await transport.aclose()
+
+    assert asyncio.run(main()).status_code == 200
+    assert transport.stats()['endpoints']['details']['state'] == 'closed'
+
+
+def test_other_errors_count_as_failures():
+    transport = ResilientTransport(FailingTransport(), breaker_failures=1, breaker_reset=0.1)
+    with pytest.raises(OSError):
+        transport.get('details', 'http://places/details/json')
+    time.sleep(0.15)
+    with pytest.raises(OSError):
+        transport.get('details', 'http://places/details/json')  # The trial
+    stats = transport.stats()
+    assert stats['failures'] == 2 and stats['endpoints']['details']['state'] == 'open'
+
+
+def test_hung_trial_opens_the_breaker_again():
+    breaker = CircuitBreaker(failures=1, reset_after=0.1)
+    breaker.failure()
+    time.sleep(0.15)
+    assert breaker.allow()  # The trial, it never ends
+    assert not breaker.allow()
+
+    time.sleep(0.15)
+    assert not breaker.allow()
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.15)
+    assert breaker.allow()
+
+
+def test_search_falls_back_to_the_expired_cache(stub):
+    api = make_api(stub, breaker_failures=3, breaker_reset=30)
+    api.search_cache.ttl, api.search_cache.grace = 0.01, 0
+    healthy = api.search_places(*QUERY)
+    assert healthy
+    time.sleep(0.05)  # Let the cache entry expire
+
+    stub.status = 500
+    sent = stub.count('/textsearch/json')
+    assert all(api.search_places(*QUERY) == healthy for _ in range(10))
+    assert stub.count('/textsearch/json') - sent == 3
+    assert api.search_cache.stats()['fallbacks'] == 10
+    assert api.search_places('nearby', 'thai') == []
+
+
+def test_failed_search_falls_back_to_the_catalog(stub, tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    api = make_api(stub, breaker_failures=1)
+    api.search_cache.ttl, api.search_cache.grace = 0, 0  # Nothing to fall back to in the cache
+    catalog = Catalog()
+
+    with app.app_context():
+        db.create_all()
+        catalog.ingest(api.search_places('city', 'italian'), 'city')
+
+        stub.status = 500
+        assert api.search_places('city', 'italian') == []
+        # Not enough fresh matches to skip the search, but a fallback
+        catalog.min_results = stub.results + 1
+        assert catalog.search('italian', 'city') is None
+        places = catalog.search('italian', 'city', fallback=True)
+        assert places and all(place['place_id'].startswith('stub-') for place in places)
+        db.session.remove()
+
+
+@pytest.mark.parametrize('mode', ['sync', 'async'])
+def test_hedged_request_wins_over_a_slow_one(mode):
+    # The 25th response is slow, after 24 fast ones for the p95
+    with StubPlaces(latency=0.01, slow_every=25, slow_latency=1.0) as stub:
+        transport = make_transport(timeout=(1.0, 5.0), hedge=True, hedge_workers=4)
+        urls = [details_url(stub, f'place-{index}') for index in range(25)]
+
+        start = time.perf_counter()
+        if mode == 'sync':
+            for url in urls:
+                assert transport.get('details', url).status_code == 200
+        else:
+            async def main():
+                try:
+                    for url in urls:
+                        assert (await transport.get_async('details', url)).status_code == 200
+                finally:
+                    await transport.aclose()
+
+            asyncio.run(main())
+        elapsed = time.perf_counter() - start
+
+        # A fast response just over the p95 may be hedged as well, that is the
+        # point of hedging at the p95; its second request then takes the slow
+        # turn of the stub, and the first one wins
+        stats = transport.stats()
+        assert 1 <= stats['hedged'] <= 3
+        assert elapsed < 1.0
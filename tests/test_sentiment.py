@@ -0,0 +1,70 @@
+import pytest
+from modules.SentimentAnalyzer import SentimentAnalyzer, classify, HAPPY_THRESHOLD, SAD_THRESHOLD
+from benchmarks.corpus import messages
+
+textblob = pytest.importorskip('textblob')
+
+# ------------------------------------------
+# Sentiment Analyzer Tests
+# ------------------------------------------
+# The SentimentAnalyzer must classify messages exactly like TextBlob with
+# the happy/neutral/sad thresholds, and messages scored by the lexicon
+# must get TextBlob's polarity. Scores close to a threshold go to
+# TextBlob, the messages at the thresholds check that fallback.
+# ------------------------------------------
+# Lexicon scores at the happy (0.3) and sad (-0.2) thresholds
+AT_THRESHOLDS = [
+    'colorful', 'A colorful evening', 'compelling dinner', 'Hi, economical food',
+    'crying', 'I feel childish', 'choppy week', 'Hello, dead day',
+]
+# Lexicon scores near the thresholds, and clear ones
+NEAR_THRESHOLDS = ['busy and nice', 'Busy, tired evening', 'dead tired', 'fine', 'busy evening', 'good', 'sad']
+
+
+def textblob_polarity(text: str) -> float:
+    return textblob.TextBlob(text).sentiment.polarity
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return SentimentAnalyzer()
+
+
+def test_corpus_agrees_with_textblob(analyzer):
+    lexicon = 0
+    for text in messages(5000):
+        expected = textblob_polarity(text)
+        polarity = analyzer.lexicon_polarity(text)
+        if polarity is not None:
+            assert polarity == expected, text
+            lexicon += 1
+        assert analyzer.analyze_uncached(text) == classify(expected), text
+    assert lexicon > 0  # The lexicon path was taken
+
+
+@pytest.mark.parametrize('text', AT_THRESHOLDS)
+def test_threshold_scores_fall_back_to_textblob(text):
+    analyzer = SentimentAnalyzer()
+    polarity = analyzer.lexicon_polarity(text)
+    assert polarity in (HAPPY_THRESHOLD, SAD_THRESHOLD)
+    assert analyzer.near_threshold(polarity)
+
+    assert analyzer.analyze_uncached(text) == classify(textblob_polarity(text)) == 'neutral'
+    assert analyzer.counters == {"lexicon": 0, "textblob": 1}
+
+
+@pytest.mark.parametrize('text', NEAR_THRESHOLDS)
+def test_near_threshold_scores_agree_with_textblob(text):
+    analyzer = SentimentAnalyzer()
+    polarity = analyzer.lexicon_polarity(text)
+    assert polarity == pytest.approx(textblob_polarity(text))
+    assert analyzer.analyze_uncached(text) == classify(textblob_polarity(text))
+    assert analyzer.counters["textblob"] == int(analyzer.near_threshold(polarity))
+
+
+@pytest.mark.parametrize('polarity, expected', [
+    (HAPPY_THRESHOLD, 'neutral'), (HAPPY_THRESHOLD + 1e-9, 'happy'),
+    (SAD_THRESHOLD, 'neutral'), (SAD_THRESHOLD - 1e-9, 'sad'), (0.0, 'neutral'),
+])
+def test_classify_thresholds(polarity, expected):
+    assert classify(polarity) == expected
@@ -0,0 +1,59 @@
+import pytest
+from modules.Response import Response
+from benchmarks.corpus import CORPUS, legacy_check_responses, legacy_conversation, conversation, transcripts
+
+# ------------------------------------------
+# Slot Extractor Tests
+# ------------------------------------------
+# Response.check_response, on top of the compiled SlotExtractor, must
+# fill exactly the same user info as the previous per-pattern
+# check_responses loop, on single utterances and on multi-turn
+# transcripts built from them.
+# ------------------------------------------
+@pytest.fixture(scope='module')
+def patterns():
+    return Response().user_info_patterns
+
+
+@pytest.fixture
+def response():
+    return Response()
+
+
+@pytest.mark.parametrize('text', CORPUS)
+def test_utterance_matches_legacy(patterns, response, text):
+    expected = legacy_check_responses(patterns, {"greet": text}, {})
+    actual = conversation(response, [("greet", text)])
+    assert list(actual.items()) == list(expected.items())
+
+
+def test_transcripts_match_legacy(patterns, response):
+    for turns in transcripts(2000):
+        expected = legacy_conversation(patterns, turns)
+        actual = conversation(response, turns)
+        assert list(actual.items()) == list(expected.items()), turns
+
+
+def test_known_user_info_is_kept(patterns, response):
+    turns = [("greet", "table for 4 people"), ("ask_cuisine", "italian")]
+    user_info = {"ask_guests": ["2"]}
+    assert conversation(response, turns, user_info) == legacy_conversation(patterns, turns, user_info)
+
+
+def test_answer_again_fills_an_essential_slot(patterns, response):
+    # The cuisine is asked twice, only the second answer names one
+    turns = [
+        ("greet", "Hi, a romantic dinner please"),
+        ("ask_occasion", "a date night"),
+        ("ask_cuisine", "hmm, i am open to anything"),
+        ("ask_cuisine", "thai please"),
+        ("ask_guests", "table for 4 people"),
+        ("ask_location", "close by"),
+    ]
+    for turn in range(1, len(turns) + 1):
+        assert conversation(response, turns[:turn]) == legacy_conversation(patterns, turns[:turn])
+
+    user_info = conversation(response, turns)
+    assert user_info["ask_cuisine"] == ["thai"]
+    assert user_info["ask_occasion"] == ["romantic", "dinner"]
+    assert list(response.store.get('user', 'slots')) == ["greet", "ask_occasion", "ask_cuisine", "ask_guests", "ask_location"]
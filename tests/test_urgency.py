@@ -0,0 +1,48 @@
+import pytest
+from modules.Sentiment import Sentiment
+
+# ------------------------------------------
+# Urgency Matcher Tests
+# ------------------------------------------
+# The UrgencyMatcher must find the urgency signals of chat messages and
+# of long pasted ones alike, in order of first appearance, with a match
+# also counting for the phrases it starts with.
+# ------------------------------------------
+PASTED = (
+    "We would like a table for dinner with friends tonight in the city center, somewhere nice "
+    "and quiet with vegan options near the station, and a view of the river. "
+)
+
+
+@pytest.fixture(scope='module')
+def matcher():
+    return Sentiment().urgency_matcher
+
+
+@pytest.mark.parametrize('text', [
+    PASTED + "We need it ASAP",
+    PASTED * 20 + "Within the next hour please",
+    PASTED + "Anything is fine!!",
+    PASTED + "Anything? Is that fine?? Yes!",
+])
+def test_signal_at_the_end_of_a_long_message(matcher, text):
+    assert len(text) > 128
+    assert matcher.is_urgent(text)
+    assert matcher.signals(text)['urgent']
+
+
+@pytest.mark.parametrize('text', [PASTED, PASTED * 20 + "Thank you.", PASTED + "Thanks! Is it open?"])
+def test_long_message_without_signals(matcher, text):
+    assert not matcher.is_urgent(text)
+    assert not matcher.signals(text)['urgent']
+
+
+def test_signals_in_order_of_first_appearance(matcher):
+    signals = matcher.signals(PASTED * 3 + "Quickly, 15 minutes, we are busy!! Hurry?? quick!")
+    assert signals == {
+        'keywords': ['quick', 'quickly', 'busy', 'hurry'],
+        'time_patterns': ['15 minutes'],
+        'exclamation': True,
+        'repeated_punctuation': ['!!', '??'],
+        'urgent': True,
+    }